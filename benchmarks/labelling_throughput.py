@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# labelling_throughput.py
+"""
+Throughput benchmark of the DFT labelling path without a DFT licence.
+
+The candidates of an ML/MD trajectory are labelled through
+``sparc.src.dft_labelling.label_candidates`` with the mock ``vasp`` or
+``cp2k_shell`` of ``mock_dft``, which sleep for a simulated DFT run time
+(``--delay``) and compute energies and forces with a cheap ASE calculator.
+Every mode runs in a fresh working directory and reports:
+
+- candidates per hour, end to end (inputs, DFT, parsing, dataset writes)
+- DFT busy time: sum of the run times recorded by the mock executables
+- scheduler efficiency: busy time / (concurrent jobs x wall time)
+- overhead per candidate: time a job slot was not running DFT, per candidate
+- disk use of the working directory
+
+Modes: ``serial``, ``workers:N`` (process pool), ``local:N`` (local job
+backend, VASP only), ``session`` and ``session:N`` (persistent
+``cp2k_shell``, CP2K only).
+
+Example::
+
+    python benchmarks/labelling_throughput.py --code vasp --candidates 64 \\
+        --delay 0.5 --modes serial,workers:4,local:4 --json vasp.json
+"""
+
+################################################################
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+################################################################
+# Third party import
+from ase.io import read, write
+
+BENCH_DIR = Path(__file__).resolve().parent
+MOCK_DIR = BENCH_DIR / "mock_dft"
+REPO_DIR = BENCH_DIR.parent
+DEFAULT_TRAJ = REPO_DIR / "tests" / "data" / "mlp" / "AseMD.traj"
+CP2K_TEMPLATE = REPO_DIR / "tests" / "data" / "cp2k_tmp" / "cp2k_template.inp"
+
+sys.path.insert(0, str(REPO_DIR))
+from sparc.src.dft_labelling import label_candidates  # noqa: E402
+
+INCAR = """SYSTEM = mock
+ENCUT  = 300
+ISMEAR = 0
+SIGMA  = 0.05
+EDIFF  = 1E-05
+LWAVE  = .TRUE.
+LCHARG = .TRUE.
+"""
+
+
+# ===================================================================================================#
+def write_candidates(trajfile, n, out_dir, rattle=0.02, seed=0):
+    """
+    Write ``n`` candidate POSCAR files (``out_dir/NNNN/POSCAR``).
+
+    The frames of ``trajfile`` are used in turn and rattled so that no two
+    candidates are identical.
+
+    Returns:
+        list: POSCAR file names
+    """
+    frames = read(trajfile, index=":")
+    rng = np.random.default_rng(seed)
+    files = []
+    for serial in range(1, n + 1):
+        atoms = frames[(serial - 1) % len(frames)].copy()
+        atoms.positions += rng.normal(scale=rattle, size=atoms.positions.shape)
+        poscar = Path(out_dir, f"{serial:04d}", "POSCAR")
+        poscar.parent.mkdir(parents=True, exist_ok=True)
+        write(poscar, atoms, format="vasp")
+        files.append(str(poscar))
+    return files
+
+
+def fake_potcars(pp_dir, symbols, pp="PBE"):
+    """Placeholder POTCAR files, enough for ASE to write the VASP input."""
+    for symbol in symbols:
+        potcar = Path(pp_dir, f"potpaw_{pp}", symbol, "POTCAR")
+        potcar.parent.mkdir(parents=True, exist_ok=True)
+        potcar.write_text(f"  PAW_{pp} {symbol} (mock)\n")
+
+
+def make_config(code, mode, work_dir):
+    """
+    SPARC configuration of a benchmark mode.
+
+    Returns:
+        tuple: (config, concurrent jobs)
+    """
+    name, _, n = mode.partition(":")
+    concurrency = int(n or 1)
+    if code == "vasp":
+        incar = Path(work_dir, "INCAR")
+        incar.write_text(INCAR)
+        dft = {
+            "name": "VASP",
+            "exe_command": f"{sys.executable} {MOCK_DIR / 'vasp'}",
+            "prec": "Normal",
+            "kgamma": True,
+            "incar_file": str(incar),
+            "directory": str(Path(work_dir, "vasp")),
+        }
+    else:
+        shutil.copy(CP2K_TEMPLATE, Path(work_dir, "cp2k_template.inp"))
+        dft = {
+            "name": "CP2K",
+            "exe_command": f"{sys.executable} {MOCK_DIR / 'cp2k_shell'}",
+        }
+
+    labelling = {"workers": concurrency, "cores_per_job": 1}
+    if name == "local":
+        if code != "vasp":
+            raise ValueError("The local job backend supports VASP only")
+        labelling = {"backend": "local", "max_jobs": concurrency, "poll_interval": 0.05}
+    elif name == "session":
+        if code != "cp2k":
+            raise ValueError("Sessions are a CP2K mode")
+        labelling["cp2k_session"] = True
+    elif name not in ("serial", "workers"):
+        raise ValueError(f"Unknown mode: {mode}")
+    return {"dft_calculator": dft, "labelling": labelling}, concurrency
+
+
+def _disk_usage(path):
+    return sum(f.stat().st_size for f in Path(path).rglob("*") if f.is_file())
+
+
+def run_mode(code, mode, n, delay, trajfile, work_root, calculator="lj"):
+    """
+    Label ``n`` candidates in one mode.
+
+    Returns:
+        dict: Metrics of the run
+    """
+    work_dir = Path(work_root, f"{code}_{mode.replace(':', '_')}").resolve()
+    shutil.rmtree(work_dir, ignore_errors=True)
+    work_dir.mkdir(parents=True)
+    files = write_candidates(trajfile, n, work_dir / "dft_candidates")
+    config, concurrency = make_config(code, mode, work_dir)
+
+    symbols = sorted(set(read(files[0], format="vasp").get_chemical_symbols()))
+    fake_potcars(work_dir / "pp", symbols)
+    mock_log = work_dir / "mock_dft.log"
+    env = {
+        "VASP_PP_PATH": str(work_dir / "pp"),
+        "MOCK_DFT_DELAY": str(delay),
+        "MOCK_DFT_CALCULATOR": calculator,
+        "MOCK_DFT_LOG": str(mock_log),
+    }
+    saved_env = {key: os.environ.get(key) for key in env}
+    os.environ.update(env)
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        start = time.perf_counter()
+        n_labelled = label_candidates(
+            config,
+            files,
+            dir_name=work_dir / "iter_000001" / "00.dft",
+            log_filename="labelling.log",
+            trajfile="AseMD.traj",
+        )
+        wall = time.perf_counter() - start
+    finally:
+        os.chdir(cwd)
+        for key, value in saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+    runs = [json.loads(line) for line in mock_log.read_text().splitlines()]
+    busy = sum(run["end"] - run["start"] for run in runs)
+    return {
+        "code": code,
+        "mode": mode,
+        "candidates": n,
+        "labelled": n_labelled,
+        "concurrency": concurrency,
+        "delay_s": delay,
+        "wall_s": wall,
+        "candidates_per_hour": 3600 * n_labelled / wall,
+        "dft_busy_s": busy,
+        "efficiency": busy / (concurrency * wall),
+        "overhead_per_candidate_s": (concurrency * wall - busy) / n,
+        "disk_mb": _disk_usage(work_dir) / 1e6,
+    }
+
+
+def format_table(rows):
+    """Plain-text table of the benchmark results."""
+    header = (
+        f"{'code':>5s} {'mode':>10s} {'done':>6s} {'wall[s]':>9s} {'cand/h':>10s} "
+        f"{'busy[s]':>9s} {'eff.':>6s} {'ovh/cand[s]':>12s} {'disk[MB]':>9s}"
+    )
+    lines = [header, "-" * len(header)]
+    for r in rows:
+        lines.append(
+            f"{r['code']:>5s} {r['mode']:>10s} {r['labelled']:>3d}/{r['candidates']:<2d} "
+            f"{r['wall_s']:9.2f} {r['candidates_per_hour']:10.0f} {r['dft_busy_s']:9.2f} "
+            f"{r['efficiency']:6.2f} {r['overhead_per_candidate_s']:12.3f} "
+            f"{r['disk_mb']:9.2f}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--code", choices=["vasp", "cp2k"], default="vasp")
+    parser.add_argument("--candidates", type=int, default=32)
+    parser.add_argument(
+        "--delay", type=float, default=0.5, help="Simulated DFT time (s)"
+    )
+    parser.add_argument("--modes", default="serial,workers:4", help="Comma-separated")
+    parser.add_argument("--calculator", choices=["lj", "emt"], default="lj")
+    parser.add_argument("--traj", default=str(DEFAULT_TRAJ), help="Candidate source")
+    parser.add_argument("--workdir", default=None, help="Kept after the run if given")
+    parser.add_argument("--json", default=None, help="Write the results to this file")
+    args = parser.parse_args(argv)
+
+    work_root = args.workdir or tempfile.mkdtemp(prefix="sparc_bench_")
+    rows = []
+    try:
+        for mode in args.modes.split(","):
+            rows.append(
+                run_mode(
+                    args.code,
+                    mode.strip(),
+                    args.candidates,
+                    args.delay,
+                    args.traj,
+                    work_root,
+                    args.calculator,
+                )
+            )
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(work_root, ignore_errors=True)
+
+    print(format_table(rows))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+    return rows
+
+
+if __name__ == "__main__":
+    main()
+
+
+# ===================================================================================================#
+#                                     END OF FILE
+# ===================================================================================================#
@@ -0,0 +1,83 @@
+# mock_common.py
+"""
+Shared part of the mock DFT executables.
+
+The mock ``vasp`` and ``cp2k_shell`` compute energies and forces with a cheap
+ASE calculator and sleep for a simulated DFT run time. They are configured
+through environment variables so that they can replace the real codes in any
+``exe_command``:
+
+- ``MOCK_DFT_CALCULATOR``: ``lj`` (default, any element) or ``emt``
+- ``MOCK_DFT_DELAY``: simulated run time of a single point in seconds (default: 0)
+- ``MOCK_DFT_UNCONVERGED``: probability that the SCF is reported unconverged (default: 0)
+- ``MOCK_DFT_LOG``: file receiving one JSON line per single point with its
+  start and end time, used by the benchmarks to measure the DFT busy time
+"""
+
+################################################################
+import json
+import os
+import random
+import time
+
+
+# ===================================================================================================#
+def calculator():
+    """Cheap ASE calculator selected by ``MOCK_DFT_CALCULATOR``."""
+    name = os.environ.get("MOCK_DFT_CALCULATOR", "lj").lower()
+    if name == "emt":
+        from ase.calculators.emt import EMT
+
+        return EMT()
+    if name == "lj":
+        from ase.calculators.lj import LennardJones
+
+        return LennardJones(sigma=1.5, epsilon=0.01, rc=6.0)
+    raise ValueError(f"Unknown mock calculator: {name}")
+
+
+def single_point(atoms):
+    """
+    Energy, forces and stress of ``atoms`` after the simulated run time.
+
+    Returns:
+        dict: ``energy`` (eV), ``forces`` (eV/Å), ``stress`` (Voigt, eV/Å^3),
+        ``converged`` and ``elapsed`` (s)
+    """
+    start = time.time()
+    atoms = atoms.copy()
+    atoms.calc = calculator()
+    results = {
+        "energy": atoms.get_potential_energy(),
+        "forces": atoms.get_forces(),
+        "stress": atoms.get_stress() if atoms.pbc.all() else None,
+    }
+    delay = float(os.environ.get("MOCK_DFT_DELAY", "0"))
+    if delay > 0:
+        time.sleep(delay)
+    results["converged"] = random.random() >= float(
+        os.environ.get("MOCK_DFT_UNCONVERGED", "0")
+    )
+    end = time.time()
+    results["elapsed"] = end - start
+
+    log = os.environ.get("MOCK_DFT_LOG")
+    if log:
+        with open(log, "a") as f:
+            f.write(
+                json.dumps(
+                    {
+                        "pid": os.getpid(),
+                        "natoms": len(atoms),
+                        "start": start,
+                        "end": end,
+                    }
+                )
+                + "\n"
+            )
+    return results
+
+
+# ===================================================================================================#
+#                                     END OF FILE
+# ===================================================================================================#
@@ -28,17 +28,23 @@ import ase.units
 # Third-party imports
 from ase.io import read
 
-from sparc.src.active_learning import QueryByCommittee
+from sparc.src.active_learning import (
+    QueryByCommittee,
+    QueryOnTheFly,
+    driving_model,
+    setup_committee_monitor,
+)
 from sparc.src.ase_md import (
-    CalculateDFTEnergy,
     ExecuteAbInitioDynamics,
     ExecuteMlpDynamics,
     LangevinNVT,
     NoseNVT,
 )
 from sparc.src.calculator import dft_calculator
-from sparc.src.data_processing import get_data
+from sparc.src.data_processing import build_dataset
 from sparc.src.deepmd import deepmd_training, setup_DeepPotential
+from sparc.src.dft_cache import CachedCalculator, dft_cache
+from sparc.src.dft_labelling import label_candidates
 from sparc.src.plumed_wrapper import modify_forces, umbrella
 from sparc.src.utils.banner import banner
 from sparc.src.utils.logger import SparcLog, setup_logger
@@ -48,7 +54,6 @@ from sparc.src.utils.logger import SparcLog, setup_logger
 # Local imports
 from sparc.src.utils.read_input import load_config
 from sparc.src.utils.utils import (
-    combine_trajectories,
     create_iteration_dirs,
     load_progress,
     remove_backup_files,
@@ -133,7 +138,12 @@ def main():
     # --------------------------------------------------------------------------------------#
     if dftmd_is:
         # Set up DFT calculator
-        dft_calc = dft_calculator(config, True)
+        dft_calc = aimd_calc = dft_calculator(
+            config, True, interactive=config["md_simulation"]["interactive"]
+        )
+        cache = dft_cache(config)
+        if cache is not None:
+            dft_calc = CachedCalculator(dft_calc, cache)
         SparcLog(
             "========================================================================"
         )
@@ -200,18 +210,23 @@ def main():
             dir_name=iter_structure["dft_dir"],
             name=thermostat,
         )
+        # Stop a long-lived DFT process (interactive VASP, cp2k_shell)
+        if hasattr(aimd_calc, "close"):
+            aimd_calc.close()
 
     # --------------------------------------------------------------------------------------#
     # SECTION 2: DeepMD Training
     # --------------------------------------------------------------------------------------#
     datadir = os.path.join(parent_dir, config["deepmd_setup"]["data_dir"])
     if training_is:
-        # Process AIMD trajectory for ML model training using `dpdata`
-        get_data(
-            ase_traj=iter_structure["dft_dir"] / config["output"]["aimdtraj_file"],
+        # Convert the AIMD trajectory into the DeePMD dataset of the campaign
+        build_dataset(
+            trajfilename=config["output"]["aimdtraj_file"],
+            current_iter=iter_structure["iter_num"],
             dir_name=datadir,
             skip_min=config["deepmd_setup"]["skip_min"],
             skip_max=config["deepmd_setup"]["skip_max"],
+            prune_tol=config["deepmd_setup"]["prune_tol"],
         )
 
         # Train DeepMD models
@@ -222,6 +237,8 @@ def main():
             input_file=config["deepmd_setup"]["input_file"],
             datadir=datadir,
             atom_types=atom_types,
+            parallel=config["deepmd_setup"]["parallel_training"],
+            cores_per_model=config["deepmd_setup"]["cores_per_model"],
         )
 
     # --------------------------------------------------------------------------------------#
@@ -240,6 +257,10 @@ def main():
         dp_path = iter_structure["train_dir"]
         dp_model = "training_1/frozen_model_1.pb"  # Default model to run ML/MD simulation [optional]
         dp_system = original_system
+        committee_monitor = setup_committee_monitor(
+            config, dp_path, iter_structure["dpmd_dir"]
+        )
+        dp_path, dp_model = driving_model(committee_monitor, dp_path, dp_model)
         # Setup DeepMD calculator and run multiple MD simulations if requested
         for i in range(n_sample):
             dp_atoms, dp_calc = setup_DeepPotential(
@@ -317,6 +338,10 @@ def main():
             else:
                 dp_atoms.calc = dp_calc
 
+            if committee_monitor is not None:
+                committee_monitor.set_reference(
+                    dp_calc, os.path.join(dp_path, dp_model)
+                )
             ExecuteMlpDynamics(
                 system=dp_atoms,
                 dyn=dyn_dp,
@@ -328,18 +353,32 @@ def main():
                 distance_metrics=config["distance_metrics"],
                 name=thermostat,
                 epot_threshold=config["deepmd_setup"]["epot_threshold"],
+                committee_monitor=committee_monitor,
             )
         if config["active_learning"]:
-            # Check for structures requiring labeling (Query-by-Committee [QbC])
-            candidate_found_is, labelled_files, latest_models = QueryByCommittee(
-                trajfile=iter_structure["dpmd_dir"] / config["output"]["dptraj_file"],
-                model_path=iter_structure["train_dir"],
-                num_models=config["deepmd_setup"]["num_models"],
-                min_lim=config["model_dev"]["f_min_dev"],
-                max_lim=config["model_dev"]["f_max_dev"],
-                dpmd_data_path=iter_structure["dpmd_dir"],
-                iteration=0,
-            )
+            if committee_monitor is not None:
+                # Deviations were already evaluated during ML/MD (on-the-fly QbC)
+                candidate_found_is, labelled_files, latest_models = QueryOnTheFly(
+                    monitor=committee_monitor,
+                    trajfile=iter_structure["dpmd_dir"]
+                    / config["output"]["dptraj_file"],
+                    dpmd_data_path=iter_structure["dpmd_dir"],
+                    iteration=0,
+                    model_dev=config["model_dev"],
+                )
+            else:
+                # Check for structures requiring labeling (Query-by-Committee [QbC])
+                candidate_found_is, labelled_files, latest_models = QueryByCommittee(
+                    trajfile=iter_structure["dpmd_dir"]
+                    / config["output"]["dptraj_file"],
+                    model_path=iter_structure["train_dir"],
+                    num_models=config["deepmd_setup"]["num_models"],
+                    min_lim=config["model_dev"]["f_min_dev"],
+                    max_lim=config["model_dev"]["f_max_dev"],
+                    dpmd_data_path=iter_structure["dpmd_dir"],
+                    iteration=0,
+                    model_dev=config["model_dev"],
+                )
             candidates = len(labelled_files)  # store total candidates for restart
             save_progress(
                 {
@@ -403,61 +442,49 @@ def main():
                 iter_num=iter
             )  # Create iteration directory structure
             # Process candidates for labeling
-            for idx, files in enumerate(labelled_files, start=i_start):
-                if not os.path.exists(files):
-                    SparcLog(f"Warning: Candidate file {files} not found, skipping...")
-                    continue
-
-                # Run DFT calculations (for now // relabelling only supports POSCAR format)
-                poscar_ = read(files, format="vasp")
-                poscar_.calc = dft_calculator(config, False)
-
-                header = True if idx == 1 else False
-                if header:
-                    SparcLog(
-                        "========================================================================"
-                    )
-                    SparcLog(
-                        "!{}!".format(
-                            f"[Iteration {iter}] Computing Energy and Forces for Candidates".center(
-                                70
-                            )
+            if i_start == 1 and labelled_files:
+                SparcLog(
+                    "========================================================================"
+                )
+                SparcLog(
+                    "!{}!".format(
+                        f"[Iteration {iter}] Computing Energy and Forces for Candidates".center(
+                            70
                         )
                     )
-                    SparcLog(
-                        "========================================================================"
-                    )
-                CalculateDFTEnergy(
-                    idx=idx,
-                    header=(idx == 1),
-                    system=poscar_,
-                    timestep=config["md_simulation"]["timestep_fs"] * ase.units.fs,
-                    log_filename=f"Iter{iter}_{config['output']['log_file']}",
-                    trajfile=config["output"]["aimdtraj_file"],
-                    dir_name=iter_structure["dft_dir"],
                 )
-                save_progress(
+                SparcLog(
+                    "========================================================================"
+                )
+            # Run DFT calculations (for now // relabelling only supports POSCAR format)
+            label_candidates(
+                config,
+                labelled_files,
+                dir_name=iter_structure["dft_dir"],
+                log_filename=f"Iter{iter}_{config['output']['log_file']}",
+                trajfile=config["output"]["aimdtraj_file"],
+                start=i_start,
+                # "idx" is the first candidate still to label after a restart
+                progress=lambda idx: save_progress(
                     {
                         "state": str(iter_structure["dft_dir"]),
                         "iteration": iter,
                         "candidate": candidates,
-                        "idx": idx,
+                        "idx": idx + 1,
                     }
-                )
+                ),
+            )
             # Re-train DeepMD models
             SparcLog(
                 "========================================================================"
             )
             SparcLog("Processing Data for DeepMD Training\n")
-            combined_traj = combine_trajectories(
+            # Only the frames labelled since the last build are converted
+            build_dataset(
                 trajfilename=config["output"]["aimdtraj_file"],
                 current_iter=iter_structure["iter_num"],
-            )
-            get_data(
-                ase_traj=combined_traj,
-                dir_name=config["deepmd_setup"]["data_dir"],
-                skip_min=0,
-                skip_max=None,
+                dir_name=datadir,
+                prune_tol=config["deepmd_setup"]["prune_tol"],
             )
             SparcLog("!{}!".format("Starting MLIP Training".center(70)))
             # SparcLog("Starting MLIP Training")
@@ -468,6 +495,8 @@ def main():
                 input_file=config["deepmd_setup"]["input_file"],
                 datadir=datadir,
                 atom_types=atom_types,
+                parallel=config["deepmd_setup"]["parallel_training"],
+                cores_per_model=config["deepmd_setup"]["cores_per_model"],
             )
 
             SparcLog("{}".format("Setting up DeepPotential Calculator".center(72)))
@@ -484,10 +513,17 @@ def main():
             SparcLog(
                 "========================================================================"
             )
+            committee_monitor = setup_committee_monitor(
+                config, iter_structure["train_dir"], iter_structure["dpmd_dir"]
+            )
+            # With on-the-fly QbC the first committee model drives the MD
+            dp_path, dp_model = driving_model(
+                committee_monitor, parent_dir, latest_models[0]
+            )
             for i in range(n_sample):
                 dp_system = original_system
                 dp_atoms, dp_calc = setup_DeepPotential(
-                    atoms=dp_system, model_path=parent_dir, model_name=latest_models[0]
+                    atoms=dp_system, model_path=dp_path, model_name=dp_model
                 )
                 SparcLog("\n{}".format("Initializing DeepMD Simulation".center(72)))
                 if thermostat not in thermostat_func:
@@ -532,8 +568,8 @@ def main():
                     umbrella(
                         config=config,
                         us_dir=iter_structure,
-                        dp_path=parent_dir,
-                        dp_model=latest_models[0],
+                        dp_path=dp_path,
+                        dp_model=dp_model,
                     )
                     break
                 if dp_plumed_is and not umbrella_enabled:
@@ -562,6 +598,10 @@ def main():
                 else:
                     dp_atoms.calc = dp_calc
 
+                if committee_monitor is not None:
+                    committee_monitor.set_reference(
+                        dp_calc, os.path.join(dp_path, dp_model)
+                    )
                 ExecuteMlpDynamics(
                     system=dp_atoms,
                     dyn=dyn_dp,
@@ -573,18 +613,31 @@ def main():
                     distance_metrics=config["distance_metrics"],
                     name=thermostat,
                     epot_threshold=config["deepmd_setup"]["epot_threshold"],
+                    committee_monitor=committee_monitor,
                 )
 
             # Check for new candidates
-            candidate_found_is, labelled_files, latest_models = QueryByCommittee(
-                trajfile=iter_structure["dpmd_dir"] / config["output"]["dptraj_file"],
-                model_path=iter_structure["train_dir"],
-                num_models=config["deepmd_setup"]["num_models"],
-                min_lim=config["model_dev"]["f_min_dev"],
-                max_lim=config["model_dev"]["f_max_dev"],
-                dpmd_data_path=iter_structure["dpmd_dir"],
-                iteration=iter,
-            )
+            if committee_monitor is not None:
+                candidate_found_is, labelled_files, latest_models = QueryOnTheFly(
+                    monitor=committee_monitor,
+                    trajfile=iter_structure["dpmd_dir"]
+                    / config["output"]["dptraj_file"],
+                    dpmd_data_path=iter_structure["dpmd_dir"],
+                    iteration=iter,
+                    model_dev=config["model_dev"],
+                )
+            else:
+                candidate_found_is, labelled_files, latest_models = QueryByCommittee(
+                    trajfile=iter_structure["dpmd_dir"]
+                    / config["output"]["dptraj_file"],
+                    model_path=iter_structure["train_dir"],
+                    num_models=config["deepmd_setup"]["num_models"],
+                    min_lim=config["model_dev"]["f_min_dev"],
+                    max_lim=config["model_dev"]["f_max_dev"],
+                    dpmd_data_path=iter_structure["dpmd_dir"],
+                    iteration=iter,
+                    model_dev=config["model_dev"],
+                )
             candidates = len(labelled_files)
             if not candidate_found_is:
                 SparcLog(
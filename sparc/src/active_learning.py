@@ -3,11 +3,27 @@
 import os
 import subprocess
 
+import numpy as np
+
 ################################################################
 # Third party import
-import dpdata
+from ase.io import read
 
+from sparc.src.carving import ClusterCarver
+from sparc.src.data_processing import write_deepmd_npy
+from sparc.src.fingerprint_index import FingerprintIndex
 from sparc.src.labelling import labelling
+from sparc.src.model_deviation import (
+    DEVI_NAMES,
+    CommitteeDeviation,
+    CommitteeMonitor,
+    DeviationCache,
+    adaptive_thresholds,
+    read_model_devi,
+    write_model_devi,
+)
+from sparc.src.prescreen import PreScreen
+from sparc.src.selection import CandidateBacklog
 
 ################################################################
 # Local Import
@@ -17,7 +33,14 @@ from sparc.src.utils.logger import SparcLog
 
 
 def QueryByCommittee(
-    trajfile, model_path, num_models, max_lim, min_lim, dpmd_data_path, iteration=0
+    trajfile,
+    model_path,
+    num_models,
+    max_lim,
+    min_lim,
+    dpmd_data_path,
+    iteration=0,
+    model_dev=None,
 ):
     """
     This code finds the maximum deviation in forces averaged over
@@ -31,12 +54,25 @@ def QueryByCommittee(
         max_lim (float): Maximum force deviation threshold
         min_lim (float): Minimum force deviation threshold
         iteration (int): Current iteration number
+        model_dev (dict): ``model_dev`` section of the input configuration
+            - engine: "subprocess" (``dp model-devi``) or "inprocess"
+            - batch_size: frames evaluated at once by the in-process engine
+            - deviation_cache: cache directory of the in-process engine
+            - streaming: single-pass candidate extraction in ``labelling``
+            - fps_budget, descriptor: diversity selection in ``labelling``
+            - fingerprint_tol, fingerprint_dir: skip already labelled structures
+            - max_candidates, priority, priority_bins, backlog_file: DFT budget
+              per iteration with a persistent queue of the remaining candidates
+            - adaptive, adaptive_target, adaptive_quantiles, f_min_floor:
+              per-iteration thresholds from the deviation distribution
+            - carving: ``ClusterCarver`` settings to label local environments
+              of the uncertain atoms of large candidates
+            - prescreen: ``PreScreen`` settings to reject unphysical candidates
     """
-
-    # Load the ASE trajectory and convert it to DeePMD format
-    dataset = dpdata.LabeledSystem(trajfile, fmt="ase/traj")
-    # 
-    dataset.to_deepmd_npy(str(dpmd_data_path))
+    model_dev = model_dev or {}
+    engine = model_dev.get("engine", "subprocess")
+    if engine not in ("subprocess", "inprocess"):
+        raise ValueError(f"Unknown model deviation engine: {engine}")
 
     SparcLog("========================================================================")
     SparcLog("{}".format(f"Model Path: {model_path}".center(72)))
@@ -44,6 +80,271 @@ def QueryByCommittee(
 
     outfile = f"{dpmd_data_path!s}/model_dev_{iteration}.out"
 
+    model_names = find_committee_models(model_path, num_models)
+
+    SparcLog("========================================================================")
+    SparcLog("{}".format("Using the following models:".center(72)))
+    SparcLog("========================================================================")
+    for model in model_names:
+        SparcLog(f"{model.center(72)}")
+    SparcLog("========================================================================")
+
+    cache = None
+    if model_dev.get("deviation_cache"):
+        if engine == "inprocess":
+            cache = DeviationCache(model_dev["deviation_cache"], model_names)
+        else:
+            SparcLog(
+                "deviation_cache requires the inprocess engine, evaluating all frames",
+                level="WARNING",
+            )
+
+    if engine == "inprocess":
+        CommitteeDeviation(
+            trajfile=trajfile,
+            model_names=model_names,
+            outfile=outfile,
+            batch_size=model_dev.get("batch_size", 1000),
+            cache=cache,
+        )
+        SparcLog("{}".format(f"Results saved in: {outfile}".center(72)))
+    else:
+        _run_dp_model_devi(trajfile, model_names, dpmd_data_path, outfile)
+
+    candidate_found, labelled_files = _select_candidates(
+        trajfile,
+        outfile,
+        min_lim,
+        max_lim,
+        dpmd_data_path,
+        iteration,
+        model_dev,
+        model_names,
+    )
+    return candidate_found, labelled_files, model_names
+
+
+def _select_candidates(
+    trajfile,
+    outfile,
+    min_lim,
+    max_lim,
+    dpmd_data_path,
+    iteration,
+    model_dev,
+    model_names,
+):
+    """
+    Select the DFT candidates of an iteration from its deviation table.
+
+    The step column of ``outfile`` holds frame indices into ``trajfile``. The
+    window, fingerprint filter, budget, carving and pre-screen settings of
+    ``model_dev`` are applied as described in ``QueryByCommittee``.
+
+    Returns:
+        tuple: (candidate_found, labelled_files)
+    """
+    # Choose the deviation window from the observed distribution
+    thresholds = "fixed"
+    if model_dev.get("adaptive"):
+        max_devi_f = read_model_devi(outfile)[:, DEVI_NAMES.index("max_devi_f")]
+        target = model_dev.get("adaptive_target", 50)
+        quantiles = model_dev.get("adaptive_quantiles", [0.0, 1.0])
+        min_lim, max_lim = adaptive_thresholds(
+            max_devi_f,
+            target,
+            max_lim,
+            quantiles=quantiles,
+            f_min_floor=model_dev.get("f_min_floor", 0.02),
+        )
+        thresholds = f"adaptive (target {target}, quantiles {list(quantiles)})"
+        SparcLog(
+            f"Adaptive deviation window: [{min_lim:.3f}, {max_lim:.3f}] eV/Å "
+            f"(max_devi_f median {np.median(max_devi_f):.3f}, max {max_devi_f.max():.3f})"
+        )
+
+    # Index the structures labelled in previous iterations
+    fingerprint_index = None
+    if model_dev.get("fingerprint_tol") is not None:
+        fingerprint_index = FingerprintIndex(
+            index_dir=model_dev.get("fingerprint_dir", "fingerprint_index"),
+            **(model_dev.get("descriptor") or {}),
+        )
+        fingerprint_index.update_from_tree(".")
+
+    # Queue of candidates left over by earlier iterations
+    backlog = None
+    if model_dev.get("max_candidates"):
+        backlog = CandidateBacklog(
+            model_dev.get("backlog_file", "candidate_backlog.json")
+        )
+
+    # Label only the uncertain local environments of large candidates
+    carver = None
+    if model_dev.get("carving"):
+        carver = ClusterCarver(model_names, **model_dev["carving"])
+
+    # Reject unphysical candidates, judged against the first frame of the run
+    prescreen = None
+    if model_dev.get("prescreen"):
+        prescreen = PreScreen(**model_dev["prescreen"])
+        prescreen.set_reference(read(trajfile, index=0))
+
+    # Update labelling to use the dft_dir
+    candidate_found, labelled_files = labelling(
+        trajfile,
+        str(outfile),
+        min_lim,
+        max_lim,
+        output_dir=f"{dpmd_data_path!s}/dft_candidates",  # Pass the dft directory for POSCAR files
+        streaming=model_dev.get("streaming", False),
+        fps_budget=model_dev.get("fps_budget"),
+        descriptor=model_dev.get("descriptor"),
+        fingerprint_index=fingerprint_index,
+        fingerprint_tol=model_dev.get("fingerprint_tol"),
+        max_candidates=model_dev.get("max_candidates"),
+        priority=model_dev.get("priority", "top"),
+        priority_bins=model_dev.get("priority_bins", 5),
+        backlog=backlog,
+        carver=carver,
+        prescreen=prescreen,
+    )
+
+    # Log iteration info
+    _log_learning_state(
+        iteration, trajfile, min_lim, max_lim, labelled_files, thresholds=thresholds
+    )
+    return candidate_found, labelled_files
+
+
+def QueryOnTheFly(monitor, trajfile, dpmd_data_path, iteration=0, model_dev=None):
+    """
+    Select the candidates among the frames evaluated by a ``CommitteeMonitor``.
+
+    The deviation rows of all runs are gathered into ``model_dev_N.out`` (and
+    ``.npy``); its step column holds the index of each evaluated frame in the
+    monitor's ``frames_file`` (the MD steps are kept in the per-run
+    ``model_dev_otf_NNN.npy`` arrays). The candidates are then selected with
+    the same window, filters and budget as the post-processing QbC.
+
+    Args:
+        monitor (CommitteeMonitor): Monitor attached to ``ExecuteMlpDynamics``
+        trajfile (str): Path to the ML/MD trajectory file (for the log only)
+        dpmd_data_path (str): Directory where the model deviation file is written
+        iteration (int): Current iteration number
+        model_dev (dict): ``model_dev`` section of the input configuration
+
+    Returns:
+        tuple: (candidate_found, labelled_files, model_names)
+    """
+    model_dev = model_dev or {}
+    outfile = f"{dpmd_data_path!s}/model_dev_{iteration}.out"
+    devi = monitor.deviation()
+    SparcLog("\n" + "=" * 90)
+    SparcLog(f"On-the-fly QbC evaluated {len(devi)} frames of {trajfile!s}")
+    SparcLog("=" * 90 + "\n")
+    if not len(devi):
+        _log_learning_state(iteration, trajfile, monitor.min_lim, monitor.max_lim, [])
+        return False, [], monitor.model_names
+
+    table = devi.copy()
+    table[:, 0] = np.arange(len(devi))
+    write_model_devi(
+        table, outfile, header=f"on-the-fly: frames of {monitor.frames_file}"
+    )
+    candidate_found, labelled_files = _select_candidates(
+        monitor.frames_file,
+        outfile,
+        monitor.min_lim,
+        monitor.max_lim,
+        dpmd_data_path,
+        iteration,
+        model_dev,
+        monitor.model_names,
+    )
+    return candidate_found, labelled_files, monitor.model_names
+
+
+def setup_committee_monitor(config, model_path, dpmd_data_path):
+    """
+    Build the on-the-fly ``CommitteeMonitor`` if it is enabled in the configuration.
+
+    On-the-fly QbC is disabled for umbrella sampling, whose windows are driven
+    by ``plumed_wrapper.umbrella``; the post-processing QbC is used instead.
+
+    Args:
+        config (dict): Full SPARC configuration
+        model_path (str): Path to the directory containing DeepMD training folders
+        dpmd_data_path (str): ML/MD directory of the current iteration
+
+    Returns:
+        CommitteeMonitor or None
+    """
+    model_dev = config.get("model_dev", {})
+    deepmd_setup = config.get("deepmd_setup", {})
+    umbrella_is = deepmd_setup.get("use_plumed", False) and deepmd_setup.get(
+        "umbrella_sampling", {}
+    ).get("enabled", False)
+    if not (config.get("active_learning") and model_dev.get("on_the_fly")):
+        return None
+    if umbrella_is:
+        SparcLog("On-the-fly QbC is not available with umbrella sampling")
+        return None
+
+    return CommitteeMonitor(
+        model_names=find_committee_models(model_path, deepmd_setup["num_models"]),
+        min_lim=model_dev["f_min_dev"],
+        max_lim=model_dev["f_max_dev"],
+        output_dir=dpmd_data_path,
+        interval=model_dev.get("otf_interval", 1),
+    )
+
+
+def driving_model(committee_monitor, model_path, model_name):
+    """
+    Choose the model that drives the ML/MD.
+
+    With on-the-fly QbC the first committee model drives the MD, so the monitor
+    reuses its calculator instead of evaluating that model a second time.
+
+    Args:
+        committee_monitor (CommitteeMonitor or None): Monitor of the iteration
+        model_path (str): Directory of the default driving model
+        model_name (str): Default driving model, relative to ``model_path``
+
+    Returns:
+        tuple: (model_path, model_name)
+    """
+    if committee_monitor is None:
+        return model_path, model_name
+    model_file = committee_monitor.model_names[0]
+    return os.path.dirname(model_file), os.path.basename(model_file)
+
+
+def _log_learning_state(
+    iteration, trajfile, min_lim, max_lim, labelled_files, thresholds="fixed"
+):
+    """Append the QbC summary of an iteration to ``learning_state.log``."""
+    with open("learning_state.log", "a") as f:
+        f.write(f"\nIteration {iteration:06d}\n")
+        f.write(f"Training data from: {trajfile}\n")
+        f.write(f"Model deviation range: [{min_lim:.3f}, {max_lim:.3f}] eV/Å\n")
+        f.write(f"Thresholds: {thresholds}\n")
+        f.write(f"Candidates found: {len(labelled_files)}\n")
+        f.write("-" * 80 + "\n")
+
+
+def find_committee_models(model_path, num_models):
+    """
+    Locate the frozen models of the committee inside a training directory.
+
+    Args:
+        model_path (str): Path to the directory containing DeepMD training folders
+        num_models (int): Number of models to consider (minimum 2)
+
+    Returns:
+        list: Sorted paths to the ``frozen_model_N.pb`` files
+    """
     # Dynamically find the model files
     model_names = []
     for folder in os.listdir(model_path):
@@ -80,12 +381,21 @@ def QueryByCommittee(
             f"Found only {len(model_names)} models, but {num_models} are required. Check the model_path!"
         )
 
-    SparcLog("========================================================================")
-    SparcLog("{}".format("Using the following models:".center(72)))
-    SparcLog("========================================================================")
-    for model in model_names:
-        SparcLog(f"{model.center(72)}")
-    SparcLog("========================================================================")
+    return model_names
+
+
+def _run_dp_model_devi(trajfile, model_names, dpmd_data_path, outfile):
+    """
+    Convert the trajectory to DeePMD npy and run ``dp model-devi`` on it.
+
+    Args:
+        trajfile (str): Path to the ASE trajectory file
+        model_names (list): Paths to the frozen DeepMD models
+        dpmd_data_path (str): Directory where the DeePMD npy data will be saved
+        outfile (str): Path of the model deviation output file
+    """
+    # Stream the ASE trajectory into DeePMD npy sets (coordinates and cells only)
+    write_deepmd_npy(trajfile, str(dpmd_data_path), labels=False)
 
     # Construct the dp model-devi command
     command = (
@@ -118,23 +428,3 @@ def QueryByCommittee(
         SparcLog(
             "========================================================================"
         )
-
-    # Update labelling to use the dft_dir
-    candidate_found, labelled_files = labelling(
-        trajfile,
-        str(outfile),
-        min_lim,
-        max_lim,
-        output_dir=f"{dpmd_data_path!s}/dft_candidates",  # Pass the dft directory for POSCAR files
-    )
-
-    # Log iteration info
-    with open("learning_state.log", "a") as f:
-        f.write(f"\nIteration {iteration:06d}\n")
-        f.write(f"Training data from: {trajfile}\n")
-        f.write(f"Model deviation range: [{min_lim:.3f}, {max_lim:.3f}] eV/Å\n")
-        f.write(f"Candidates found: {len(labelled_files) if candidate_found else 0}\n")
-        f.write("-" * 80 + "\n")
-
-    return candidate_found, labelled_files, model_names
-
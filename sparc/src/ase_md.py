@@ -15,6 +15,7 @@ from ase.md.verlet import VelocityVerlet
 
 ################################################################
 # Local imports
+from sparc.src.dft_cache import CachedCalculator
 from sparc.src.utils.logger import SparcLog
 from sparc.src.utils.utils import (
     check_physical_limits,
@@ -201,6 +202,7 @@ def ExecuteMlpDynamics(
     distance_metrics,
     name,
     epot_threshold,
+    committee_monitor=None,
 ):
     """
     Run a Deep Potential MD simulation.
@@ -225,6 +227,8 @@ def ExecuteMlpDynamics(
         Metrics used to check physical limits during the simulation.
     name : str
         A label for the simulation (e.g., the thermostat type).
+    committee_monitor : CommitteeMonitor, optional
+        Evaluates the committee deviation on the fly and streams candidates.
 
     Returns
     -------
@@ -248,6 +252,9 @@ def ExecuteMlpDynamics(
     )
     dyn.attach(logger, interval=pace)
 
+    if committee_monitor is not None:
+        committee_monitor.begin_run()
+
     # Store reference energy for comparison
     epot_ref = None
     for step in range(steps):
@@ -291,9 +298,16 @@ def ExecuteMlpDynamics(
             SparcLog("-" * 72, level="ERROR")
             break
 
+        # Committee deviation of the current frame
+        if committee_monitor is not None:
+            committee_monitor(system, dyn.get_number_of_steps())
+
+    if committee_monitor is not None:
+        committee_monitor.end_run(dir_name)
+
 
 def CalculateDFTEnergy(
-    idx, header, system, timestep, log_filename, dir_name, trajfile, pace=1
+    idx, header, system, timestep, log_filename, dir_name, trajfile, pace=1, cache=None
 ):
     """
     Calculate the DFT energy and forces for a candidate structure.
@@ -316,11 +330,15 @@ def CalculateDFTEnergy(
         The filename for the trajectory file.
     pace : int, optional
         The logging interval (default is 1).
+    cache : DFTCache, optional
+        Cache of DFT results consulted before running the calculator.
 
     Returns
     -------
     None
     """
+    if cache is not None:
+        system.calc = CachedCalculator(system.calc, cache)
     dyn = VelocityVerlet(system, timestep, trajectory=None)
     dyn.attach(lambda: save_xyz(system, trajfile, "a", dir_name), interval=pace)
 
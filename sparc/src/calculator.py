@@ -10,6 +10,7 @@ from ase.calculators.cp2k import CP2K
 ################################################################
 # Third part import
 from ase.calculators.vasp import Vasp
+from ase.calculators.vasp.interactive import VaspInteractive
 from ase.units import Rydberg
 
 ################################################################
@@ -30,9 +31,11 @@ class SetupDFTCalculator:
         Dictionary containing configuration for the DFT calculator.
     print_screen : bool, optional
         Prints input parameters on the output file. [default: False]
+    directory : str, optional
+        Working directory of the calculator, overriding the configured one.
     """
 
-    def __init__(self, input_config, print_screen=False):
+    def __init__(self, input_config, print_screen=False, directory=None):
         """
         Initializes the DFT calculator setup class.
 
@@ -42,6 +45,8 @@ class SetupDFTCalculator:
             Dictionary containing configuration for the DFT calculator.
         print_screen : bool, optional
             Whether to print details. Default is False.
+        directory : str, optional
+            Working directory of the calculator. Default is None.
         """
         if not isinstance(input_config, dict):
             raise ValueError("input_config must be a dictionary.")
@@ -51,15 +56,16 @@ class SetupDFTCalculator:
         self.input_config = input_config
         self.print_screen = print_screen
         self.dft_config = input_config["dft_calculator"]
+        self.directory = directory
 
-    def vasp(self):
+    def _vasp_parameters(self):
         """
-        Set up the VASP calculator.
+        Validate the VASP configuration and collect the calculator keywords.
 
         Returns
         -------
-        VASP or None
-            The configured VASP calculator object, or None if an error occurs.
+        dict
+            Keywords shared by the file-based and the interactive VASP calculators.
         """
         if self.dft_config["name"] != "VASP":
             raise ValueError("Unsupported DFT calculator. Only VASP is supported.")
@@ -91,19 +97,66 @@ class SetupDFTCalculator:
 
         gamma_point = self.dft_config.get("kgamma", False)
 
-        calc = Vasp(
+        return dict(
             prec=self.dft_config["prec"],
             kgamma=self.dft_config["kgamma"],
             gamma=not gamma_point,
             xc=self.dft_config.get("xc", "PBE"),
             pp=self.dft_config.get("pp", "PBE"),
-            directory=self.dft_config.get("directory", "vasp"),
             command=exe_run,
             **incar_params,
         )
 
+    def vasp(self):
+        """
+        Set up the VASP calculator.
+
+        Returns
+        -------
+        VASP or None
+            The configured VASP calculator object, or None if an error occurs.
+        """
+        calc = Vasp(
+            directory=self.directory or self.dft_config.get("directory", "vasp"),
+            **self._vasp_parameters(),
+        )
+
         return calc
 
+    def vasp_interactive(self, nsw=2000):
+        """
+        Set up VASP in interactive mode (``INTERACTIVE = .TRUE.``).
+
+        VASP is started once and reads the positions of every step from
+        stdin, keeping its wavefunction (extrapolated with ``IWAVPR = 11``
+        unless set in the INCAR) between steps. Ionic-relaxation keywords of
+        the INCAR are replaced by the values interactive mode requires.
+
+        Parameters
+        ----------
+        nsw : int, optional
+            Number of ionic steps VASP accepts before exiting. Default is 2000.
+
+        Returns
+        -------
+        VaspInteractive
+            The configured interactive VASP calculator object.
+        """
+        params = self._vasp_parameters()
+        for key in ("ibrion", "potim", "nsw", "interactive"):
+            if params.pop(key, None) is not None:
+                SparcLog(f"Interactive VASP: ignoring {key.upper()} from the INCAR")
+        params.setdefault("iwavpr", 11)
+
+        directory = self.directory or self.dft_config.get("directory", "vasp")
+        os.makedirs(directory, exist_ok=True)
+        return VaspInteractive(
+            path=directory,
+            txt=os.path.join(directory, "interactive.log"),
+            nsw=nsw,
+            **params,
+        )
+
     def cp2k(self):
         """
         Set up the CP2K calculator.
@@ -138,6 +191,8 @@ class SetupDFTCalculator:
 
         cp2k_config = self.input_config.get("cp2k", {})
         default_params.update(cp2k_config)
+        if self.directory is not None:
+            default_params["label"] = os.path.join(self.directory, "job")
 
         calc = CP2K(
             command=self.dft_config.get("exe_command", "cp2k.popt"),
@@ -154,7 +209,7 @@ class SetupDFTCalculator:
 
 
 # ===================================================================================================#
-def dft_calculator(config, print_screen=False):
+def dft_calculator(config, print_screen=False, directory=None, interactive=False):
     """
     Helper function to set up the DFT calculator based on configuration.
 
@@ -164,6 +219,10 @@ def dft_calculator(config, print_screen=False):
         Dictionary containing the full DFT configuration.
     print_screen : bool, optional
         Whether to print the calculator details to the screen.
+    directory : str, optional
+        Working directory of the calculator (default: from the configuration).
+    interactive : bool, optional
+        Run VASP in interactive mode for MD (CP2K always runs through ``cp2k_shell``).
 
     Returns
     -------
@@ -171,9 +230,12 @@ def dft_calculator(config, print_screen=False):
         The configured ASE calculator instance.
     """
     calculator_name = config["dft_calculator"]["name"].lower()
-    calculator_setup = SetupDFTCalculator(config, print_screen)
+    calculator_setup = SetupDFTCalculator(config, print_screen, directory)
 
     if calculator_name == "vasp":
+        if interactive:
+            steps = config.get("md_simulation", {}).get("steps", 0)
+            return calculator_setup.vasp_interactive(nsw=max(2000, steps + 10))
         return calculator_setup.vasp()
     elif calculator_name == "cp2k":
         return calculator_setup.cp2k()
@@ -183,6 +245,54 @@ def dft_calculator(config, print_screen=False):
         )
 
 
+# Long-lived CP2K calculator of this process, see ``cp2k_session``
+_CP2K_SESSION = {}
+
+
+def cp2k_session(config, atoms, directory=None):
+    """
+    CP2K calculator kept alive between the single points of this process.
+
+    The ``cp2k_shell`` process and its force environment (basis sets,
+    pseudopotentials, wavefunction) are reused for successive structures;
+    positions and cell are sent with ``SET_POS``/``SET_CELL``. A new session
+    is started only when the atoms (composition and order), the periodicity
+    or the working directory change.
+
+    Parameters
+    ----------
+    config : dict
+        Dictionary containing the full DFT configuration.
+    atoms : ase.Atoms
+        Structure to compute next.
+    directory : str, optional
+        Working directory of the session.
+
+    Returns
+    -------
+    CP2K
+        The calculator of the current session.
+    """
+    key = (directory, tuple(atoms.numbers), tuple(atoms.pbc))
+    if _CP2K_SESSION.get("key") != key:
+        close_cp2k_session()
+        calc = dft_calculator(config, False, directory)
+        _CP2K_SESSION.update(key=key, calc=calc)
+        SparcLog(
+            f"Started CP2K session for {atoms.get_chemical_formula()} "
+            f"in {directory or 'cp2k'}/"
+        )
+    return _CP2K_SESSION["calc"]
+
+
+def close_cp2k_session():
+    """Terminate the ``cp2k_shell`` of the current CP2K session, if any."""
+    calc = _CP2K_SESSION.pop("calc", None)
+    _CP2K_SESSION.pop("key", None)
+    if calc is not None:
+        calc.close()
+
+
 # ===================================================================================================#
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Set up DFT calculator.")
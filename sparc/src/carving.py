@@ -0,0 +1,196 @@
+# carving.py
+"""
+Local-environment carving of large DFT candidates.
+
+In a large cell usually only a few atoms have a high committee force
+deviation. Instead of labelling the whole cell, the uncertain atoms are
+located from the per-atom force deviation and only their local environment
+is sent to DFT, either as a spherical cluster in a vacuum box or as a small
+periodic cubic sub-cell. Atoms are cut without passivation, so the carving
+radius should be larger than the descriptor cutoff of the DeePMD model to
+keep the environment of the uncertain atom intact.
+"""
+
+################################################################
+import numpy as np
+
+################################################################
+# Third party import
+from ase import Atoms
+
+################################################################
+# Local import
+from sparc.src.model_deviation import atomic_force_deviation, load_committee
+from sparc.src.utils.logger import SparcLog
+
+
+# ===================================================================================================#
+# Carving Geometries
+# ===================================================================================================#
+def _local_vectors(atoms, center):
+    """Minimum image vectors from atom ``center`` to every atom."""
+    return atoms.get_distances(
+        center, range(len(atoms)), mic=bool(atoms.pbc.any()), vector=True
+    )
+
+
+def carve_sphere(atoms, center, radius, vacuum=6.0):
+    """
+    Spherical cluster around one atom.
+
+    Args:
+        atoms (ase.Atoms): Parent structure
+        center (int): Index of the central atom
+        radius (float): Cluster radius (Å)
+        vacuum (float): Vacuum added on each side of the cluster (Å)
+
+    Returns:
+        tuple: (cluster, parent indices of the cluster atoms)
+    """
+    vectors = _local_vectors(atoms, center)
+    keep = np.flatnonzero(np.linalg.norm(vectors, axis=1) <= radius)
+    cluster = Atoms(numbers=atoms.numbers[keep], positions=vectors[keep], pbc=False)
+    cluster.center(vacuum=vacuum)
+    return cluster, keep
+
+
+def carve_subcell(atoms, center, length, min_dist=0.7):
+    """
+    Periodic cubic sub-cell centred on one atom.
+
+    Atoms that end up closer than ``min_dist`` to a periodic image across
+    the cut faces are removed, the one farther from the centre first.
+
+    Args:
+        atoms (ase.Atoms): Parent structure
+        center (int): Index of the central atom
+        length (float): Edge of the cubic sub-cell (Å), at most the smallest
+            cell height of a periodic parent
+        min_dist (float): Smallest allowed interatomic distance (Å)
+
+    Returns:
+        tuple: (sub-cell, parent indices of the sub-cell atoms)
+    """
+    if atoms.pbc.all():
+        heights = 1.0 / np.linalg.norm(atoms.cell.reciprocal(), axis=1)
+        length = min(length, float(heights.min()))
+    vectors = _local_vectors(atoms, center)
+    keep = np.flatnonzero(np.all(np.abs(vectors) < length / 2, axis=1))
+    radial = np.linalg.norm(vectors[keep], axis=1)
+
+    subcell = Atoms(
+        numbers=atoms.numbers[keep],
+        positions=vectors[keep] + length / 2,
+        cell=[length] * 3,
+        pbc=True,
+    )
+    while len(subcell) > 1:
+        distances = subcell.get_all_distances(mic=True)
+        np.fill_diagonal(distances, np.inf)
+        i, j = np.unravel_index(np.argmin(distances), distances.shape)
+        if distances[i, j] >= min_dist:
+            break
+        drop = i if radial[i] > radial[j] else j
+        del subcell[drop]
+        keep = np.delete(keep, drop)
+        radial = np.delete(radial, drop)
+    return subcell, keep
+
+
+# ===================================================================================================#
+class ClusterCarver:
+    """
+    Replace large candidates by the local environments of their uncertain atoms.
+
+    Atoms with a per-atom force deviation of at least ``threshold`` are
+    uncertain. They are visited by decreasing deviation; each one not yet
+    inside the core (half radius) of an earlier carving becomes the centre of
+    a new carving, up to ``max_clusters`` per structure.
+
+    Parameters
+    ----------
+    model_names : list
+        Paths to the frozen DeepMD models of the committee.
+    mode : str, optional
+        "sphere" (cluster in vacuum) or "subcell" (periodic cube).
+    radius : float, optional
+        Cluster radius, or half the sub-cell edge, in Å (default: 6.0).
+    max_clusters : int, optional
+        Largest number of carvings per structure (default: 4).
+    min_natoms : int, optional
+        Structures with fewer atoms are labelled whole (default: 200).
+    vacuum : float, optional
+        Vacuum around spherical clusters in Å (default: 6.0).
+    threshold : float, optional
+        Per-atom deviation of uncertain atoms in eV/Å; the lower bound of the
+        deviation window is used when None.
+    """
+
+    def __init__(
+        self,
+        model_names,
+        mode="sphere",
+        radius=6.0,
+        max_clusters=4,
+        min_natoms=200,
+        vacuum=6.0,
+        threshold=None,
+    ):
+        if mode not in ("sphere", "subcell"):
+            raise ValueError(f"Unknown carving mode: {mode}")
+        self.mode = mode
+        self.radius = radius
+        self.max_clusters = max_clusters
+        self.min_natoms = min_natoms
+        self.vacuum = vacuum
+        self.threshold = threshold
+        self.committee = load_committee(model_names)
+        self.type_map = self.committee[0].get_type_map()
+
+    def carve(self, atoms, center):
+        """Carve the environment of atom ``center``."""
+        if self.mode == "sphere":
+            return carve_sphere(atoms, center, self.radius, self.vacuum)
+        return carve_subcell(atoms, center, 2 * self.radius)
+
+    def __call__(self, atoms, min_lim):
+        """
+        Carvings to label instead of ``atoms``.
+
+        Args:
+            atoms (ase.Atoms): Candidate structure
+            min_lim (float): Lower bound of the deviation window (eV/Å)
+
+        Returns:
+            list: ase.Atoms to label; ``[atoms]`` for small structures
+        """
+        if len(atoms) < self.min_natoms:
+            return [atoms]
+
+        devi = atomic_force_deviation(self.committee, self.type_map, atoms)
+        threshold = min_lim if self.threshold is None else self.threshold
+        order = np.argsort(devi)[::-1]
+        centers = [int(i) for i in order if devi[i] >= threshold] or [int(order[0])]
+
+        pieces, covered = [], set()
+        for center in centers:
+            if center in covered:
+                continue
+            if len(pieces) == self.max_clusters:
+                break
+            piece, _ = self.carve(atoms, center)
+            pieces.append(piece)
+            core = np.linalg.norm(_local_vectors(atoms, center), axis=1)
+            covered.update(np.flatnonzero(core <= self.radius / 2).tolist())
+
+        SparcLog(
+            f"Carved {len(pieces)} {self.mode} environments "
+            f"({', '.join(str(len(p)) for p in pieces)} atoms) from a "
+            f"{len(atoms)}-atom structure with {len(centers)} uncertain atoms"
+        )
+        return pieces
+
+
+# ===================================================================================================#
+#                                     END OF FILE
+# ===================================================================================================#
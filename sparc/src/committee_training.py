@@ -0,0 +1,261 @@
+# committee_training.py
+"""
+Concurrent training of the DeePMD committee.
+
+Every model of the committee is trained by a pipeline of commands (``dp
+train``, ``dp freeze``, ``dp compress``) run as subprocesses in the model's
+own directory, so the pipelines of all models can run at the same time
+without changing the working directory of SPARC. Each pipeline gets its own
+slice of the available cores: the slice is the CPU affinity mask of its
+processes and sets the OpenMP and TensorFlow thread counts
+(``OMP_NUM_THREADS``, ``DP_INTRA_OP_PARALLELISM_THREADS``, ...). The output
+of a pipeline goes to ``train.log`` in its directory, and the state of every
+model (``running``, ``done`` or ``failed``, with the failed command and its
+exit code) is written to a status file after every change.
+"""
+
+################################################################
+import functools
+import json
+import os
+import subprocess
+import time
+
+################################################################
+# Local import
+from sparc.src.utils.logger import SparcLog
+
+STATUS_FILE = "training_status.json"
+LOG_FILE = "train.log"
+
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+# ===================================================================================================#
+def available_cores():
+    """Cores SPARC may run on (its affinity mask if the platform has one)."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def core_slices(n_models, cores_per_model=None, cores=None):
+    """
+    Cores of every model.
+
+    Args:
+        n_models (int): Number of models trained at the same time
+        cores_per_model (int, optional): Cores of a model; by default the
+            available cores are shared evenly (at least one per model)
+        cores (list, optional): Available cores (default: ``available_cores()``)
+
+    Returns:
+        list: One list of core ids per model. Slices wrap around, with a
+        warning, when more cores are requested than available.
+    """
+    cores = available_cores() if cores is None else list(cores)
+    if cores_per_model is None:
+        cores_per_model = max(1, len(cores) // n_models)
+    if n_models * cores_per_model > len(cores):
+        SparcLog(
+            f"{n_models} models x {cores_per_model} cores exceed the "
+            f"{len(cores)} available cores; models will share cores",
+            level="WARNING",
+        )
+    return [
+        [cores[(k * cores_per_model + j) % len(cores)] for j in range(cores_per_model)]
+        for k in range(n_models)
+    ]
+
+
+def thread_env(n_threads):
+    """Environment variables limiting OpenMP and TensorFlow to ``n_threads``."""
+    n = str(n_threads)
+    return {
+        "OMP_NUM_THREADS": n,
+        "DP_INTRA_OP_PARALLELISM_THREADS": n,
+        "DP_INTER_OP_PARALLELISM_THREADS": "1",
+        "TF_INTRA_OP_PARALLELISM_THREADS": n,
+        "TF_INTER_OP_PARALLELISM_THREADS": "1",
+    }
+
+
+def _set_affinity(cores):
+    os.sched_setaffinity(0, cores)
+
+
+class Pipeline:
+    """
+    Commands training one model, run one after the other in ``cwd``.
+
+    Parameters
+    ----------
+    name : str
+        Name of the model in logs and in the status file.
+    cwd : str
+        Working directory of the commands.
+    commands : list
+        Commands (argument lists); a command runs when the previous one
+        succeeded.
+    cores : list, optional
+        Cores of the pipeline (affinity mask and thread counts).
+    """
+
+    def __init__(self, name, cwd, commands, cores=None):
+        self.name = name
+        self.cwd = str(cwd)
+        self.commands = list(commands)
+        self.cores = cores
+        self.state = None
+        self.stage = 0
+        self.returncode = None
+        self.started = None
+        self.finished = None
+        self._process = None
+        self._log = None
+
+    def _start_stage(self):
+        """Start the current command; a command that cannot start fails the pipeline."""
+        env = dict(os.environ)
+        preexec_fn = None
+        if self.cores:
+            env.update(thread_env(len(self.cores)))
+            if hasattr(os, "sched_setaffinity"):
+                preexec_fn = functools.partial(_set_affinity, self.cores)
+        try:
+            self._process = subprocess.Popen(
+                self.commands[self.stage],
+                cwd=self.cwd,
+                env=env,
+                stdout=self._log,
+                stderr=subprocess.STDOUT,
+                # The pipelines are driven from a single thread
+                preexec_fn=preexec_fn,
+            )
+        except OSError as e:
+            self._log.write(f"{self.commands[self.stage][0]} could not start: {e}\n")
+            self._finish(FAILED, returncode=None)
+
+    def start(self):
+        """Start the first command."""
+        self.state, self.started = RUNNING, time.time()
+        self._log = open(os.path.join(self.cwd, LOG_FILE), "a")
+        self._start_stage()
+
+    def poll(self):
+        """
+        Advance the pipeline if its current command finished.
+
+        Returns:
+            bool: True if the state of the pipeline changed
+        """
+        if self.state != RUNNING:
+            return False
+        returncode = self._process.poll()
+        if returncode is None:
+            return False
+        if returncode != 0:
+            self._finish(FAILED, returncode)
+            return True
+        self.stage += 1
+        if self.stage == len(self.commands):
+            self._finish(DONE, returncode)
+        else:
+            self._start_stage()
+        return True
+
+    def _finish(self, state, returncode):
+        self.state, self.returncode, self.finished = state, returncode, time.time()
+        self._log.close()
+
+    def terminate(self):
+        """Stop a running pipeline."""
+        if self.state == RUNNING:
+            self._process.terminate()
+            self._process.wait()
+            self._finish(FAILED, self._process.returncode)
+
+    def status(self):
+        """State of the pipeline for the status file."""
+        status = {
+            "state": self.state,
+            "cwd": self.cwd,
+            "cores": self.cores,
+            "started": self.started,
+            "finished": self.finished,
+        }
+        if self.state == FAILED:
+            status["command"] = " ".join(self.commands[self.stage])
+            status["returncode"] = self.returncode
+        return status
+
+
+def run_pipelines(pipelines, status_file=None, poll_interval=5.0):
+    """
+    Run training pipelines at the same time and wait for all of them.
+
+    A failed pipeline does not stop the others.
+
+    Args:
+        pipelines (list): ``Pipeline`` objects
+        status_file (str, optional): JSON file with the state of every pipeline
+        poll_interval (float): Seconds between checks of the running commands
+
+    Returns:
+        dict: Final state (``done`` or ``failed``) of every pipeline by name
+    """
+
+    def write_status():
+        if status_file is None:
+            return
+        tmp = f"{status_file}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({p.name: p.status() for p in pipelines}, f, indent=4)
+        os.replace(tmp, status_file)
+
+    for pipeline in pipelines:
+        pipeline.start()
+        if pipeline.state == FAILED:
+            SparcLog(
+                f"{pipeline.name}: could not start (see "
+                f"{os.path.join(pipeline.cwd, LOG_FILE)})",
+                level="ERROR",
+            )
+        else:
+            SparcLog(f"{pipeline.name}: started on cores {pipeline.cores}")
+    write_status()
+
+    try:
+        while any(p.state == RUNNING for p in pipelines):
+            time.sleep(poll_interval)
+            changed = False
+            for pipeline in pipelines:
+                if pipeline.poll():
+                    changed = True
+                    if pipeline.state == DONE:
+                        SparcLog(
+                            f"{pipeline.name}: finished in "
+                            f"{pipeline.finished - pipeline.started:.0f} s"
+                        )
+                    elif pipeline.state == FAILED:
+                        SparcLog(
+                            f"{pipeline.name}: '{' '.join(pipeline.commands[pipeline.stage])}'"
+                            f" failed with exit code {pipeline.returncode}"
+                            f" (see {os.path.join(pipeline.cwd, LOG_FILE)})",
+                            level="ERROR",
+                        )
+            if changed:
+                write_status()
+    finally:
+        for pipeline in pipelines:
+            pipeline.terminate()
+        write_status()
+
+    return {p.name: p.state for p in pipelines}
+
+
+# ===================================================================================================#
+#                                     END OF FILE
+# ===================================================================================================#
@@ -0,0 +1,198 @@
+# convergence.py
+"""
+SCF convergence checks, retries and quarantine of DFT single points.
+
+A single point is only accepted as a label if its SCF converged: for VASP
+the OUTCAR is parsed by ASE when the results are read (``calc.converged``),
+for CP2K the output file of the job is searched for ``SCF run NOT
+converged``. Failed or timed-out jobs are retried along a ladder of
+calculator keyword overrides, e.g.
+
+- VASP: ``{algo: "All"}``, ``{nelm: 200}``, ``{ismear: 0, sigma: 0.1}``
+- CP2K: ``{max_scf: 1000}``
+
+where every rung is applied on top of the previous ones. Structures that
+fail every rung are written to a quarantine file instead of the dataset.
+"""
+
+################################################################
+import contextlib
+import json
+import os
+import signal
+import threading
+
+################################################################
+# Third party import
+from ase.calculators.vasp import Vasp
+
+################################################################
+# Local import
+from sparc.src.utils.logger import SparcLog
+
+
+class SCFConvergenceError(RuntimeError):
+    """The SCF of a DFT single point did not converge."""
+
+
+class WallClockTimeoutError(RuntimeError):
+    """A DFT single point ran longer than its wall-clock limit."""
+
+
+# ===================================================================================================#
+def cp2k_converged(outfile):
+    """
+    Whether the last SCF of a CP2K output file converged.
+
+    Returns:
+        bool or None: None if the file has no SCF
+    """
+    if not os.path.exists(outfile):
+        return None
+    with open(outfile, errors="replace") as f:
+        text = f.read()
+    last = text.rfind("SCF WAVEFUNCTION OPTIMIZATION")
+    if last < 0:
+        return None
+    return "SCF run NOT converged" not in text[last:]
+
+
+def vasp_converged(outcar):
+    """
+    Whether the SCF of a VASP OUTCAR converged, as judged by ASE.
+
+    Returns:
+        bool or None: None if the file has no SCF
+    """
+    if not os.path.exists(outcar):
+        return None
+    with open(outcar, errors="replace") as f:
+        return Vasp().read_convergence(f.readlines())
+
+
+def check_convergence(calc):
+    """
+    Raise if the last calculation of ``calc`` did not converge.
+
+    Calculators without a convergence report (e.g. empirical potentials)
+    are accepted.
+
+    Raises:
+        SCFConvergenceError: if the DFT code reported an unconverged SCF
+    """
+    name = getattr(calc, "name", "").lower()
+    if name == "vasp":
+        converged = getattr(calc, "converged", None)
+        where = os.path.join(str(calc.directory), "OUTCAR")
+    elif name == "cp2k":
+        where = f"{calc.label}.out"
+        converged = cp2k_converged(where)
+    else:
+        return
+    if converged is False:
+        raise SCFConvergenceError(f"SCF did not converge (see {where})")
+
+
+def with_timeout(command, seconds):
+    """Prefix a shell command with a wall-clock limit (coreutils ``timeout``)."""
+    if not seconds:
+        return command
+    return f"timeout --kill-after=60 {int(seconds)} {command}"
+
+
+@contextlib.contextmanager
+def wall_clock_limit(seconds):
+    """
+    Raise ``WallClockTimeoutError`` if the body runs longer than ``seconds``.
+
+    Guards single points that cannot be wrapped in ``timeout``, e.g. a step
+    of a persistent ``cp2k_shell``; the blocking read of the shell output is
+    interrupted by ``SIGALRM``. Without a limit, or outside the main thread
+    where signals cannot be received, the body runs unguarded.
+    """
+    if (
+        not seconds
+        or not hasattr(signal, "setitimer")
+        or threading.current_thread() is not threading.main_thread()
+    ):
+        yield
+        return
+
+    def expire(signum, frame):
+        raise WallClockTimeoutError(f"Exceeded the wall-clock limit of {seconds} s")
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def retry_ladder(settings):
+    """Keyword overrides of every attempt, starting with the unmodified setup."""
+    ladder, overrides = [{}], {}
+    for rung in settings.get("retry") or []:
+        overrides = {**overrides, **rung}
+        ladder.append(dict(overrides))
+    return ladder
+
+
+def describe(overrides):
+    """Readable form of the keyword overrides of an attempt."""
+    if not overrides:
+        return "default setup"
+    return " ".join(f"{k}={v}" for k, v in overrides.items())
+
+
+# ===================================================================================================#
+class Quarantine:
+    """
+    Structures that could not be labelled, with the reason.
+
+    The entries are kept in a JSON file so that they can be inspected, fixed
+    by hand and relabelled later; they are never added to the dataset.
+
+    Parameters
+    ----------
+    filename : str, optional
+        JSON file of the quarantined structures (default: quarantine.json).
+    """
+
+    def __init__(self, filename="quarantine.json"):
+        self.filename = str(filename)
+        self.entries = []
+        if os.path.exists(self.filename):
+            with open(self.filename) as f:
+                self.entries = json.load(f)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, source, index, reason):
+        """Quarantine candidate ``index`` read from ``source`` (once per candidate)."""
+        entry = {
+            "file": os.path.abspath(str(source)),
+            "index": int(index),
+            "reason": str(reason),
+        }
+        self.entries = [
+            e
+            for e in self.entries
+            if (e["file"], e["index"]) != (entry["file"], entry["index"])
+        ]
+        self.entries.append(entry)
+        SparcLog(f"Quarantined candidate {index} ({source}): {reason}", level="WARNING")
+
+    def save(self):
+        """Write the quarantine file."""
+        tmp = f"{self.filename}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(tmp, self.filename)
+
+
+# ===================================================================================================#
+#                                     END OF FILE
+# ===================================================================================================#
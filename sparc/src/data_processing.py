@@ -1,19 +1,48 @@
 # data_processing.py
 ################################################################
-import dpdata
+import json
+import os
+import shutil
+from pathlib import Path
+
 import numpy as np
 
+################################################################
+# Third party import
+from ase import Atoms
+from ase.io.trajectory import Trajectory
+from ase.stress import voigt_6_to_full_3x3_stress
+from scipy.spatial import cKDTree
+
 ################################################################
 # Local Import
+from sparc.src.utils.descriptors import N_BINS, R_MAX, pair_distance_histogram
 from sparc.src.utils.logger import SparcLog
+from sparc.src.work_queue import structure_digest
+
+# Frames per ``set.NNN`` directory of a DeePMD system
+SET_SIZE = 5000
 
 
 # ===================================================================================================#
-def get_data(ase_traj="AseMD.traj", dir_name="Dataset", skip_min=0, skip_max=None):
+def get_data(
+    ase_traj="AseMD.traj",
+    dir_name="Dataset",
+    skip_min=0,
+    skip_max=None,
+    set_size=SET_SIZE,
+    prune_tol=None,
+):
     """
     Process an ASE trajectory file and split the data into training and validation datasets.
     The training data consists of 80% of the frames, and the validation data consists of 20%.
-    The data is then saved in the specified directory ``data_dir`` in the ``.npy`` format.
+    The split is decided by a hash of every frame (see ``assign_split``) and does not
+    change from one call to the next.
+    The data is then saved in the specified directory ``data_dir`` in the ``.npy`` format,
+    with one DeePMD system per composition.
+
+    The dataset is rebuilt from scratch with ``DatasetBuilder``; use
+    ``build_dataset`` to add the frames of new iterations to an existing one.
 
     Args:
     -----
@@ -29,6 +58,16 @@ def get_data(ase_traj="AseMD.traj", dir_name="Dataset", skip_min=0, skip_max=Non
     skip_max (int):
         Skip the last n frames.
 
+    set_size (int):
+        Frames per ``set.NNN`` directory.
+
+    prune_tol (float):
+        Descriptor tolerance of near-duplicate frames (None: keep all).
+
+    Returns:
+    --------
+    DatasetBuilder: The new dataset
+
     Example
     -------
 
@@ -37,36 +76,647 @@ def get_data(ase_traj="AseMD.traj", dir_name="Dataset", skip_min=0, skip_max=Non
         from sparc.src.data_processing import get_data
         get_data(ase_traj="AseMD.traj", dir_name="Dataset", skip_min=0, skip_max=None)
     """
+    dir_name = Path(dir_name)
+    (dir_name / MANIFEST_FILE).unlink(missing_ok=True)
+    for sub_dir in ("training_data", "validation_data", DIGEST_DIR, "descriptors"):
+        shutil.rmtree(dir_name / sub_dir, ignore_errors=True)
 
-    # Load the trajectory (ASE trajectory format) using dpdata.
-    dt = dpdata.LabeledSystem(f"{ase_traj}", "ase/traj")
+    builder = DatasetBuilder(dir_name, set_size=set_size, prune_tol=prune_tol)
+    builder.update(ase_traj, skip_min, skip_max)
+    systems = builder.manifest["systems"].values()
+    for split in ("training_data", "validation_data"):
+        SparcLog(
+            f"# The {dir_name}/{split.replace('_data', '')} data contains "
+            f"{builder.n_frames(split)} frames "
+            f"in {sum(1 for system in systems if system[split]['frames'])} systems"
+        )
+    return builder
 
-    # Slice the data to get the frames between skip_min and skip_max
-    data = dt[skip_min:skip_max]
 
-    # Get the number of frames
-    n_frames = data.get_nframes()
-    # print(f"# The dataset contains %d frames" % n_frames)
+# ===================================================================================================#
+# DeePMD npy writer
+# ===================================================================================================#
+class DeepmdWriter:
+    """
+    Streaming writer of a DeePMD npy system.
 
-    # Split data into training and validation sets (80% training, 20% validation)
-    trr = int(n_frames * 0.8)  # training 80%
-    val = n_frames - trr  # validation 20%
+    Frames are copied into preallocated arrays of ``set_size`` frames
+    (``coord``, ``box``, and ``energy``, ``force`` and ``virial`` with
+    ``labels``), which are written as a ``set.NNN`` directory when they are
+    full, so memory does not depend on the number of frames. A set is written
+    to a temporary directory and renamed, so that a set directory is always
+    complete. The virial of a set is written if every frame of the set has a
+    stress.
 
-    # Randomly choose index for validation_data
-    index_validation = np.random.choice(n_frames, size=val, replace=False)
+    Parameters
+    ----------
+    sys_dir : str
+        System directory. ``type.raw`` and ``type_map.raw`` are written with
+        the first set.
+    symbols : list
+        Chemical symbols of the atoms, the same for every frame.
+    set_size : int, optional
+        Frames per set.
+    first_set : int, optional
+        Number of the first set written, to append to an existing system.
+    labels : bool, optional
+        Write energies, forces and virials.
+    prec : numpy.dtype, optional
+        Floating-point type of the arrays.
+    """
 
-    # The remaining frames are used for training_data
-    index_training = list(set(range(n_frames)) - set(index_validation))
+    def __init__(
+        self,
+        sys_dir,
+        symbols,
+        set_size=SET_SIZE,
+        first_set=0,
+        labels=True,
+        prec=np.float64,
+    ):
+        self.sys_dir = Path(sys_dir)
+        self.symbols = list(symbols)
+        self.set_size = set_size
+        self.labels = labels
+        self.prec = prec
+        self.n_sets = first_set
+        self.n_frames = 0
+        self._arrays = None
+        self._n = 0
+        self._virial = True
 
-    # Create subsystems for training and validation
-    data_training = data.sub_system(index_training)
-    data_validation = data.sub_system(index_validation)
+    def _allocate(self):
+        shapes = {"coord": 3 * len(self.symbols), "box": 9}
+        if self.labels:
+            shapes.update({"energy": None, "force": 3 * len(self.symbols), "virial": 9})
+        self._arrays = {
+            name: np.empty(
+                (self.set_size,) if n is None else (self.set_size, n), self.prec
+            )
+            for name, n in shapes.items()
+        }
 
-    # Save data in the specified directory as .npy files
-    data_training.to_deepmd_npy(f"{dir_name}/training_data")
-    data_validation.to_deepmd_npy(f"{dir_name}/validation_data")
-    SparcLog(f"# The {dir_name}/training data contains %d frames" % len(data_training))
-    SparcLog(
-        f"# The {dir_name}/validation data contains %d frames" % len(data_validation)
+    def append(self, atoms):
+        """Add a frame."""
+        if atoms.get_chemical_symbols() != self.symbols:
+            raise ValueError(
+                f"{atoms.get_chemical_formula()} does not belong to {self.sys_dir}"
+            )
+        if self._arrays is None:
+            self._allocate()
+        if self.n_sets == 0 and self._n == 0:
+            write_system_header(self.sys_dir, self.symbols, pbc=atoms.pbc.all())
+
+        i, arrays = self._n, self._arrays
+        arrays["coord"][i] = atoms.positions.ravel()
+        arrays["box"][i] = atoms.cell.array.ravel()
+        if self.labels:
+            arrays["energy"][i] = atoms.get_potential_energy()
+            arrays["force"][i] = atoms.get_forces().ravel()
+            stress = atoms.calc.results.get("stress")
+            if stress is None:
+                self._virial = False
+            else:
+                arrays["virial"][i] = (
+                    -atoms.get_volume() * voigt_6_to_full_3x3_stress(stress).ravel()
+                )
+        self._n += 1
+        if self._n == self.set_size:
+            self.flush()
+
+    def flush(self):
+        """Write the frames added since the last set as a new set."""
+        if not self._n:
+            return
+        set_dir = self.sys_dir / f"set.{self.n_sets:03d}"
+        tmp = Path(f"{set_dir}.tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        for name, array in self._arrays.items():
+            if name == "virial" and not self._virial:
+                continue
+            np.save(tmp / f"{name}.npy", array[: self._n])
+        shutil.rmtree(set_dir, ignore_errors=True)
+        os.replace(tmp, set_dir)
+        self.n_sets += 1
+        self.n_frames += self._n
+        self._n = 0
+        self._virial = True
+
+    def close(self):
+        """Write the last (partial) set."""
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+
+def write_system_header(sys_dir, symbols, pbc=True):
+    """Write ``type.raw``, ``type_map.raw`` (and ``nopbc``) of a DeePMD system."""
+    os.makedirs(sys_dir, exist_ok=True)
+    type_map = list(dict.fromkeys(symbols))
+    np.savetxt(
+        os.path.join(sys_dir, "type.raw"),
+        [type_map.index(s) for s in symbols],
+        fmt="%d",
     )
+    np.savetxt(os.path.join(sys_dir, "type_map.raw"), type_map, fmt="%s")
+    if not pbc:
+        open(os.path.join(sys_dir, "nopbc"), "w").close()
+
+
+def write_deepmd_npy(ase_traj, sys_dir, set_size=SET_SIZE, labels=True):
+    """
+    Convert an ASE trajectory of one composition to a DeePMD npy system.
+
+    The frames are read one at a time; existing sets of ``sys_dir`` are
+    replaced.
+
+    Args:
+        ase_traj (str): ASE trajectory file
+        sys_dir (str): System directory
+        set_size (int): Frames per ``set.NNN`` directory
+        labels (bool): Write energies, forces and virials
+
+    Returns:
+        int: Number of frames written
+    """
+    for set_dir in Path(sys_dir).glob("set.*"):
+        shutil.rmtree(set_dir)
+    with Trajectory(str(ase_traj)) as traj:
+        writer = None
+        for atoms in traj:
+            if writer is None:
+                writer = DeepmdWriter(
+                    sys_dir,
+                    atoms.get_chemical_symbols(),
+                    set_size=set_size,
+                    labels=labels,
+                )
+            writer.append(atoms)
+    if writer is None:
+        raise ValueError(f"{ase_traj} has no frames")
+    writer.close()
+    return writer.n_frames
+
+
+# ===================================================================================================#
+# Training / validation split
+# ===================================================================================================#
+VALIDATION_FRACTION = 0.2
+
+
+def assign_split(digest, fraction=VALIDATION_FRACTION):
+    """
+    Training or validation set of a frame, from the hash of its structure.
+
+    The first 64 bits of the (hexadecimal) hash are a uniform number in
+    [0, 1); frames below ``fraction`` are validation frames. The assignment
+    only depends on the frame, so it never changes as the dataset grows.
+
+    Args:
+        digest (str): Hash of the frame (``work_queue.structure_digest``)
+        fraction (float): Fraction of validation frames
+
+    Returns:
+        str: ``"training_data"`` or ``"validation_data"``
+    """
+    if int(digest[:16], 16) / 16**16 < fraction:
+        return "validation_data"
+    return "training_data"
+
+
+def split_indices(digests, fraction=VALIDATION_FRACTION, has_validation=False):
+    """
+    Training and validation indices of frames by ``assign_split``.
+
+    A validation set is needed by ``dp train``: if none of the frames is
+    assigned to it (and ``has_validation`` is false), the frame with the
+    smallest hash is, as it would be with a larger ``fraction``.
+
+    Returns:
+        tuple: (training indices, validation indices)
+    """
+    splits = [assign_split(digest, fraction) for digest in digests]
+    if len(digests) > 1 and not has_validation and "validation_data" not in splits:
+        splits[min(range(len(digests)), key=lambda i: digests[i])] = "validation_data"
+    index_training = [i for i, split in enumerate(splits) if split == "training_data"]
+    index_validation = [
+        i for i, split in enumerate(splits) if split == "validation_data"
+    ]
+    return index_training, index_validation
+
+
+# ===================================================================================================#
+# Near-duplicate pruning
+# ===================================================================================================#
+def prune_near_duplicates(descriptors, tol, reference=None):
+    """
+    Frames to keep when near-duplicates are dropped.
+
+    The frames are taken in order; a frame is dropped if its descriptor lies
+    within ``tol`` of a ``reference`` descriptor (frames kept before) or of
+    a frame kept earlier in the batch. Neighbours are found with k-d trees.
 
+    Args:
+        descriptors (np.ndarray): Descriptors of the new frames (n_frames, n)
+        tol (float): Euclidean descriptor distance of near-duplicates
+        reference (np.ndarray, optional): Descriptors of the kept frames
+
+    Returns:
+        np.ndarray: Indices of the frames to keep
+    """
+    keep = np.ones(len(descriptors), dtype=bool)
+    if not len(descriptors):
+        return np.flatnonzero(keep)
+    if reference is not None and len(reference):
+        dist, _ = cKDTree(reference).query(descriptors, distance_upper_bound=2 * tol)
+        keep &= dist > tol
+    neighbours = cKDTree(descriptors).query_ball_point(descriptors, r=tol)
+    for i in range(len(descriptors)):
+        if keep[i]:
+            for j in neighbours[i]:
+                if j > i:
+                    keep[j] = False
+    return np.flatnonzero(keep)
+
+
+# ===================================================================================================#
+# Incremental dataset
+# ===================================================================================================#
+MANIFEST_FILE = "manifest.json"
+DIGEST_DIR = "digests"
+PRUNED = "pruned"
+
+
+def digest_prefix(digest):
+    """64-bit prefix of a structure hash, as stored in the digest files."""
+    return int(digest[:16], 16)
+
+
+class DatasetBuilder:
+    """
+    DeePMD dataset that grows with the labelled data of every iteration.
+
+    Only the frames that are new since the last update are converted; they
+    are appended as new ``set.NNN`` shards of one system per composition in
+    ``training_data`` and ``validation_data``. The manifest
+    (``manifest.json``) records how many frames of each source trajectory are
+    already included and the shards and frame counts of every system. The
+    structure hashes of the frames (see ``assign_split``) are kept as 64-bit
+    prefixes in append-only files, ``digests/<system>.<set>.u64``, one per
+    set and system (``pruned`` for the frames dropped as near-duplicates). A
+    frame keeps its set for good, and a frame that is already in the dataset
+    is not added again. Shards and hashes written by an update that did not
+    reach the manifest (an interrupted run) are removed and written again.
+
+    Parameters
+    ----------
+    dir_name : str
+        Dataset directory.
+    set_size : int, optional
+        Maximum number of frames of a shard.
+    prune_tol : float, optional
+        Drop new frames whose descriptor (``utils.descriptors``) lies within
+        ``prune_tol`` of a frame of the same composition that is kept. The
+        descriptors of the kept frames are stored in ``descriptors``.
+        Disabled if None.
+    """
+
+    def __init__(self, dir_name, set_size=SET_SIZE, prune_tol=None):
+        self.dir_name = Path(dir_name)
+        self.set_size = set_size
+        self.prune_tol = prune_tol
+        self.pruned = 0
+        self._kept = {}
+        self._digests = {}
+        self._prefix_sets = {}
+        self.manifest_file = self.dir_name / MANIFEST_FILE
+        if self.manifest_file.exists():
+            with open(self.manifest_file) as f:
+                self.manifest = json.load(f)
+            # Hashes of older manifests are rebuilt from the sets
+            self.manifest.pop("frames", None)
+        else:
+            self.manifest = {"sources": {}, "systems": {}}
+            # A dataset written without a manifest is rewritten as a whole
+            for split in ("training_data", "validation_data"):
+                if (self.dir_name / split).exists():
+                    SparcLog(f"Rebuilding {self.dir_name / split} (no manifest)")
+                    shutil.rmtree(self.dir_name / split)
+        self._remove_orphan_sets()
+
+    def _remove_orphan_sets(self):
+        systems = self.manifest["systems"]
+        for split in ("training_data", "validation_data"):
+            for set_dir in (self.dir_name / split).glob("*/set.*"):
+                system = systems.get(set_dir.parent.name)
+                if (
+                    system is None
+                    or not set_dir.suffix[1:].isdigit()
+                    or int(set_dir.suffix[1:]) >= system[split]["sets"]
+                ):
+                    shutil.rmtree(set_dir)
+
+    def update(self, ase_traj, skip_min=0, skip_max=None):
+        """
+        Add the frames of ``ase_traj`` that are not in the dataset yet.
+
+        The frames ``[skip_min:skip_max]`` of a new source are added; frames
+        appended to the source later are all added by the next update.
+
+        Args:
+            ase_traj (str): ASE trajectory file
+            skip_min (int): Skip the first n frames
+            skip_max (int): Skip the frames from index ``skip_max`` on
+
+        Returns:
+            int: Number of frames added
+        """
+        key = str(ase_traj)
+        with Trajectory(key) as traj:
+            n_frames = len(traj)
+            done = self.manifest["sources"].get(key, {}).get("frames")
+            if done is None:
+                indices = range(n_frames)[skip_min:skip_max]
+            elif done <= n_frames:
+                indices = range(done, n_frames)
+            else:
+                raise ValueError(
+                    f"{key} has {n_frames} frames, {done} are already in the dataset"
+                )
+
+            # Frames already in the dataset (from another source) are skipped
+            new, compositions = {}, {}
+            for i in indices:
+                atoms = traj[i]
+                digest = structure_digest(atoms)
+                symbols = tuple(atoms.get_chemical_symbols())
+                name = self._find_system(symbols)
+                if digest in new or (
+                    name is not None and digest_prefix(digest) in self._known(name)
+                ):
+                    continue
+                new[digest] = i
+                if self.prune_tol is not None:
+                    compositions.setdefault(symbols, []).append(
+                        (digest, self._descriptor(atoms))
+                    )
+            if len(new) < len(indices):
+                SparcLog(
+                    f"Skipped {len(indices) - len(new)} frames already in the dataset"
+                )
+
+            # Near-duplicates of kept frames of the same composition are dropped
+            self.pruned = 0
+            recorded = {}
+            for symbols, rows in compositions.items():
+                name = self._system_name(symbols)
+                kept_before = self._descriptors(name)
+                batch = np.array([row for _, row in rows])
+                keep = prune_near_duplicates(batch, self.prune_tol, kept_before)
+                for j in sorted(set(range(len(rows))) - set(keep)):
+                    recorded.setdefault((name, PRUNED), []).append(rows[j][0])
+                    del new[rows[j][0]]
+                self.pruned += len(rows) - len(keep)
+                self._kept[name] = np.vstack([kept_before, batch[keep]])
+            if self.pruned:
+                self.manifest["pruned"] = self.manifest.get("pruned", 0) + self.pruned
+                SparcLog(f"Pruned {self.pruned} near-duplicate frames")
+
+            digests = list(new)
+            index_training, index_validation = split_indices(
+                digests, has_validation=self.n_frames("validation_data") > 0
+            )
+            splits = {}
+            for split, subset in (
+                ("training_data", index_training),
+                ("validation_data", index_validation),
+            ):
+                for j in subset:
+                    splits[digests[j]] = split
+
+            # One system per composition (same atoms in the same order)
+            writers = {}
+            for digest, i in new.items():
+                atoms = traj[i]
+                symbols = tuple(atoms.get_chemical_symbols())
+                name = self._system_name(symbols)
+                split = splits[digest]
+                recorded.setdefault((name, split), []).append(digest)
+                if (name, split) not in writers:
+                    writers[name, split] = DeepmdWriter(
+                        self.dir_name / split / name,
+                        symbols,
+                        set_size=self.set_size,
+                        first_set=self.manifest["systems"][name][split]["sets"],
+                    )
+                writers[name, split].append(atoms)
+            for (name, split), new_digests in recorded.items():
+                self._append_digests(name, split, new_digests)
+                if split == PRUNED:
+                    system = self.manifest["systems"][name]
+                    system[PRUNED] = system.get(PRUNED, 0) + len(new_digests)
+            for (name, split), writer in writers.items():
+                writer.close()
+                system = self.manifest["systems"][name][split]
+                system["sets"], system["frames"] = (
+                    writer.n_sets,
+                    system["frames"] + writer.n_frames,
+                )
+
+        self.manifest["sources"][key] = {"frames": n_frames}
+        self.save()
+        return len(new)
+
+    def _descriptor(self, atoms):
+        species = list(dict.fromkeys(atoms.get_chemical_symbols()))
+        return pair_distance_histogram(atoms, species, R_MAX, N_BINS)
+
+    def _descriptors(self, name):
+        """Descriptors of the frames of system ``name`` already in the dataset."""
+        if name in self._kept:
+            return self._kept[name]
+        filename = self.dir_name / "descriptors" / f"{name}.npy"
+        system = self.manifest["systems"][name]
+        n_frames = (
+            system["training_data"]["frames"] + system["validation_data"]["frames"]
+        )
+        if filename.exists():
+            descriptors = np.load(filename)
+        else:
+            descriptors = np.empty((0, self._descriptor(Atoms(system["symbols"])).size))
+        if len(descriptors) != n_frames:
+            # Pruning was enabled on an existing dataset
+            descriptors = np.array(
+                [self._descriptor(atoms) for atoms in self.frames(name)]
+            ).reshape(n_frames, -1)
+        self._kept[name] = descriptors
+        return descriptors
+
+    def _digest_file(self, name, split):
+        return self.dir_name / DIGEST_DIR / f"{name}.{split}.u64"
+
+    def digests(self, name):
+        """
+        Hash prefixes (``digest_prefix``) of the frames of system ``name``.
+
+        Hashes beyond the counts of the manifest (an interrupted update) are
+        cut off; missing hashes of a set are computed again from its shards.
+
+        Returns:
+            dict: uint64 array of every set (and of ``pruned``)
+        """
+        if name in self._digests:
+            return self._digests[name]
+        system = self.manifest["systems"][name]
+        digests = {}
+        for split in ("training_data", "validation_data", PRUNED):
+            n_frames = system.get(split, 0)
+            if split != PRUNED:
+                n_frames = n_frames["frames"]
+            filename = self._digest_file(name, split)
+            prefixes = np.empty(0, dtype="<u8")
+            if filename.exists():
+                prefixes = np.fromfile(filename, dtype="<u8")
+                if len(prefixes) > n_frames:
+                    os.truncate(filename, 8 * n_frames)
+                    prefixes = prefixes[:n_frames]
+            if len(prefixes) < n_frames and split != PRUNED:
+                prefixes = np.array(
+                    [
+                        digest_prefix(structure_digest(atoms))
+                        for atoms in self.frames(name, splits=(split,))
+                    ],
+                    dtype="<u8",
+                )
+                filename.parent.mkdir(parents=True, exist_ok=True)
+                prefixes.tofile(filename)
+            elif len(prefixes) < n_frames:
+                system[PRUNED] = len(prefixes)
+            digests[split] = prefixes
+        self._digests[name] = digests
+        return digests
+
+    def _known(self, name):
+        """Set of the hash prefixes recorded for system ``name``."""
+        if name not in self._prefix_sets:
+            self._prefix_sets[name] = set().union(
+                *(prefixes.tolist() for prefixes in self.digests(name).values())
+            )
+        return self._prefix_sets[name]
+
+    def _append_digests(self, name, split, digests):
+        prefixes = np.array([digest_prefix(d) for d in digests], dtype="<u8")
+        recorded = self.digests(name)
+        filename = self._digest_file(name, split)
+        filename.parent.mkdir(parents=True, exist_ok=True)
+        with open(filename, "ab") as f:
+            prefixes.tofile(f)
+        recorded[split] = np.concatenate([recorded[split], prefixes])
+        if name in self._prefix_sets:
+            self._prefix_sets[name].update(prefixes.tolist())
+
+    def frames(self, name, splits=("training_data", "validation_data")):
+        """Frames of system ``name`` (coordinates and cells), read from the sets."""
+        system = self.manifest["systems"][name]
+        symbols = system["symbols"]
+        for split in splits:
+            sys_dir = self.dir_name / split / name
+            pbc = not (sys_dir / "nopbc").exists()
+            for k in range(system[split]["sets"]):
+                set_dir = sys_dir / f"set.{k:03d}"
+                coords = np.load(set_dir / "coord.npy").reshape(-1, len(symbols), 3)
+                boxes = np.load(set_dir / "box.npy").reshape(-1, 3, 3)
+                for positions, cell in zip(coords, boxes):
+                    yield Atoms(symbols, positions=positions, cell=cell, pbc=pbc)
+
+    def _find_system(self, symbols):
+        for name, system in self.manifest["systems"].items():
+            if tuple(system["symbols"]) == symbols:
+                return name
+        return None
+
+    def _system_name(self, symbols):
+        name = self._find_system(symbols)
+        if name is not None:
+            return name
+        formula = Atoms(symbols).get_chemical_formula()
+        name, n = formula, 1
+        while name in self.manifest["systems"]:
+            name, n = f"{formula}_{n}", n + 1
+        self.manifest["systems"][name] = {
+            "symbols": list(symbols),
+            "training_data": {"sets": 0, "frames": 0},
+            "validation_data": {"sets": 0, "frames": 0},
+        }
+        return name
+
+    def save(self):
+        """Write the manifest (atomically) and the descriptors of pruning."""
+        self.dir_name.mkdir(parents=True, exist_ok=True)
+        if self._kept:
+            os.makedirs(self.dir_name / "descriptors", exist_ok=True)
+            for name, descriptors in self._kept.items():
+                np.save(self.dir_name / "descriptors" / f"{name}.npy", descriptors)
+        tmp = f"{self.manifest_file}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp, self.manifest_file)
+
+    def n_frames(self, split="training_data"):
+        """Number of frames of ``split`` in the dataset."""
+        return sum(s[split]["frames"] for s in self.manifest["systems"].values())
+
+
+def build_dataset(
+    trajfilename, current_iter, dir_name, skip_min=0, skip_max=None, prune_tol=None
+):
+    """
+    Add the labelled frames of all iterations up to ``current_iter`` to the
+    dataset in ``dir_name``.
+
+    Every ``iter_NNNNNN/00.dft/<trajfilename>`` is a source of the dataset;
+    only its frames that are new since the last build are converted.
+
+    Args:
+        trajfilename (str): Name of the trajectory file of the iterations
+        current_iter (int): Current iteration number
+        dir_name (str): Dataset directory
+        skip_min (int): Skip the first n frames of a new source
+        skip_max (int): Skip the frames of a new source from index ``skip_max`` on
+        prune_tol (float): Descriptor tolerance of near-duplicate frames (None: keep all)
+
+    Returns:
+        DatasetBuilder: The updated dataset
+    """
+    builder = DatasetBuilder(dir_name, prune_tol=prune_tol)
+    for i in range(current_iter + 1):
+        dft_traj = Path(f"iter_{i:06d}") / "00.dft" / trajfilename
+
+        SparcLog(f" Iteration [{i}]".ljust(20))
+        SparcLog(f" → Checking File    : {dft_traj}")
+        if dft_traj.exists():
+            added = builder.update(dft_traj, skip_min, skip_max)
+            if prune_tol is not None:
+                SparcLog(f" → Pruned Frames    : {builder.pruned}")
+            SparcLog(f" → Added Frames     : {added}\n")
+
+    n_training, n_validation = (
+        builder.n_frames("training_data"),
+        builder.n_frames("validation_data"),
+    )
+    if not n_training + n_validation:
+        raise ValueError("No trajectory data found from any iteration")
+    SparcLog("========================================================================")
+    SparcLog(
+        f" Dataset: {n_training} training and {n_validation} validation frames".center(
+            72
+        )
+    )
+    SparcLog("========================================================================")
+    return builder
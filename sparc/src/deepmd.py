@@ -24,6 +24,13 @@ from deepmd.calculator import DP
 
 ################################################################
 # Local import
+from sparc.src.committee_training import (
+    DONE,
+    STATUS_FILE,
+    Pipeline,
+    core_slices,
+    run_pipelines,
+)
 from sparc.src.utils.logger import SparcLog
 
 ################################################################
@@ -134,6 +141,25 @@ def evaluate_model_accuracy(model_path, test_data_path):
 # ===================================================================================================#
 
 
+def data_systems(path):
+    """
+    List the DeePMD systems below ``path``.
+
+    ``dp train`` only expands ``systems`` given as a string, so the systems of
+    a multi-composition dataset (one sub-directory per composition) are listed
+    explicitly.
+
+    Args:
+        path: str
+            Dataset directory
+
+    Returns:
+        list: Directories holding a ``type.raw`` file, ``[path]`` if none is found
+    """
+    systems = sorted(root for root, _, files in os.walk(path) if "type.raw" in files)
+    return systems or [path]
+
+
 def update_json(data, datadir, atom_types):
     """
     Update the DeepMD input JSON configuration with random seeds and proper paths.
@@ -160,9 +186,13 @@ def update_json(data, datadir, atom_types):
                 elif key == "type_map":
                     data[key] = atom_types
                 elif key == "training_data" and isinstance(value, dict):
-                    value["systems"] = [os.path.join(datadir, "training_data")]
+                    value["systems"] = data_systems(
+                        os.path.join(datadir, "training_data")
+                    )
                 elif key == "validation_data" and isinstance(value, dict):
-                    value["systems"] = [os.path.join(datadir, "validation_data")]
+                    value["systems"] = data_systems(
+                        os.path.join(datadir, "validation_data")
+                    )
                 elif isinstance(value, (dict, list)):
                     _update_recursively(value)
         elif isinstance(data, list):
@@ -181,6 +211,8 @@ def deepmd_training(
     training_dir: str,
     num_models: int,
     input_file: str = "input.json",
+    parallel: bool = False,
+    cores_per_model: int | None = None,
 ):
     """
     Train DeepMD models for molecular potential energy surface representation.
@@ -191,6 +223,10 @@ def deepmd_training(
     3. Training multiple models with different initializations
     4. Freezing and compressing the trained models
 
+    With ``parallel`` the models are trained at the same time, each by its own
+    ``dp train``/``freeze``/``compress`` subprocesses on its own slice of cores
+    (see ``committee_training``).
+
     Args:
         active_learning: bool
             Whether this training is part of an active learning cycle
@@ -204,6 +240,11 @@ def deepmd_training(
             Number of models to train (minimum: 2)
         input_file: str, optional
             Path to DeepMD input JSON file (default: 'input.json')
+        parallel: bool, optional
+            Train the models concurrently (default: False)
+        cores_per_model: int, optional
+            Cores of every model in parallel training (default: the available
+            cores shared evenly)
 
     Returns:
         str: Name of the frozen model file
@@ -250,6 +291,11 @@ def deepmd_training(
     SparcLog(f"          DEEPMD WILL TRAIN {num_models} MODELS !")
     SparcLog("========================================================================")
 
+    if parallel:
+        return parallel_training(
+            datadir, atom_types, training_dir, num_models, input_file, cores_per_model
+        )
+
     # Loop through the required number of models
     for i in range(1, num_models + 1):
         # Define the training folder name
@@ -345,3 +391,88 @@ def deepmd_training(
 
     return frozen_model_name
 
+
+def parallel_training(
+    datadir, atom_types, training_dir, num_models, input_file, cores_per_model=None
+):
+    """
+    Train the DeepMD models concurrently.
+
+    Every model is trained in ``training_dir/training_<i>`` by a pipeline of
+    ``dp train`` (resumed from ``model.ckpt`` if a checkpoint exists), ``dp
+    freeze`` and ``dp compress`` running on its own slice of cores. The state
+    of every model is written to ``training_status.json`` in ``training_dir``
+    and the output of its commands to ``train.log`` in its folder.
+
+    Args:
+        datadir: str
+            Path to directory containing training and validation data
+        atom_types: list
+            List of atomic species in the system
+        training_dir: str
+            Path to the directory where models will be trained
+        num_models: int
+            Number of models to train
+        input_file: str
+            Path to DeepMD input JSON file
+        cores_per_model: int, optional
+            Cores of every model (default: the available cores shared evenly)
+
+    Returns:
+        str: Name of the frozen model file of the last model
+    """
+    input_path = os.path.abspath(input_file)
+    if not os.path.exists(input_path):
+        raise FileNotFoundError(f"Input file not found: {input_path}")
+    input_name = os.path.basename(input_file)
+
+    pipelines = []
+    for i, cores in enumerate(core_slices(num_models, cores_per_model), start=1):
+        dir_name = os.path.join(training_dir, f"training_{i}")
+        os.makedirs(dir_name, exist_ok=True)
+        with open(input_path) as f:
+            config_data = json.load(f)
+        update_json(config_data, os.path.abspath(datadir), atom_types)
+        with open(os.path.join(dir_name, input_name), "w") as f:
+            json.dump(config_data, f, indent=4)
+
+        train = ["dp", "train", input_name]
+        if os.path.exists(os.path.join(dir_name, "checkpoint")):
+            SparcLog(f"[INFO] Checkpoint file found | Resuming training in {dir_name}")
+            train += ["-r", "model.ckpt"]
+        frozen_model_name = f"frozen_model_{i}.pb"
+        commands = [
+            train,
+            ["dp", "freeze", "-o", frozen_model_name],
+            [
+                "dp",
+                "compress",
+                "-t",
+                input_name,
+                "-i",
+                frozen_model_name,
+                "-o",
+                f"frozen_model_compressed_{i}.pb",
+            ],
+        ]
+        pipelines.append(Pipeline(f"training_{i}", dir_name, commands, cores))
+
+    states = run_pipelines(
+        pipelines, status_file=os.path.join(training_dir, STATUS_FILE)
+    )
+
+    failed = [name for name, state in states.items() if state != DONE]
+    if failed:
+        SparcLog(
+            f"Training failed for {', '.join(failed)} "
+            f"(see {os.path.join(training_dir, STATUS_FILE)})",
+            level="ERROR",
+        )
+    for i in range(1, num_models + 1):
+        if states[f"training_{i}"] == DONE:
+            dir_name = os.path.join(training_dir, f"training_{i}")
+            evaluate_model_accuracy(
+                f"{dir_name}/frozen_model_{i}.pb", f"{datadir}/validation_data"
+            )
+
+    return f"frozen_model_{num_models}.pb"
@@ -0,0 +1,208 @@
+# dft_cache.py
+"""
+Content-addressed cache of DFT single points.
+
+A result is stored under the hash of the structure (atomic numbers, rounded
+positions and cell, pbc) and of the effective DFT setup: the INCAR keywords
+plus ``prec``/``kgamma``/``xc``/``pp`` for VASP, the ``cp2k`` section plus
+the input template for CP2K. Settings that do not change the result (the
+executable, the working directory, SCF restart seeding) are not part of the
+key. Keyword overrides of a retry attempt (e.g. a higher ``ALGO`` or mixing
+rung) are hashed with the setup, so their results never answer a lookup with
+the unmodified setup. Every entry is a small ``.npz`` file named after its key, written
+atomically, so concurrent jobs can share one cache directory and a campaign
+re-run with an unchanged setup finds its previous results.
+"""
+
+################################################################
+import hashlib
+import json
+import os
+
+import numpy as np
+
+################################################################
+# Third party import
+from ase.calculators.calculator import (
+    Calculator,
+    PropertyNotImplementedError,
+    all_changes,
+)
+
+################################################################
+# Local import
+from sparc.src.utils.logger import SparcLog
+from sparc.src.utils.read_incar import parse_incar
+
+# Properties stored for every single point
+CACHED_PROPERTIES = ("energy", "free_energy", "forces", "stress")
+
+
+# ===================================================================================================#
+def setup_fingerprint(config):
+    """
+    Effective DFT parameters that determine the result of a single point.
+
+    Args:
+        config (dict): Full SPARC configuration
+
+    Returns:
+        dict: JSON-serialisable parameters
+    """
+    dft_config = config["dft_calculator"]
+    name = dft_config["name"].lower()
+    if name == "vasp":
+        return {
+            "name": name,
+            "prec": dft_config.get("prec"),
+            "kgamma": dft_config.get("kgamma"),
+            "xc": dft_config.get("xc", "PBE"),
+            "pp": dft_config.get("pp", "PBE"),
+            "incar": parse_incar(dft_config["incar_file"]),
+        }
+    template = ""
+    if os.path.exists("cp2k_template.inp"):
+        with open("cp2k_template.inp") as f:
+            template = f.read()
+    params = {k: v for k, v in config.get("cp2k", {}).items() if k != "label"}
+    return {"name": name, "cp2k": params, "template": template}
+
+
+# ===================================================================================================#
+class DFTCache:
+    """
+    Persistent store of DFT energies, forces and stresses.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Directory of the cache entries.
+    config : dict
+        Full SPARC configuration; its DFT setup is part of every key.
+    decimals : int, optional
+        Decimals of the positions and cell (Å) in the key (default: 6).
+    """
+
+    def __init__(self, cache_dir, config, decimals=6):
+        self.cache_dir = str(cache_dir)
+        self.decimals = decimals
+        fingerprint = json.dumps(setup_fingerprint(config), sort_keys=True, default=str)
+        self.setup_hash = hashlib.sha256(fingerprint.encode()).hexdigest()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, atoms, overrides=None):
+        """Hash of the structure, of the DFT setup and of its keyword overrides."""
+        h = hashlib.sha256(self.setup_hash.encode())
+        if overrides:
+            h.update(json.dumps(overrides, sort_keys=True, default=str).encode())
+        h.update(np.ascontiguousarray(atoms.numbers, dtype=np.int64).tobytes())
+        for array in (atoms.positions, atoms.cell.array):
+            rounded = np.round(np.asarray(array, dtype=np.float64), self.decimals)
+            h.update((rounded + 0.0).tobytes())  # + 0.0 folds -0.0 into 0.0
+        h.update(np.asarray(atoms.pbc, dtype=bool).tobytes())
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.npz")
+
+    def get(self, atoms, overrides=None):
+        """
+        Cached results of ``atoms``.
+
+        Args:
+            atoms (ase.Atoms): Structure
+            overrides (dict, optional): Keyword overrides of the DFT setup
+
+        Returns:
+            dict or None: Results (``energy``, ``forces``, ...), None on a miss
+        """
+        path = self._path(self.key(atoms, overrides))
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        with np.load(path) as data:
+            results = {name: data[name] for name in data.files}
+        for name in ("energy", "free_energy"):
+            if name in results:
+                results[name] = float(results[name])
+        self.hits += 1
+        return results
+
+    def put(self, atoms, results, overrides=None):
+        """Store the results of ``atoms`` (missing properties are skipped)."""
+        path = self._path(self.key(atoms, overrides))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        arrays = {
+            name: np.asarray(results[name])
+            for name in CACHED_PROPERTIES
+            if results.get(name) is not None
+        }
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp, path)
+
+
+def dft_cache(config):
+    """DFT cache of the configuration, None if ``dft_calculator.cache_dir`` is unset."""
+    cache_dir = config["dft_calculator"].get("cache_dir")
+    if not cache_dir:
+        return None
+    return DFTCache(cache_dir, config)
+
+
+# ===================================================================================================#
+class CachedCalculator(Calculator):
+    """
+    Calculator answering from a ``DFTCache`` before running the DFT code.
+
+    Parameters
+    ----------
+    calc : ase.calculators.calculator.Calculator
+        DFT calculator run on cache misses.
+    cache : DFTCache
+        Cache consulted and filled by every calculation.
+    validate : callable, optional
+        Called with ``calc`` after a calculation; raises to keep the result
+        out of the cache (e.g. an unconverged SCF).
+    overrides : dict, optional
+        Keyword overrides applied to ``calc``; part of the cache key.
+    """
+
+    implemented_properties = list(CACHED_PROPERTIES)
+
+    def __init__(self, calc, cache, validate=None, overrides=None):
+        super().__init__()
+        self.calc = calc
+        self.cache = cache
+        self.validate = validate
+        self.overrides = overrides
+
+    def calculate(self, atoms=None, properties=("energy",), system_changes=all_changes):
+        if self.results and not system_changes:
+            # Everything the DFT code provided is already in the results
+            raise PropertyNotImplementedError(f"{properties} not available")
+        super().calculate(atoms, properties, system_changes)
+        results = self.cache.get(self.atoms, self.overrides)
+        if results is not None:
+            SparcLog("DFT result taken from the cache")
+            self.results = results
+            return
+
+        atoms = self.atoms.copy()
+        self.calc.get_potential_energy(atoms)
+        self.calc.get_forces(atoms)
+        if self.validate is not None:
+            self.validate(self.calc)
+        self.results = {
+            name: self.calc.results[name]
+            for name in CACHED_PROPERTIES
+            if self.calc.results.get(name) is not None
+        }
+        self.cache.put(self.atoms, self.results, self.overrides)
+
+
+# ===================================================================================================#
+#                                     END OF FILE
+# ===================================================================================================#
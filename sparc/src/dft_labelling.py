@@ -0,0 +1,668 @@
+# dft_labelling.py
+"""
+Concurrent DFT labelling of active learning candidates.
+
+Every candidate is computed in its own working directory
+(``00.dft/jobs/NNNN``), so several DFT jobs can run at the same time. A pool
+of ``workers`` processes is started; each worker owns a slot of
+``cores_per_job`` cores that is substituted into the command template and,
+optionally, pinned with ``sched_setaffinity``. With a job ``backend`` the
+inputs are written by SPARC and the DFT runs are submitted to a batch system
+(see ``scheduler``) while the driver only polls. ``label_structures``
+returns the results in input order, whatever order the jobs finish in, and
+``label_candidates`` writes them to the iteration dataset as one batch.
+With ``restart_seed`` every job starts its SCF from the wavefunction of the
+closest finished job (see ``restart_seed``). With ``cp2k_session`` CP2K
+candidates of the same composition are fed to one long-lived ``cp2k_shell``
+per worker instead of starting CP2K for every candidate. Jobs that fail,
+exceed ``timeout`` or do not converge are retried along the ``retry``
+ladder and quarantined if every attempt fails (see ``convergence``).
+The state of every candidate is kept in a persistent work queue in the DFT
+directory (see ``work_queue``): workers claim candidates from it and every
+finished candidate is saved at once, so a restarted run skips the finished
+candidates and computes the unfinished ones.
+"""
+
+################################################################
+import copy
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+################################################################
+# Third party import
+from ase.calculators.singlepoint import SinglePointCalculator
+from ase.io import read, write
+
+################################################################
+# Local import
+from sparc.src.calculator import close_cp2k_session, cp2k_session, dft_calculator
+from sparc.src.convergence import (
+    Quarantine,
+    SCFConvergenceError,
+    check_convergence,
+    describe,
+    retry_ladder,
+    wall_clock_limit,
+    with_timeout,
+)
+from sparc.src.dft_cache import CachedCalculator, dft_cache
+from sparc.src.restart_seed import RestartSeeds
+from sparc.src.scheduler import DONE, FAILED, get_backend
+from sparc.src.utils.logger import SparcLog
+from sparc.src.utils.utils import save_frames
+from sparc.src.work_queue import QUEUE_FILE, WorkQueue
+
+# Labelled structure of a finished candidate, inside its job directory
+RESULT_FILE = "labelled.traj"
+
+# Slot of the current worker process, set by ``_init_worker``
+_SLOT = {}
+
+
+# ===================================================================================================#
+def slot_fields(slot, cores_per_job):
+    """
+    Placeholders of the command and environment templates of a worker slot.
+
+    Returns:
+        dict: ``slot``, ``cores`` and ``cpu_list`` (e.g. ``16-31``)
+    """
+    first = slot * cores_per_job
+    return {
+        "slot": slot,
+        "cores": cores_per_job,
+        "cpu_list": f"{first}-{first + cores_per_job - 1}",
+    }
+
+
+def _init_worker(slots, settings):
+    """Claim a slot and set up the environment of a worker process."""
+    slot = slots.get()
+    cores_per_job = settings.get("cores_per_job", 1)
+    fields = slot_fields(slot, cores_per_job)
+    _SLOT.update(fields)
+
+    for key, value in (settings.get("env") or {}).items():
+        os.environ[key] = str(value).format(**fields)
+    if settings.get("pin_cores") and hasattr(os, "sched_setaffinity"):
+        first = slot * cores_per_job
+        os.sched_setaffinity(0, range(first, first + cores_per_job))
+
+
+def _job_config(config, settings, fields):
+    """Configuration of one job with the command template filled in."""
+    template = settings.get("exe_command")
+    if not template:
+        return config
+    job_config = copy.deepcopy(config)
+    job_config["dft_calculator"]["exe_command"] = template.format(**fields)
+    return job_config
+
+
+def restart_seeds(config, dir_name):
+    """
+    Restart seeds of the jobs of all iterations, None if seeding is disabled.
+
+    Args:
+        config (dict): Full SPARC configuration
+        dir_name (str): DFT directory of the current iteration (``iter_N/00.dft``)
+    """
+    settings = config.get("labelling", {})
+    if not settings.get("restart_seed"):
+        return None
+    dft_dir = os.path.abspath(str(dir_name))
+    pattern = os.path.join(
+        os.path.dirname(os.path.dirname(dft_dir)),
+        "iter_*",
+        os.path.basename(dft_dir),
+        "jobs",
+        "*",
+    )
+    return RestartSeeds(
+        config["dft_calculator"]["name"],
+        pattern=pattern,
+        max_rmsd=settings.get("seed_max_rmsd", 1.0),
+    )
+
+
+def _use_session(config):
+    """Whether CP2K candidates run in a persistent ``cp2k_shell`` session."""
+    return bool(config.get("labelling", {}).get("cp2k_session")) and (
+        config["dft_calculator"]["name"].lower() == "cp2k"
+    )
+
+
+def single_point(atoms):
+    """
+    Run the calculator of ``atoms`` and keep its results.
+
+    Returns:
+        ase.Atoms: Copy of ``atoms`` with a single point calculator holding the
+        energy, forces and, when the code provides it, the stress
+    """
+    results = {
+        "energy": atoms.get_potential_energy(),
+        "forces": atoms.get_forces(),
+    }
+    try:
+        results["stress"] = atoms.get_stress()
+    except NotImplementedError:
+        pass
+    labelled = atoms.copy()
+    labelled.calc = SinglePointCalculator(labelled, **results)
+    return labelled
+
+
+def _attach_calculator(
+    config, atoms, job_dir, seeds=None, cache=None, session=None, overrides=None
+):
+    """
+    Attach the DFT calculator of one candidate.
+
+    ``job_dir`` None runs in the configured directory; ``session`` is the
+    directory of a persistent CP2K session, None to start a new calculator.
+
+    Returns:
+        Calculator: DFT calculator (inside the cache wrapper, if any)
+    """
+    if session is not None and _use_session(config):
+        calc = cp2k_session(config, atoms, session)
+        overrides = None
+    else:
+        calc = dft_calculator(config, False, job_dir)
+        if seeds is not None and job_dir is not None:
+            seeds.seed(atoms, calc, job_dir)
+        if overrides:
+            calc.set(**overrides)
+    atoms.calc = calc
+    if cache is not None:
+        atoms.calc = CachedCalculator(
+            calc, cache, validate=check_convergence, overrides=overrides
+        )
+    return calc
+
+
+def _timeout_config(config, settings):
+    """Configuration with the wall-clock limit of ``labelling.timeout`` applied."""
+    if not settings.get("timeout"):
+        return config
+    job_config = copy.deepcopy(config)
+    job_config["dft_calculator"]["exe_command"] = with_timeout(
+        job_config["dft_calculator"].get("exe_command", ""), settings["timeout"]
+    )
+    return job_config
+
+
+def _compute(config, settings, atoms, job_dir, seeds=None, cache=None, session=None):
+    """
+    Label one structure, retrying along the ladder of ``labelling.retry``.
+
+    Every attempt starts a new calculator (the persistent CP2K session is
+    only used for the first one) and must finish within ``labelling.timeout``
+    with a converged SCF. New calculators run under ``timeout``; a step of
+    the session, whose shell outlives the attempt, is interrupted by an
+    alarm instead and the session is closed.
+
+    Raises:
+        SCFConvergenceError: if every attempt failed
+    """
+    timed_config = _timeout_config(config, settings)
+    ladder = retry_ladder(settings)
+    for attempt, overrides in enumerate(ladder, start=1):
+        candidate = atoms.copy()
+        in_session = attempt == 1 and session is not None and _use_session(config)
+        try:
+            with wall_clock_limit(settings.get("timeout") if in_session else None):
+                calc = _attach_calculator(
+                    config if in_session else timed_config,
+                    candidate,
+                    job_dir,
+                    seeds if attempt == 1 else None,
+                    cache,
+                    session if in_session else None,
+                    overrides,
+                )
+                labelled = single_point(candidate)
+            if cache is None:
+                check_convergence(calc)
+            return labelled
+        except Exception as e:
+            error = e
+            SparcLog(
+                f"Attempt {attempt}/{len(ladder)} ({describe(overrides)}) failed: {e}",
+                level="WARNING",
+            )
+            if in_session:
+                close_cp2k_session()
+    raise SCFConvergenceError(f"Failed after {len(ladder)} attempts: {error}")
+
+
+def _label_candidate(config, settings, atoms, job_dir, seeds=None, cache=None):
+    """
+    Compute one candidate in ``job_dir`` (runs in a worker process).
+
+    Returns:
+        ase.Atoms: Candidate with a single point calculator holding the results
+    """
+    os.makedirs(job_dir, exist_ok=True)
+    session = os.path.join(os.path.dirname(job_dir), f"session_{_SLOT['slot']}")
+    job_config = _job_config(config, settings, _SLOT)
+    return _compute(job_config, settings, atoms, job_dir, seeds, cache, session)
+
+
+def _job_dir(dir_name, idx):
+    return os.path.join(str(dir_name), "jobs", f"{idx:04d}")
+
+
+def _store_result(queue, idx, labelled, dir_name):
+    """Save the labelled structure of candidate ``idx`` and mark it done."""
+    job_dir = _job_dir(dir_name, idx)
+    os.makedirs(job_dir, exist_ok=True)
+    result = os.path.join(job_dir, RESULT_FILE)
+    tmp = f"{result}.tmp"
+    write(tmp, labelled, format="traj")
+    os.replace(tmp, result)
+    queue.finish(idx, result)
+
+
+def _label_worker(
+    config, settings, queue, structures, dir_name, seeds=None, cache=None
+):
+    """
+    Claim and label candidates until none is pending (runs in a worker process).
+
+    Args:
+        queue (WorkQueue): Work queue of the iteration
+        structures (dict): ase.Atoms of every candidate index
+    """
+    while (idx := queue.claim(structures)) is not None:
+        try:
+            labelled = _label_candidate(
+                config, settings, structures[idx], _job_dir(dir_name, idx), seeds, cache
+            )
+        except Exception as e:
+            SparcLog(f"Candidate {idx} failed: {e}", level="ERROR")
+            queue.fail(idx, e)
+            continue
+        _store_result(queue, idx, labelled, dir_name)
+
+
+def prepare_job(config, atoms, job_dir, seeds=None, overrides=None):
+    """
+    Write the DFT input of a candidate to ``job_dir`` without running it.
+
+    Only VASP inputs can be written ahead of the run; ``load_config`` rejects
+    a job backend with CP2K.
+
+    Returns:
+        tuple: (atoms, calculator) used by ``collect_job``
+    """
+    os.makedirs(job_dir, exist_ok=True)
+    atoms = atoms.copy()
+    calc = dft_calculator(config, False, job_dir)
+    if seeds is not None:
+        seeds.seed(atoms, calc, job_dir)
+    if overrides:
+        calc.set(**overrides)
+    calc.write_input(atoms)
+    return atoms, calc
+
+
+def collect_job(atoms, calc):
+    """
+    Read the results of a finished job written by ``prepare_job``.
+
+    Returns:
+        ase.Atoms: Candidate with a single point calculator holding the results
+
+    Raises:
+        SCFConvergenceError: if the SCF of the job did not converge
+    """
+    calc.update_atoms(atoms)
+    calc.read_results()
+    check_convergence(calc)
+    results = {
+        key: calc.results[key]
+        for key in ("energy", "forces", "stress")
+        if calc.results.get(key) is not None
+    }
+    atoms = atoms.copy()
+    atoms.calc = SinglePointCalculator(atoms, **results)
+    return atoms
+
+
+def _label_with_backend(
+    config, settings, queue, candidates, dir_name, seeds=None, cache=None
+):
+    """
+    Submit the candidates to the job backend and wait for their results.
+
+    At most ``max_jobs`` jobs are queued at once; outstanding jobs are
+    cancelled if the driver is interrupted. Candidates found in the DFT
+    cache are not submitted. Failed or unconverged jobs are resubmitted
+    with the next rung of the retry ladder. Results and failures are
+    recorded in ``queue``.
+    """
+    backend = get_backend(settings)
+    max_jobs = settings.get("max_jobs") or len(candidates)
+    poll_interval = settings.get("poll_interval", 30)
+    ladder = retry_ladder(settings)
+    command = _job_config(
+        config, settings, slot_fields(0, settings.get("cores_per_job", 1))
+    )["dft_calculator"]["exe_command"]
+    command = with_timeout(command, settings.get("timeout"))
+
+    pending = [(idx, atoms, 0) for idx, atoms in candidates]
+    jobs = {}
+    try:
+        while pending or jobs:
+            while pending and len(jobs) < max_jobs:
+                idx, atoms, rung = pending.pop(0)
+                if not rung and queue.claim([idx]) is None:
+                    continue
+                cached = cache.get(atoms) if cache is not None and not rung else None
+                if cached is not None:
+                    SparcLog(f"Candidate {idx} taken from the DFT cache")
+                    labelled = atoms.copy()
+                    labelled.calc = SinglePointCalculator(labelled, **cached)
+                    _store_result(queue, idx, labelled, dir_name)
+                    continue
+                job_dir = _job_dir(dir_name, idx)
+                job_atoms, calc = prepare_job(
+                    config, atoms, job_dir, None if rung else seeds, ladder[rung]
+                )
+                job_id = backend.submit(job_dir, command, job_name=f"sparc_{idx:04d}")
+                jobs[idx] = (job_id, atoms, job_atoms, calc, rung)
+
+            for idx, (job_id, atoms, job_atoms, calc, rung) in list(jobs.items()):
+                state = backend.poll(job_id)
+                if state not in (DONE, FAILED):
+                    continue
+                del jobs[idx]
+                try:
+                    backend.collect(job_id)
+                    labelled = collect_job(job_atoms, calc)
+                    if cache is not None:
+                        cache.put(job_atoms, labelled.calc.results, ladder[rung])
+                    _store_result(queue, idx, labelled, dir_name)
+                except Exception as e:
+                    SparcLog(
+                        f"Candidate {idx}: attempt {rung + 1}/{len(ladder)} "
+                        f"({describe(ladder[rung])}) failed: {e}",
+                        level="WARNING",
+                    )
+                    if rung + 1 < len(ladder):
+                        pending.append((idx, atoms, rung + 1))
+                        continue
+                    reason = f"Failed after {len(ladder)} attempts: {e}"
+                    SparcLog(f"Candidate {idx} failed: {reason}", level="ERROR")
+                    queue.fail(idx, reason)
+
+            if jobs:
+                time.sleep(poll_interval)
+    except BaseException:
+        for job in jobs.values():
+            backend.cancel(job[0])
+        raise
+
+
+# ===================================================================================================#
+# Batch Labelling
+# ===================================================================================================#
+def label_structures(
+    config,
+    structures,
+    dir_name,
+    start=1,
+    failures=None,
+    queue=None,
+    sources=None,
+    indices=None,
+):
+    """
+    Compute the DFT energy and forces of a batch of structures.
+
+    With ``labelling.backend`` the structures are submitted as batch jobs;
+    with ``labelling.workers`` > 1 they run concurrently in isolated
+    directories; otherwise they are computed one at a time in the configured
+    calculator directory, or in their own directories when
+    ``labelling.restart_seed`` is set. Each structure is retried along
+    ``labelling.retry`` if its job fails, times out or does not converge; a
+    structure that fails every attempt is logged and returned as None.
+
+    Every structure is registered in the work queue of ``dir_name``; the
+    structures finished by an earlier (crashed) run are read back instead of
+    being computed again, those that failed before are not retried.
+
+    Args:
+        config (dict): Full SPARC configuration
+        structures (list): ase.Atoms to label
+        dir_name (str): DFT directory of the iteration (job directories)
+        start (int): Index of the first structure (job directory names)
+        failures (dict): Filled with the failure reason of every failed index
+        queue (WorkQueue): Work queue (default: ``labelling_queue.db`` in ``dir_name``)
+        sources (list): Origin of every structure recorded in the queue, e.g.
+            its POSCAR file (default: None)
+        indices (list): Index of every structure (default: consecutive from ``start``)
+
+    Returns:
+        list: Labelled copies (single point calculators) in input order
+    """
+    settings = config.get("labelling", {})
+    workers = settings.get("workers", 1)
+    seeds = restart_seeds(config, dir_name)
+    cache = dft_cache(config)
+    if indices is None:
+        indices = range(start, start + len(structures))
+    indices = [int(idx) for idx in indices]
+    candidates = list(zip(indices, structures))
+
+    if queue is None:
+        os.makedirs(str(dir_name), exist_ok=True)
+        queue = WorkQueue(os.path.join(str(dir_name), QUEUE_FILE))
+    queue.recover()
+    for n, (idx, atoms) in enumerate(candidates):
+        queue.add(idx, atoms, None if sources is None else str(sources[n]))
+    todo = set(queue.pending(indices))
+    if len(todo) < len(candidates):
+        SparcLog(
+            f"{len(candidates) - len(todo)} candidates already finished in {queue.filename}"
+        )
+    candidates = [(idx, atoms) for idx, atoms in candidates if idx in todo]
+
+    if not candidates:
+        return _queued_results(queue, indices, failures)
+    if settings.get("backend"):
+        SparcLog(
+            f"Submitting {len(candidates)} candidates to the "
+            f"{settings['backend']} job backend"
+        )
+        _label_with_backend(config, settings, queue, candidates, dir_name, seeds, cache)
+    elif workers <= 1:
+        structures = dict(candidates)
+        session = os.path.join(str(dir_name), "jobs", "session")
+        while (idx := queue.claim(structures)) is not None:
+            job_dir = _job_dir(dir_name, idx) if seeds is not None else None
+            try:
+                labelled = _compute(
+                    config, settings, structures[idx], job_dir, seeds, cache, session
+                )
+            except Exception as e:
+                SparcLog(f"Candidate {idx} failed: {e}", level="ERROR")
+                queue.fail(idx, e)
+                continue
+            _store_result(queue, idx, labelled, dir_name)
+        close_cp2k_session()
+    else:
+        SparcLog(
+            f"Labelling {len(candidates)} candidates with {workers} concurrent jobs "
+            f"of {settings.get('cores_per_job', 1)} cores"
+        )
+        slots = mp.Queue()
+        for slot in range(workers):
+            slots.put(slot)
+
+        structures = dict(candidates)
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(slots, settings)
+        ) as pool:
+            futures = [
+                pool.submit(
+                    _label_worker,
+                    config,
+                    settings,
+                    queue,
+                    structures,
+                    dir_name,
+                    seeds,
+                    cache,
+                )
+                for _ in range(min(workers, len(structures)))
+            ]
+            for future in futures:
+                future.result()
+    return _queued_results(queue, indices, failures)
+
+
+def _queued_results(queue, indices, failures=None):
+    """Labelled structures of ``indices`` read from their result files."""
+    done, failed = queue.done(indices), queue.failed(indices)
+    labelled = []
+    for idx in indices:
+        if idx in done:
+            labelled.append(read(done[idx]))
+            continue
+        labelled.append(None)
+        if failures is not None:
+            failures[idx] = failed.get(idx, "not labelled")
+    return labelled
+
+
+def write_labelled(labelled, indices, dir_name, log_filename, trajfile):
+    """
+    Append a batch of labelled structures to the iteration dataset.
+
+    The trajectory, the extended XYZ file and the energy log are each opened
+    once for the whole batch.
+
+    Args:
+        labelled (list): Labelled structures (single point calculators)
+        indices (list): Candidate index of every structure
+        dir_name (str): DFT directory of the iteration
+        log_filename (str): Energy log file name inside ``dir_name``
+        trajfile (str): Trajectory file name inside ``dir_name``
+    """
+    save_frames(labelled, trajfile, dir_name)
+
+    log_file = os.path.join(str(dir_name), log_filename)
+    header = not os.path.exists(log_file) or os.path.getsize(log_file) == 0
+    with open(log_file, "a") as f:
+        if header:
+            f.write(
+                f"{'Candidate':>9s} {'Natoms':>7s} {'Epot[eV]':>16s} "
+                f"{'Epot/atom[eV]':>14s} {'Fmax[eV/A]':>11s}\n"
+            )
+        for idx, atoms in zip(indices, labelled):
+            epot = atoms.get_potential_energy()
+            fmax = np.linalg.norm(atoms.get_forces(), axis=1).max()
+            f.write(
+                f"{idx:9d} {len(atoms):7d} {epot:16.6f} "
+                f"{epot / len(atoms):14.6f} {fmax:11.4f}\n"
+            )
+
+
+def label_candidates(
+    config,
+    labelled_files,
+    dir_name,
+    log_filename,
+    trajfile,
+    start=1,
+    progress=None,
+):
+    """
+    Label the candidate POSCAR files of an iteration.
+
+    The candidates are computed with ``label_structures`` and the successful
+    ones are written to the iteration dataset in one batch, in candidate
+    order, followed by a single summary line in the SPARC log. Candidates
+    that could not be labelled are added to ``labelling.quarantine_file``.
+    Candidates written to the dataset by an earlier run of the iteration
+    (see ``work_queue``) are not written again.
+
+    Args:
+        config (dict): Full SPARC configuration
+        labelled_files (list): Candidate POSCAR files
+        dir_name (str): DFT directory of the iteration
+        log_filename (str): Energy log file name inside ``dir_name``
+        trajfile (str): Trajectory file name inside ``dir_name``
+        start (int): Index of the first candidate (restarts)
+        progress (callable): Called with the last candidate index once the
+            batch is written
+
+    Returns:
+        int: Number of labelled candidates
+    """
+    t_start = time.time()
+    indices, structures, sources = [], [], {}
+    for idx, poscar in enumerate(labelled_files, start=start):
+        if not os.path.exists(poscar):
+            SparcLog(f"Warning: Candidate file {poscar} not found, skipping...")
+            continue
+        indices.append(idx)
+        structures.append(read(poscar, format="vasp"))
+        sources[idx] = poscar
+    if not structures:
+        return 0
+
+    os.makedirs(str(dir_name), exist_ok=True)
+    queue = WorkQueue(os.path.join(str(dir_name), QUEUE_FILE))
+    failures = {}
+    results = label_structures(
+        config,
+        structures,
+        dir_name,
+        failures=failures,
+        queue=queue,
+        sources=[sources[idx] for idx in indices],
+        indices=indices,
+    )
+    if failures:
+        quarantine = Quarantine(
+            config.get("labelling", {}).get("quarantine_file", "quarantine.json")
+        )
+        for idx, reason in failures.items():
+            quarantine.add(sources[idx], idx, reason)
+        quarantine.save()
+    done = [(idx, atoms) for idx, atoms in zip(indices, results) if atoms is not None]
+    entries = queue.entries(indices)
+    new = [(idx, atoms) for idx, atoms in done if not entries[idx]["exported"]]
+    if new:
+        write_labelled(
+            [atoms for _, atoms in new],
+            [idx for idx, _ in new],
+            dir_name,
+            log_filename,
+            trajfile,
+        )
+        queue.mark_exported([idx for idx, _ in new])
+    if progress is not None:
+        progress(indices[-1])
+
+    epots = [atoms.get_potential_energy() / len(atoms) for _, atoms in done]
+    SparcLog(
+        f"Labelled {len(done)} of {len(structures)} candidates "
+        f"({len(structures) - len(done)} failed) in {time.time() - t_start:.1f} s"
+        + (f" | Epot/atom: {min(epots):.4f} to {max(epots):.4f} eV" if epots else "")
+        + f" -> {os.path.join(str(dir_name), trajfile)}"
+    )
+    return len(done)
+
+
+# ===================================================================================================#
+#                                     END OF FILE
+# ===================================================================================================#
@@ -0,0 +1,187 @@
+# fingerprint_index.py
+"""
+Persistent fingerprint index of labelled structures.
+
+Every structure that was labelled (``iter_*/00.dft/*.traj``) is stored as a
+distance histogram descriptor, grouped by composition. Candidates are only
+indexed once their DFT result is in the trajectory, so a failed or
+quarantined candidate can be selected again. ``labelling`` queries the index
+and drops candidates lying within a tolerance of an existing entry, so the
+active learning loop does not pay DFT for configurations it already knows.
+
+On disk the index is a directory holding one ``<composition>.npy`` descriptor
+matrix per composition and a ``manifest.json`` with the descriptor settings
+and the number of frames indexed from every source file.
+"""
+
+################################################################
+import glob
+import json
+import os
+
+import numpy as np
+
+################################################################
+# Third party import
+from ase.io import iread
+from scipy.spatial import cKDTree
+
+################################################################
+# Local import
+from sparc.src.utils.descriptors import N_BINS, R_MAX, pair_distance_histogram
+from sparc.src.utils.logger import SparcLog
+
+
+# ===================================================================================================#
+class FingerprintIndex:
+    """
+    On-disk nearest-neighbour index of structural fingerprints.
+
+    Parameters
+    ----------
+    index_dir : str, optional
+        Directory holding the index (default: ``fingerprint_index``).
+    r_max : float, optional
+        Largest pair distance included in the descriptor in Å.
+    n_bins : int, optional
+        Number of histogram bins per element pair.
+    """
+
+    def __init__(self, index_dir="fingerprint_index", r_max=R_MAX, n_bins=N_BINS):
+        self.index_dir = str(index_dir)
+        self.r_max = r_max
+        self.n_bins = n_bins
+        self.sources = {}
+        self._descriptors = {}
+        self._pending = {}
+        self._trees = {}
+
+        manifest = os.path.join(self.index_dir, "manifest.json")
+        if os.path.exists(manifest):
+            with open(manifest) as f:
+                data = json.load(f)
+            if data["r_max"] != r_max or data["n_bins"] != n_bins:
+                SparcLog(
+                    "Descriptor settings changed, rebuilding the fingerprint index",
+                    level="WARNING",
+                )
+            else:
+                self.sources = data["sources"]
+                for key in data["compositions"]:
+                    self._descriptors[key] = np.load(
+                        os.path.join(self.index_dir, f"{key}.npy")
+                    )
+
+    # ---------------------------------------------------------------------------------------------------#
+    @staticmethod
+    def composition(atoms):
+        """Composition key of a structure (e.g. ``BH6N``)."""
+        return atoms.get_chemical_formula(mode="hill", empirical=False)
+
+    def fingerprint(self, atoms):
+        """Descriptor of a structure; species are sorted so the layout is fixed."""
+        species = sorted(set(atoms.get_chemical_symbols()))
+        return pair_distance_histogram(atoms, species, self.r_max, self.n_bins)
+
+    def __len__(self):
+        return sum(len(d) for d in self._descriptors.values()) + sum(
+            len(rows) for rows in self._pending.values()
+        )
+
+    def _matrix(self, key):
+        """Descriptor matrix of a composition, with the rows added since the last call."""
+        rows = self._pending.pop(key, None)
+        if rows:
+            if key in self._descriptors:
+                rows.insert(0, self._descriptors[key])
+            self._descriptors[key] = np.vstack(rows)
+            self._trees.pop(key, None)
+        return self._descriptors.get(key)
+
+    # ---------------------------------------------------------------------------------------------------#
+    def add(self, atoms, source=None):
+        """Add one structure to the index, optionally recording its source file."""
+        if source is not None:
+            path = os.path.normpath(str(source))
+            self.sources[path] = self.sources.get(path, 0) + 1
+        key = self.composition(atoms)
+        self._pending.setdefault(key, []).append(self.fingerprint(atoms)[None])
+
+    def distance(self, atoms):
+        """
+        Distance to the nearest indexed structure of the same composition.
+
+        Returns:
+            float: Euclidean descriptor distance (``inf`` if the composition is new)
+        """
+        key = self.composition(atoms)
+        descriptors = self._matrix(key)
+        if descriptors is None:
+            return np.inf
+        if key not in self._trees:
+            self._trees[key] = cKDTree(descriptors)
+        dist, _ = self._trees[key].query(self.fingerprint(atoms))
+        return float(dist)
+
+    def contains(self, atoms, tol):
+        """True if a structure within ``tol`` of ``atoms`` is already indexed."""
+        return self.distance(atoms) <= tol
+
+    # ---------------------------------------------------------------------------------------------------#
+    def add_source(self, path, fmt=None):
+        """
+        Index the frames of a file that were not indexed before.
+
+        Trajectories that grew since the last call are indexed incrementally.
+
+        Returns:
+            int: Number of frames added
+        """
+        path = os.path.normpath(str(path))
+        start = self.sources.get(path, 0)
+        added = 0
+        for frame_index, atoms in enumerate(iread(path, index=":", format=fmt)):
+            if frame_index < start:
+                continue
+            self.add(atoms)
+            added += 1
+        self.sources[path] = start + added
+        return added
+
+    def update_from_tree(self, root="."):
+        """
+        Index all labelled structures below ``root``.
+
+        Returns:
+            int: Number of frames added
+        """
+        added = 0
+        for traj in sorted(glob.glob(os.path.join(root, "iter_*", "00.dft", "*.traj"))):
+            added += self.add_source(traj)
+        if added:
+            SparcLog(f"Fingerprint index: added {added} structures ({len(self)} total)")
+        return added
+
+    def save(self):
+        """Write the descriptor matrices and the manifest to ``index_dir``."""
+        os.makedirs(self.index_dir, exist_ok=True)
+        for key in list(self._pending):
+            self._matrix(key)
+        for key, descriptors in self._descriptors.items():
+            np.save(os.path.join(self.index_dir, f"{key}.npy"), descriptors)
+        with open(os.path.join(self.index_dir, "manifest.json"), "w") as f:
+            json.dump(
+                {
+                    "r_max": self.r_max,
+                    "n_bins": self.n_bins,
+                    "compositions": sorted(self._descriptors),
+                    "sources": self.sources,
+                },
+                f,
+                indent=4,
+            )
+
+
+# ===================================================================================================#
+#                                     END OF FILE
+# ===================================================================================================#
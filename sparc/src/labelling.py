@@ -12,6 +12,8 @@ are selected for labeling.
 
 ################################################################
 import os
+import time
+from itertools import chain
 
 import pandas as pd
 
@@ -21,11 +23,66 @@ from ase.io import read, write
 
 ################################################################
 # Local import
+from sparc.src.model_deviation import DEVI_NAMES, read_model_devi
+from sparc.src.selection import rank_candidates, select_diverse
 from sparc.src.utils.logger import SparcLog
+from sparc.src.utils.utils import iread_frames
 
 
 # ===================================================================================================#
-def labelling(trajfile, outfile, min_lim, max_lim, output_dir=None):
+def _pull_backlog(
+    backlog, n, prescreen=None, fingerprint_index=None, fingerprint_tol=None
+):
+    """
+    Pull up to ``n`` backlog entries that still pass the candidate filters.
+
+    Entries rejected by the pre-screen or already represented in the
+    fingerprint index are dropped from the backlog and replaced by the next
+    ones.
+
+    Returns:
+        list: (trajfile, frame_index, atoms) of the pulled candidates
+    """
+    pulled = []
+    while len(pulled) < n and len(backlog):
+        for entry in backlog.pull(n - len(pulled)):
+            for frame_index, atoms in iread_frames(entry["trajfile"], [entry["frame"]]):
+                source = f"structure {frame_index} of {entry['trajfile']}"
+                if prescreen is not None:
+                    reason = prescreen.check(atoms)
+                    if reason is not None:
+                        SparcLog(f"Pre-screen rejected backlog {source}: {reason}")
+                        continue
+                if (
+                    fingerprint_index is not None
+                    and fingerprint_tol is not None
+                    and fingerprint_index.contains(atoms, fingerprint_tol)
+                ):
+                    SparcLog(f"Backlog {source} was labelled before, dropped")
+                    continue
+                pulled.append((entry["trajfile"], frame_index, atoms))
+    return pulled
+
+
+# ===================================================================================================#
+def labelling(
+    trajfile,
+    outfile,
+    min_lim,
+    max_lim,
+    output_dir=None,
+    streaming=False,
+    fps_budget=None,
+    descriptor=None,
+    fingerprint_index=None,
+    fingerprint_tol=None,
+    max_candidates=None,
+    priority="top",
+    priority_bins=5,
+    backlog=None,
+    carver=None,
+    prescreen=None,
+):
     """
     Select and extract structures for labeling based on force deviations.
 
@@ -35,66 +92,182 @@ def labelling(trajfile, outfile, min_lim, max_lim, output_dir=None):
         min_lim: Minimum force deviation threshold (eV/Å)
         max_lim: Maximum force deviation threshold (eV/Å)
         output_dir: Path to directory for saving POSCAR files (default: None)
+        streaming: Read the deviation table with NumPy and decode only the
+            selected frames in a single pass over the trajectory, keeping the
+            memory use independent of the trajectory length (default: False)
+        fps_budget: Keep at most this many candidates, chosen by farthest-point
+            sampling on structural descriptors (default: None, keep all)
+        descriptor: Settings of the distance histogram descriptor,
+            e.g. ``{"r_max": 6.0, "n_bins": 32}`` (default: None)
+        fingerprint_index: ``FingerprintIndex`` of already labelled structures;
+            candidates are added to it once labelled (default: None)
+        fingerprint_tol: Drop candidates closer than this descriptor distance
+            to an indexed structure (default: None, no filtering)
+        max_candidates: DFT budget of the iteration; candidates are ranked by
+            deviation and the rest is queued in ``backlog`` (default: None, no limit)
+        priority: Ranking strategy, "top" or "stratified" (default: "top")
+        priority_bins: Number of deviation bins of the stratified strategy
+        backlog: ``CandidateBacklog`` receiving the candidates over budget; when
+            fewer than ``max_candidates`` fresh candidates remain, the budget is
+            topped up from it, even if no fresh candidate was found. Pulled
+            entries go through the pre-screen and the fingerprint filter
+            (default: None)
+        carver: ``ClusterCarver``; large candidates are replaced by the local
+            environments of their uncertain atoms (default: None)
+        prescreen: ``PreScreen``; candidates with clashing atoms, too many
+            fragments or an implausible MLP energy are dropped (default: None)
 
     Returns:
         tuple: (candidate_found, labelled_files)
     """
-    # Read trajectory file
-    dptraj = read(trajfile, index=":")
-
-    # Read model deviation file
-    names = [
-        "step",
-        "max_devi_v",
-        "min_devi_v",
-        "avg_devi_v",
-        "max_devi_f",
-        "min_devi_f",
-        "avg_devi_f",
-        "dev_e",
-    ]
-    data = pd.read_csv(outfile, sep=r"\s+", comment="#", names=names)
-
     # Set default deviation limits if not provided
     if min_lim is None or max_lim is None:
         min_lim = 0.05  # eV/Å
         max_lim = 0.20  # eV/Å
 
     # Filter structures within deviation range
-    candidates = data[(data["max_devi_f"] >= min_lim) & (data["max_devi_f"] <= max_lim)]
+    if streaming:
+        devi = read_model_devi(outfile)
+        max_devi_f = devi[:, DEVI_NAMES.index("max_devi_f")]
+        window = (max_devi_f >= min_lim) & (max_devi_f <= max_lim)
+        frame_indices = devi[window, 0].astype(int).tolist()
+        frame_devi = max_devi_f[window].tolist()
+    else:
+        # Read model deviation file
+        names = [
+            "step",
+            "max_devi_v",
+            "min_devi_v",
+            "avg_devi_v",
+            "max_devi_f",
+            "min_devi_f",
+            "avg_devi_f",
+            "dev_e",
+        ]
+        data = pd.read_csv(outfile, sep=r"\s+", comment="#", names=names)
+        candidates = data[
+            (data["max_devi_f"] >= min_lim) & (data["max_devi_f"] <= max_lim)
+        ]
+        frame_indices = [int(step) for step in candidates["step"]]
+        frame_devi = candidates["max_devi_f"].tolist()
+    frame_devi = dict(zip(frame_indices, frame_devi))
     labelled_files = []
 
-    if candidates.empty:
-        SparcLog(
-            f"\nNo candidates found for labelling within range [{min_lim:.2f}, {max_lim:.2f}] eV/Å"
-        )
-        candidate_found = False
-    else:
+    if frame_indices:
         SparcLog("\n" + "=" * 90)
         SparcLog(
-            f"Found {len(candidates)} candidates for labelling within range [{min_lim:.2f}, {max_lim:.2f}] eV/Å"
+            f"Found {len(frame_indices)} candidates for labelling within range [{min_lim:.2f}, {max_lim:.2f}] eV/Å"
         )
         SparcLog("=" * 90 + "\n")
 
+        if streaming:
+
+            def frames(indices):
+                return iread_frames(trajfile, indices)
+        else:
+            dptraj = read(trajfile, index=":")
+
+            def frames(indices):
+                return ((i, dptraj[i]) for i in sorted(indices))
+
+        # Drop unphysical candidates before anything else is computed on them
+        if prescreen is not None:
+            start = time.perf_counter()
+            frame_indices = prescreen.filter(frames(frame_indices))
+            SparcLog(f"Pre-screen took {time.perf_counter() - start:.2f} s\n")
+
+        # Drop candidates already represented by a labelled structure
+        if fingerprint_index is not None and fingerprint_tol is not None:
+            frame_indices = [
+                i
+                for i, atoms in frames(frame_indices)
+                if not fingerprint_index.contains(atoms, fingerprint_tol)
+            ]
+            SparcLog(
+                f"Fingerprint index kept {len(frame_indices)} candidates not labelled before\n"
+            )
+
+        # Keep a structurally diverse subset of the candidates
+        if fps_budget and len(frame_indices) > fps_budget:
+            frame_indices = select_diverse(
+                frames(frame_indices),
+                frame_devi,
+                fps_budget,
+                **(descriptor or {}),
+            )
+            SparcLog(
+                f"Farthest-point sampling kept {len(frame_indices)} diverse candidates\n"
+            )
+
+    # Bound the DFT cost of the iteration
+    pulled = []
+    if max_candidates:
+        frame_indices, remainder = rank_candidates(
+            {i: frame_devi[i] for i in frame_indices},
+            max_candidates,
+            strategy=priority,
+            n_bins=priority_bins,
+        )
+        if backlog is not None:
+            pulled = _pull_backlog(
+                backlog,
+                max_candidates - len(frame_indices),
+                prescreen,
+                fingerprint_index,
+                fingerprint_tol,
+            )
+            backlog.push(trajfile, frame_devi, remainder)
+            backlog.save()
+        SparcLog(
+            f"DFT budget of {max_candidates}: labelling {len(frame_indices)} new and "
+            f"{len(pulled)} backlog candidates, {len(remainder)} queued\n"
+        )
+
+    if not frame_indices and not pulled:
+        SparcLog(
+            f"\nNo candidates found for labelling within range [{min_lim:.2f}, {max_lim:.2f}] eV/Å"
+        )
+        candidate_found = False
+    else:
         # Use provided output directory or create default
         if output_dir is None:
             output_dir = "poscar_files"
         os.makedirs(output_dir, exist_ok=True)
 
-        # Process each candidate structure
-        for serial, (_, candidate) in enumerate(candidates.iterrows(), start=1):
-            frame_index = int(candidate["step"])
-            serial_dir = os.path.join(output_dir, f"{serial:04d}")
-            os.makedirs(serial_dir, exist_ok=True)
+        # Process each candidate structure, followed by the backlog entries
+        structures = chain(
+            ((trajfile, i, atoms) for i, atoms in frames(frame_indices))
+            if frame_indices
+            else (),
+            pulled,
+        )
+        serial = 0
+        for source, frame_index, atoms in structures:
+            pieces = [atoms] if carver is None else carver(atoms, min_lim)
+            for piece in pieces:
+                # Carvings get their own composition, check them separately
+                if (
+                    piece is not atoms
+                    and fingerprint_index is not None
+                    and fingerprint_tol is not None
+                    and fingerprint_index.contains(piece, fingerprint_tol)
+                ):
+                    continue
+                serial += 1
+                serial_dir = os.path.join(output_dir, f"{serial:04d}")
+                os.makedirs(serial_dir, exist_ok=True)
 
-            poscar_filename = os.path.join(serial_dir, "POSCAR")
-            write(poscar_filename, dptraj[frame_index], format="vasp")
-            SparcLog(
-                f"Generated POSCAR file for structure {frame_index} in {serial_dir}/"
-            )
-            labelled_files.append(poscar_filename)
+                poscar_filename = os.path.join(serial_dir, "POSCAR")
+                write(poscar_filename, piece, format="vasp")
+                SparcLog(
+                    f"Generated POSCAR file for structure {frame_index} of {source} in {serial_dir}/"
+                )
+                labelled_files.append(poscar_filename)
+
+        candidate_found = bool(labelled_files)
 
-        candidate_found = True
+    if fingerprint_index is not None:
+        fingerprint_index.save()
 
     return candidate_found, labelled_files
 
@@ -0,0 +1,598 @@
+# model_deviation.py
+"""
+In-process committee model deviation for Query-by-Committee (QbC).
+
+The committee of frozen DeepMD graphs is loaded once and the trajectory is
+evaluated in memory-bounded batches, avoiding the DeePMD npy round-trip and
+the ``dp model-devi`` subprocess. The deviations follow the DeePMD-kit
+definitions (energy and virial per atom) and are written both as the usual
+``model_dev_N.out`` text table and as a binary ``model_dev_N.npy`` array.
+"""
+
+################################################################
+import glob
+import hashlib
+import os
+
+import numpy as np
+
+################################################################
+# Third party import
+from ase.data import chemical_symbols
+from ase.io.trajectory import Trajectory
+
+################################################################
+# Local import
+from sparc.src.utils.logger import SparcLog
+
+# Column layout of ``model_dev_N.out`` (same as ``dp model-devi``)
+DEVI_NAMES = [
+    "step",
+    "max_devi_v",
+    "min_devi_v",
+    "avg_devi_v",
+    "max_devi_f",
+    "min_devi_f",
+    "avg_devi_f",
+    "devi_e",
+]
+
+# Frames evaluated by the on-the-fly ``CommitteeMonitor``
+OTF_FRAMES_FILE = "otf_frames.traj"
+
+
+# ===================================================================================================#
+# Deviation Metrics
+# ===================================================================================================#
+def calc_devi_f(forces):
+    """
+    Force deviation of a committee.
+
+    Args:
+        forces (np.ndarray): Forces with shape (n_models, n_frames, n_atoms, 3)
+
+    Returns:
+        tuple: (max_devi_f, min_devi_f, avg_devi_f, atomic_devi_f)
+            - the first three have shape (n_frames,)
+            - atomic_devi_f has shape (n_frames, n_atoms)
+    """
+    atomic_devi_f = np.linalg.norm(np.std(forces, axis=0), axis=-1)
+    return (
+        atomic_devi_f.max(axis=-1),
+        atomic_devi_f.min(axis=-1),
+        atomic_devi_f.mean(axis=-1),
+        atomic_devi_f,
+    )
+
+
+def calc_devi_v(virials):
+    """
+    Virial deviation of a committee.
+
+    Args:
+        virials (np.ndarray): Virials per atom with shape (n_models, n_frames, 9)
+
+    Returns:
+        tuple: (max_devi_v, min_devi_v, avg_devi_v), each with shape (n_frames,)
+    """
+    devi_v = np.std(virials, axis=0)
+    return (
+        devi_v.max(axis=-1),
+        devi_v.min(axis=-1),
+        np.linalg.norm(devi_v, axis=-1) / 3,
+    )
+
+
+def calc_devi_e(energies):
+    """
+    Energy deviation of a committee.
+
+    Args:
+        energies (np.ndarray): Energies per atom with shape (n_models, n_frames)
+
+    Returns:
+        np.ndarray: Energy deviation with shape (n_frames,)
+    """
+    return np.std(energies, axis=0)
+
+
+def committee_deviation(energies, forces, virials, natoms, steps):
+    """
+    Assemble the model deviation table for a block of frames.
+
+    Args:
+        energies (np.ndarray): Total energies, shape (n_models, n_frames)
+        forces (np.ndarray): Forces, shape (n_models, n_frames, n_atoms, 3)
+        virials (np.ndarray): Virials, shape (n_models, n_frames, 9)
+        natoms (int): Number of atoms per frame
+        steps (np.ndarray): Step (frame index) of every frame
+
+    Returns:
+        tuple: (devi, atomic_devi_f)
+            - devi: array with shape (n_frames, 8) ordered as ``DEVI_NAMES``
+            - atomic_devi_f: per-atom force deviation, shape (n_frames, n_atoms)
+    """
+    max_v, min_v, avg_v = calc_devi_v(virials / natoms)
+    max_f, min_f, avg_f, atomic_devi_f = calc_devi_f(forces)
+    devi_e = calc_devi_e(energies / natoms)
+    devi = np.column_stack([steps, max_v, min_v, avg_v, max_f, min_f, avg_f, devi_e])
+    return devi, atomic_devi_f
+
+
+# ===================================================================================================#
+# Input / Output
+# ===================================================================================================#
+def write_model_devi(devi, outfile, header=""):
+    """
+    Write the deviation table in the ``dp model-devi`` text layout and as ``.npy``.
+
+    Args:
+        devi (np.ndarray): Deviation table with shape (n_frames, 8)
+        outfile (str): Path of the text file (e.g. ``model_dev_0.out``)
+        header (str): Free text written on the first comment line
+
+    Returns:
+        str: Path of the binary ``.npy`` copy
+    """
+    columns = f"{DEVI_NAMES[0]:>10}" + "".join(f"{name:>19}" for name in DEVI_NAMES[1:])
+    np.savetxt(
+        outfile,
+        devi,
+        fmt=["%12d"] + ["%19.6e"] * (len(DEVI_NAMES) - 1),
+        delimiter="",
+        header=f"{header}\n{columns}",
+    )
+    npy_file = os.path.splitext(str(outfile))[0] + ".npy"
+    np.save(npy_file, devi)
+    return npy_file
+
+
+def read_model_devi(outfile):
+    """
+    Read a model deviation table, preferring the binary copy when present.
+
+    Args:
+        outfile (str): Path of the ``model_dev_N.out`` text file
+
+    Returns:
+        np.ndarray: Deviation table with shape (n_frames, 8)
+    """
+    npy_file = os.path.splitext(str(outfile))[0] + ".npy"
+    if os.path.exists(npy_file) and os.path.getmtime(npy_file) >= os.path.getmtime(
+        outfile
+    ):
+        return np.load(npy_file)
+    return np.loadtxt(outfile, comments="#", ndmin=2)
+
+
+def adaptive_thresholds(
+    max_devi_f, target, max_lim, quantiles=(0.0, 1.0), f_min_floor=0.02
+):
+    """
+    Per-iteration deviation window chosen from the observed distribution.
+
+    The upper bound is the ``quantiles[1]`` quantile of ``max_devi_f``, capped
+    at ``max_lim`` so extrapolating frames are never labelled. The lower bound
+    is lowered until about ``target`` frames fall inside the window, but never
+    below the ``quantiles[0]`` quantile nor below ``f_min_floor``, under which
+    the committee is considered converged.
+
+    Args:
+        max_devi_f (np.ndarray): max_devi_f column of the deviation table
+        target (int): Desired number of candidates
+        max_lim (float): Hard upper limit of the window (eV/Å)
+        quantiles (tuple): Lower and upper quantile bounds of the window
+        f_min_floor (float): Smallest allowed lower bound (eV/Å)
+
+    Returns:
+        tuple: (min_lim, max_lim) in eV/Å
+    """
+    max_devi_f = np.asarray(max_devi_f, dtype=float)
+    q_low, q_high = np.quantile(max_devi_f, quantiles)
+    upper = float(min(max_lim, q_high))
+
+    inside = np.sort(max_devi_f[max_devi_f <= upper])[::-1]
+    lower = float(inside[target - 1]) if len(inside) > target else f_min_floor
+    lower = max(lower, float(q_low), f_min_floor)
+    return lower, max(upper, lower)
+
+
+# ===================================================================================================#
+# Committee Evaluation
+# ===================================================================================================#
+def load_committee(model_names):
+    """
+    Load every frozen model of the committee once.
+
+    Args:
+        model_names (list): Paths to the frozen DeepMD models
+
+    Returns:
+        list: ``deepmd.infer.DeepPot`` objects
+    """
+    # Imported here so the NumPy metrics stay usable without DeePMD-kit
+    from deepmd.infer import DeepPot
+
+    committee = []
+    for model in model_names:
+        SparcLog(f"Loading committee model: {model}")
+        committee.append(DeepPot(model))
+    return committee
+
+
+def evaluate_committee(committee, coords, cells, atom_types):
+    """
+    Evaluate a batch of frames with every committee model.
+
+    Args:
+        committee (list): ``DeepPot`` objects
+        coords (np.ndarray): Coordinates, shape (n_frames, n_atoms * 3)
+        cells (np.ndarray or None): Cells, shape (n_frames, 9), None for non-periodic
+        atom_types (np.ndarray): DeepMD type index of every atom
+
+    Returns:
+        tuple: (energies, forces, virials) stacked over the committee
+    """
+    energies, forces, virials = [], [], []
+    for dp in committee:
+        e, f, v = dp.eval(coords, cells, atom_types)
+        energies.append(np.reshape(e, (-1,)))
+        forces.append(f)
+        virials.append(np.reshape(v, (-1, 9)))
+    return np.array(energies), np.array(forces), np.array(virials)
+
+
+def atomic_force_deviation(committee, type_map, atoms):
+    """
+    Per-atom force deviation of a single structure.
+
+    Args:
+        committee (list): ``DeepPot`` objects
+        type_map (list): Type map of the committee models
+        atoms (ase.Atoms): Atomic structure
+
+    Returns:
+        np.ndarray: Force deviation of every atom (eV/Å), shape (n_atoms,)
+    """
+    coords = atoms.get_positions().reshape(1, -1)
+    cells = atoms.get_cell().array.reshape(1, -1) if atoms.pbc.any() else None
+    atom_types = np.array([type_map.index(s) for s in atoms.get_chemical_symbols()])
+    energies, forces, virials = evaluate_committee(committee, coords, cells, atom_types)
+    _, atomic = committee_deviation(energies, forces, virials, len(atoms), [0])
+    return atomic[0]
+
+
+def _frame_batches(trajfile, batch_size):
+    """
+    Yield consecutive blocks of frames sharing the same atom ordering.
+
+    Frames are decoded lazily, so at most ``batch_size`` frames are held in memory.
+
+    Yields:
+        tuple: (steps, numbers, coords, cells)
+    """
+    steps, coords, cells = [], [], []
+    numbers = None
+    periodic = False
+    with Trajectory(str(trajfile)) as traj:
+        for step, atoms in enumerate(traj):
+            frame_numbers = atoms.get_atomic_numbers()
+            if numbers is not None and (
+                len(steps) >= batch_size or not np.array_equal(numbers, frame_numbers)
+            ):
+                yield (
+                    np.array(steps),
+                    numbers,
+                    np.array(coords),
+                    np.array(cells) if periodic else None,
+                )
+                steps, coords, cells = [], [], []
+            numbers = frame_numbers
+            periodic = bool(atoms.get_pbc().any())
+            steps.append(step)
+            coords.append(atoms.get_positions().reshape(-1))
+            cells.append(atoms.get_cell().array.reshape(-1))
+    if steps:
+        yield (
+            np.array(steps),
+            numbers,
+            np.array(coords),
+            np.array(cells) if periodic else None,
+        )
+
+
+def CommitteeDeviation(trajfile, model_names, outfile, batch_size=1000, cache=None):
+    """
+    Compute the committee model deviation of a trajectory in-process.
+
+    Args:
+        trajfile (str): Path to the ASE trajectory file
+        model_names (list): Paths to the frozen DeepMD models (minimum 2)
+        outfile (str): Path of the ``model_dev_N.out`` file to write
+        batch_size (int): Maximum number of frames evaluated at once
+        cache (DeviationCache): Deviations of frames seen before with the same
+            committee; only new frames are evaluated (default: None)
+
+    Returns:
+        np.ndarray: Deviation table with shape (n_frames, 8)
+    """
+    committee = type_map = None
+    n_reused = 0
+
+    devi_blocks = []
+    for steps, numbers, coords, cells in _frame_batches(trajfile, batch_size):
+        devi = np.empty((len(steps), len(DEVI_NAMES)))
+        devi[:, 0] = steps
+        todo = np.arange(len(steps))
+        if cache is not None:
+            keys = [
+                cache.frame_key(numbers, coords[k], None if cells is None else cells[k])
+                for k in range(len(steps))
+            ]
+            rows = [cache.get(key) for key in keys]
+            todo = np.array([k for k, row in enumerate(rows) if row is None], dtype=int)
+            for k, row in enumerate(rows):
+                if row is not None:
+                    devi[k, 1:] = row
+            n_reused += len(steps) - len(todo)
+
+        if len(todo):
+            if committee is None:
+                committee = load_committee(model_names)
+                type_map = committee[0].get_type_map()
+            atom_types = np.array(
+                [type_map.index(chemical_symbols[z]) for z in numbers]
+            )
+            energies, forces, virials = evaluate_committee(
+                committee,
+                coords[todo],
+                None if cells is None else cells[todo],
+                atom_types,
+            )
+            devi[todo], _ = committee_deviation(
+                energies, forces, virials, len(numbers), steps[todo]
+            )
+            if cache is not None:
+                cache.put([keys[k] for k in todo], devi[todo, 1:])
+                cache.save()
+        devi_blocks.append(devi)
+        SparcLog(f"Model deviation evaluated up to frame {int(steps[-1])}")
+
+    if not devi_blocks:
+        raise ValueError(f"No frames found in trajectory: {trajfile}")
+
+    devi = np.vstack(devi_blocks)
+    if cache is not None:
+        SparcLog(
+            f"Deviation cache: reused {n_reused} of {len(devi)} frames, "
+            f"evaluated {len(devi) - n_reused}"
+        )
+    write_model_devi(devi, outfile, header=str(trajfile))
+    return devi
+
+
+class DeviationCache:
+    """
+    Persistent deviations of already evaluated frames.
+
+    The cache of a committee is stored in ``cache_dir/<committee hash>.npz``,
+    where the hash covers the contents of every model file, so retrained
+    models never reuse stale deviations. Frames are keyed by a hash of their
+    atomic numbers, positions and cell, which makes the cache independent of
+    the frame order: a trajectory that grew, or was re-read after a crash, is
+    only evaluated for the frames not seen before. ``save`` writes only the
+    rows added since the previous call, as a shard
+    ``<committee hash>.<pid>-<n>.npz``; the shards are merged into the main
+    file when the cache is loaded again.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Directory holding the cache files.
+    model_names : list
+        Paths to the frozen DeepMD models of the committee.
+    """
+
+    def __init__(self, cache_dir, model_names):
+        self.cache_dir = str(cache_dir)
+        self.committee = self.committee_hash(model_names)
+        self.filename = os.path.join(self.cache_dir, f"{self.committee}.npz")
+        self._rows = {}
+        self._new = []
+        self._n_shards = 0
+
+        shards = sorted(
+            glob.glob(os.path.join(self.cache_dir, f"{self.committee}.*.npz"))
+        )
+        for filename in [self.filename, *shards]:
+            if os.path.exists(filename):
+                with np.load(filename) as data:
+                    self._rows.update(zip(data["keys"].tolist(), data["rows"]))
+        if shards:
+            self._write(self.filename, list(self._rows))
+            for shard in shards:
+                os.remove(shard)
+
+    def __len__(self):
+        return len(self._rows)
+
+    @staticmethod
+    def committee_hash(model_names):
+        """SHA-256 of the model file contents, in committee order."""
+        digest = hashlib.sha256()
+        for model in model_names:
+            with open(model, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+        return digest.hexdigest()[:16]
+
+    @staticmethod
+    def frame_key(numbers, coords, cell=None):
+        """Content hash of a frame."""
+        digest = hashlib.sha1(np.asarray(numbers, dtype=np.int64).tobytes())
+        digest.update(np.asarray(coords, dtype=np.float64).tobytes())
+        if cell is not None:
+            digest.update(np.asarray(cell, dtype=np.float64).tobytes())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Deviation row (without the step column) of a frame, None if unseen."""
+        return self._rows.get(key)
+
+    def put(self, keys, rows):
+        """Store the deviation rows (without the step column) of new frames."""
+        keys = list(keys)
+        self._new.extend(k for k in keys if k not in self._rows)
+        self._rows.update(zip(keys, np.asarray(rows)))
+
+    def _write(self, filename, keys):
+        """Write the rows of ``keys`` to ``filename`` atomically."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        rows = np.array([self._rows[k] for k in keys]).reshape(-1, len(DEVI_NAMES) - 1)
+        tmp_file = filename + ".tmp"
+        with open(tmp_file, "wb") as f:
+            np.savez(f, keys=np.array(keys), rows=rows)
+        os.replace(tmp_file, filename)
+
+    def save(self):
+        """Write the rows added since the last call as a new shard in ``cache_dir``."""
+        if not self._new:
+            return
+        shard = f"{self.committee}.{os.getpid()}-{self._n_shards:06d}.npz"
+        self._write(os.path.join(self.cache_dir, shard), self._new)
+        self._n_shards += 1
+        self._new = []
+
+
+# ===================================================================================================#
+# On-the-fly Committee Monitor
+# ===================================================================================================#
+class CommitteeMonitor:
+    """
+    Evaluate the committee deviation while the ML/MD simulation is running.
+
+    Every ``interval`` MD steps the current frame is evaluated by the committee,
+    its deviation row is appended to the per-run array and the frame is
+    appended to ``frames_file`` (``output_dir/otf_frames.traj``). Nothing is
+    selected here: ``active_learning.QueryOnTheFly`` picks the candidates
+    among the collected frames after the runs, with the same filters as the
+    post-processing QbC.
+
+    Parameters
+    ----------
+    model_names : list
+        Paths to the frozen DeepMD models of the committee.
+    min_lim, max_lim : float
+        Force deviation window (eV/Å) for candidate selection.
+    output_dir : str
+        Directory of the collected frames and of the per-run deviations.
+    interval : int, optional
+        Evaluate the committee every ``interval`` MD steps (default: 1).
+    """
+
+    def __init__(self, model_names, min_lim, max_lim, output_dir, interval=1):
+        self.model_names = list(model_names)
+        self.min_lim = min_lim
+        self.max_lim = max_lim
+        self.output_dir = str(output_dir)
+        self.frames_file = os.path.join(self.output_dir, OTF_FRAMES_FILE)
+        self.interval = max(int(interval), 1)
+        self.committee = load_committee(self.model_names)
+        self.type_map = self.committee[0].get_type_map()
+        self.reference_calc = None
+        self.n_in_window = 0
+        self.devi_files = []
+        self.run = 0
+        self._rows = []
+        self._frames = None
+        # Frames of an earlier, interrupted monitor have no deviation rows here
+        if os.path.exists(self.frames_file):
+            os.remove(self.frames_file)
+
+    def set_reference(self, calc, model_file):
+        """
+        Reuse the calculator driving the MD for the first committee model.
+
+        The driving model is only evaluated once per step: when ``model_file`` is
+        the first committee model, its energy, forces and virial are taken from
+        ``calc`` and only the remaining models are evaluated.
+        """
+        same = os.path.exists(model_file) and os.path.samefile(
+            model_file, self.model_names[0]
+        )
+        self.reference_calc = calc if same else None
+
+    def __call__(self, atoms, step):
+        """Evaluate the committee on ``atoms`` if ``step`` falls on the interval."""
+        if step % self.interval:
+            return None
+
+        coords = atoms.get_positions().reshape(1, -1)
+        cells = atoms.get_cell().array.reshape(1, -1) if atoms.pbc.any() else None
+        atom_types = np.array(
+            [self.type_map.index(s) for s in atoms.get_chemical_symbols()]
+        )
+
+        committee = self.committee
+        if self.reference_calc is not None:
+            committee = committee[1:]
+        energies, forces, virials = evaluate_committee(
+            committee, coords, cells, atom_types
+        )
+        if self.reference_calc is not None:
+            e_ref = self.reference_calc.get_potential_energy(atoms)
+            f_ref = self.reference_calc.get_forces(atoms)
+            v_ref = self.reference_calc.results["virial"]
+            energies = np.vstack([np.reshape(e_ref, (1, 1)), energies])
+            forces = np.concatenate([f_ref[None, None], forces])
+            virials = np.vstack([np.reshape(v_ref, (1, 1, 9)), virials])
+
+        devi, _ = committee_deviation(
+            energies, forces, virials, len(atoms), np.array([step])
+        )
+        self._rows.append(devi[0])
+        self._frames.write(atoms)
+
+        max_devi_f = devi[0, DEVI_NAMES.index("max_devi_f")]
+        if self.min_lim <= max_devi_f <= self.max_lim:
+            self.n_in_window += 1
+            SparcLog(
+                f"[Run {self.run}] Step {step}: max_devi_f = {max_devi_f:.3f} eV/Å "
+                "within the deviation window"
+            )
+        return devi[0]
+
+    def begin_run(self):
+        """Start a new ML/MD run with an empty deviation array."""
+        self.run += 1
+        self._rows = []
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._frames = Trajectory(self.frames_file, "a")
+
+    def end_run(self, dir_name):
+        """
+        Save the deviation array of the current run as ``model_dev_otf_NNN.npy``.
+
+        Returns:
+            str or None: Path of the saved array, None if nothing was evaluated
+        """
+        if self._frames is not None:
+            self._frames.close()
+            self._frames = None
+        if not self._rows:
+            return None
+        devi_file = os.path.join(str(dir_name), f"model_dev_otf_{self.run:03d}.npy")
+        np.save(devi_file, np.array(self._rows))
+        self.devi_files.append(devi_file)
+        self._rows = []
+        return devi_file
+
+    def deviation(self):
+        """Return the deviation rows of all completed runs as one array."""
+        blocks = [np.load(f) for f in self.devi_files]
+        return np.vstack(blocks) if blocks else np.empty((0, len(DEVI_NAMES)))
+
+
+# ===================================================================================================#
+#                                     END OF FILE
+# ===================================================================================================#
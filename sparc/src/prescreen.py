@@ -0,0 +1,177 @@
+# prescreen.py
+"""
+Physics pre-screen of DFT candidates.
+
+Candidates from an ML/MD run can be broken: overlapping atoms, molecules
+flown apart, or energies far from anything physical. Such structures cost a
+full DFT single point before the DFT code fails (or, worse, succeeds), so
+they are rejected before labelling with cheap checks:
+
+- minimum interatomic distance per element pair, by default a fraction of
+  the sum of the covalent radii
+- number of bonded fragments, by default at most that of the reference
+  structure (bonds: distances below ``bond_scale`` times the covalent radii)
+- MLP energy per atom within ``energy_window`` of the reference structure
+
+All pairs come from a single cell-list neighbour search
+(``ase.neighborlist.neighbor_list``) and the fragments from the connected
+components of the bond graph, so a frame takes milliseconds.
+"""
+
+################################################################
+import numpy as np
+
+################################################################
+# Third party import
+from ase.data import atomic_numbers, chemical_symbols, covalent_radii
+from ase.neighborlist import neighbor_list
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+################################################################
+# Local import
+from sparc.src.utils.logger import SparcLog
+
+
+# ===================================================================================================#
+def _mlp_energy_per_atom(atoms):
+    """MLP energy per atom stored with a frame, None if there is none."""
+    if atoms.calc is None or atoms.calc.results.get("energy") is None:
+        return None
+    return float(atoms.calc.results["energy"]) / len(atoms)
+
+
+class PreScreen:
+    """
+    Reject unphysical candidates before they are sent to DFT.
+
+    Parameters
+    ----------
+    min_distances : dict, optional
+        Smallest allowed distance (Å) per element pair, e.g. ``{"B-N": 1.2}``;
+        other pairs use ``min_scale`` times the sum of the covalent radii.
+    min_scale : float, optional
+        Default minimum distance as a fraction of the covalent radii (default: 0.6).
+    bond_scale : float, optional
+        Bond cutoff as a multiple of the covalent radii (default: 1.25).
+    max_fragments : int, optional
+        Largest number of bonded fragments; taken from the reference structure
+        when None.
+    energy_window : float, optional
+        Largest deviation (eV/atom) of the MLP energy per atom from the
+        reference structure; None disables the check.
+    """
+
+    def __init__(
+        self,
+        min_distances=None,
+        min_scale=0.6,
+        bond_scale=1.25,
+        max_fragments=None,
+        energy_window=None,
+    ):
+        self.min_scale = min_scale
+        self.bond_scale = bond_scale
+        self.max_fragments = max_fragments
+        self.energy_window = energy_window
+        self.reference_epa = None
+
+        # Pair table of the minimum distances, indexed by atomic numbers
+        n = len(chemical_symbols)
+        self._dmin = min_scale * (covalent_radii[:, None] + covalent_radii[None, :])
+        self._dmin = self._dmin[:n, :n]
+        for pair, distance in (min_distances or {}).items():
+            a, b = (atomic_numbers[s.strip()] for s in pair.split("-"))
+            self._dmin[a, b] = self._dmin[b, a] = distance
+
+    def set_reference(self, atoms):
+        """Take the fragment count and energy per atom of a healthy structure."""
+        if self.max_fragments is None:
+            self.max_fragments = self.fragments(atoms)
+        self.reference_epa = _mlp_energy_per_atom(atoms)
+
+    def _pairs(self, atoms):
+        numbers = atoms.numbers
+        radii = covalent_radii[numbers]
+        cutoff = max(
+            2 * self.bond_scale * radii.max(),
+            self._dmin[np.ix_(np.unique(numbers), np.unique(numbers))].max(),
+        )
+        i, j, d = neighbor_list("ijd", atoms, cutoff)
+        return i, j, d
+
+    def fragments(self, atoms, pairs=None):
+        """Number of bonded fragments of ``atoms``."""
+        i, j, d = pairs if pairs is not None else self._pairs(atoms)
+        radii = covalent_radii[atoms.numbers]
+        bonded = d < self.bond_scale * (radii[i] + radii[j])
+        graph = coo_matrix(
+            (np.ones(bonded.sum()), (i[bonded], j[bonded])),
+            shape=(len(atoms), len(atoms)),
+        )
+        return connected_components(graph, directed=False)[0]
+
+    def check(self, atoms):
+        """
+        Reason to reject ``atoms``, None if it passes every check.
+
+        Returns:
+            str or None: Description of the first failed check
+        """
+        pairs = self._pairs(atoms)
+        i, j, d = pairs
+        numbers = atoms.numbers
+        clash = d < self._dmin[numbers[i], numbers[j]]
+        if clash.any():
+            k = np.flatnonzero(clash)[np.argmin(d[clash])]
+            a, b = chemical_symbols[numbers[i[k]]], chemical_symbols[numbers[j[k]]]
+            return (
+                f"{a}{i[k]}-{b}{j[k]} distance {d[k]:.2f} Å below "
+                f"{self._dmin[numbers[i[k]], numbers[j[k]]]:.2f} Å"
+            )
+
+        if self.max_fragments is not None:
+            n_fragments = self.fragments(atoms, pairs)
+            if n_fragments > self.max_fragments:
+                return f"{n_fragments} fragments (at most {self.max_fragments})"
+
+        epa = _mlp_energy_per_atom(atoms)
+        if (
+            self.energy_window is not None
+            and self.reference_epa is not None
+            and epa is not None
+            and abs(epa - self.reference_epa) > self.energy_window
+        ):
+            return (
+                f"MLP energy {epa:.3f} eV/atom is more than {self.energy_window} "
+                f"eV/atom from the reference {self.reference_epa:.3f} eV/atom"
+            )
+        return None
+
+    def filter(self, frames):
+        """
+        Indices of the frames passing the pre-screen; rejections are logged.
+
+        Args:
+            frames (iterable): (index, ase.Atoms) pairs
+
+        Returns:
+            list: Indices of the accepted frames
+        """
+        accepted, rejected = [], 0
+        for index, atoms in frames:
+            reason = self.check(atoms)
+            if reason is None:
+                accepted.append(index)
+                continue
+            rejected += 1
+            SparcLog(f"Pre-screen rejected structure {index}: {reason}")
+        SparcLog(
+            f"Pre-screen kept {len(accepted)} of {len(accepted) + rejected} candidates\n"
+        )
+        return accepted
+
+
+# ===================================================================================================#
+#                                     END OF FILE
+# ===================================================================================================#
@@ -0,0 +1,185 @@
+# restart_seed.py
+"""
+SCF restart seeding from the nearest labelled structure.
+
+Every DFT job started by ``dft_labelling`` in its own directory leaves a copy
+of its structure (``candidate.vasp``) next to the DFT output. Before a new
+candidate is computed, the finished job with the same atoms (same chemical
+symbols in the same order) and the smallest position RMSD is looked up, and
+its wavefunction is copied into the new job directory. Jobs whose SCF did
+not converge (see ``convergence``) are never used as seeds.
+
+- VASP: ``WAVECAR`` (``ISTART = 1``, ``ICHARG = 0``) or, without a
+  wavefunction, ``CHGCAR`` (``ICHARG = 1``)
+- CP2K: ``<project>-RESTART.wfn`` with ``SCF_GUESS RESTART``
+
+Wavefunctions live on the grid of the simulation cell, so the distance is
+the RMSD of the absolute positions (minimum image in scaled coordinates),
+without any alignment.
+"""
+
+################################################################
+import glob
+import os
+import shutil
+
+import numpy as np
+
+################################################################
+# Third party import
+from ase.calculators.cp2k import parse_input
+from ase.io import read, write
+
+################################################################
+# Local import
+from sparc.src.convergence import cp2k_converged, vasp_converged
+from sparc.src.utils.logger import SparcLog
+
+CANDIDATE_FILE = "candidate.vasp"
+
+
+# ===================================================================================================#
+def position_rmsd(atoms, scaled_positions):
+    """
+    RMSD between the positions of ``atoms`` and other scaled positions.
+
+    Differences are wrapped to the nearest periodic image along periodic
+    directions and measured in the cell of ``atoms``.
+
+    Args:
+        atoms (ase.Atoms): Reference structure
+        scaled_positions (np.ndarray): Scaled positions, shape (..., n_atoms, 3)
+
+    Returns:
+        np.ndarray: RMSD in Å for every set of positions
+    """
+    delta = np.asarray(scaled_positions) - atoms.get_scaled_positions(wrap=False)
+    delta -= np.round(delta) * atoms.pbc
+    cart = delta @ atoms.cell.array
+    return np.sqrt(np.mean(np.sum(cart**2, axis=-1), axis=-1))
+
+
+def _finished(job_dir, code):
+    """Path of the restart file of a finished and converged job, None if there is none."""
+    if code == "vasp":
+        outcar = os.path.join(job_dir, "OUTCAR")
+        if not os.path.exists(outcar):
+            return None
+        with open(outcar, "rb") as f:
+            f.seek(max(os.path.getsize(outcar) - 8192, 0))
+            if b"General timing and accounting" not in f.read():
+                return None
+        if vasp_converged(outcar) is False:
+            return None
+        for name in ("WAVECAR", "CHGCAR"):
+            path = os.path.join(job_dir, name)
+            if os.path.exists(path) and os.path.getsize(path) > 0:
+                return path
+        return None
+    wfn = glob.glob(os.path.join(job_dir, "*-RESTART.wfn"))
+    if not wfn:
+        return None
+    for outfile in glob.glob(os.path.join(job_dir, "*.out")):
+        if cp2k_converged(outfile) is False:
+            return None
+    return wfn[0]
+
+
+# ===================================================================================================#
+class RestartSeeds:
+    """
+    Finished DFT jobs available as SCF starting points.
+
+    Parameters
+    ----------
+    code : str
+        DFT code of the jobs, "vasp" or "cp2k".
+    pattern : str, optional
+        Glob pattern of the job directories.
+    max_rmsd : float, optional
+        Largest position RMSD (Å) of a usable seed (default: 1.0).
+    """
+
+    def __init__(self, code, pattern="iter_*/00.dft/jobs/*", max_rmsd=1.0):
+        self.code = code.lower()
+        self.pattern = pattern
+        self.max_rmsd = max_rmsd
+        self._seen = set()
+        self._groups = {}
+
+    def __len__(self):
+        return len(self._seen)
+
+    def update(self):
+        """Index the job directories that finished since the last call."""
+        for job_dir in sorted(glob.glob(self.pattern)):
+            if job_dir in self._seen:
+                continue
+            candidate = os.path.join(job_dir, CANDIDATE_FILE)
+            restart = _finished(job_dir, self.code)
+            if restart is None or not os.path.exists(candidate):
+                continue
+            atoms = read(candidate, format="vasp")
+            key = tuple(atoms.get_chemical_symbols())
+            group = self._groups.setdefault(key, ([], []))
+            group[0].append(atoms.get_scaled_positions(wrap=False))
+            group[1].append(restart)
+            self._seen.add(job_dir)
+
+    def nearest(self, atoms):
+        """
+        Restart file of the closest finished job with the same atoms.
+
+        Returns:
+            tuple: (restart file, RMSD in Å), (None, inf) if no seed is usable
+        """
+        group = self._groups.get(tuple(atoms.get_chemical_symbols()))
+        if not group:
+            return None, np.inf
+        rmsd = position_rmsd(atoms, np.array(group[0]))
+        best = int(np.argmin(rmsd))
+        if rmsd[best] > self.max_rmsd:
+            return None, float(rmsd[best])
+        return group[1][best], float(rmsd[best])
+
+    def seed(self, atoms, calc, job_dir):
+        """
+        Record the candidate of ``job_dir`` and seed ``calc`` from the nearest job.
+
+        Returns:
+            str or None: Restart file the job was seeded from
+        """
+        os.makedirs(job_dir, exist_ok=True)
+        write(os.path.join(job_dir, CANDIDATE_FILE), atoms, format="vasp")
+        self.update()
+        restart, rmsd = self.nearest(atoms)
+        if restart is None:
+            return None
+
+        if self.code == "vasp":
+            source_dir = os.path.dirname(restart)
+            copied = []
+            for name in ("WAVECAR", "CHGCAR"):
+                path = os.path.join(source_dir, name)
+                if os.path.exists(path) and os.path.getsize(path) > 0:
+                    shutil.copyfile(path, os.path.join(job_dir, name))
+                    copied.append(name)
+            if "WAVECAR" in copied:
+                calc.set(istart=1, icharg=0)
+            else:
+                calc.set(istart=0, icharg=1)
+        else:
+            wfn = os.path.abspath(calc.label + "-RESTART.wfn")
+            shutil.copyfile(restart, wfn)
+            root = parse_input(calc.parameters.inp or "")
+            root.add_keyword("FORCE_EVAL/DFT", f"WFN_RESTART_FILE_NAME {wfn}")
+            root.add_keyword("FORCE_EVAL/DFT/SCF", "SCF_GUESS RESTART")
+            calc.set(inp="\n".join(root.write()))
+
+        SparcLog(f"Seeded {job_dir} from {restart} (RMSD {rmsd:.3f} Å)")
+        return restart
+
+
+# ===================================================================================================#
+#                                     END OF FILE
+# ===================================================================================================#
@@ -0,0 +1,216 @@
+# scheduler.py
+"""
+Job submission backends for DFT labelling.
+
+A backend runs a shell command inside a prepared job directory and exposes
+the same four operations whatever executes the job:
+
+- ``submit(job_dir, command, job_name)`` starts the job and returns its id
+- ``poll(job_id)`` returns ``PENDING``, ``RUNNING``, ``DONE`` or ``FAILED``
+- ``collect(job_id)`` returns the job directory of a finished job
+- ``cancel(job_id)`` stops a queued or running job
+
+Every job is written as ``sparc_job.sh``, which records the exit code of the
+command in ``sparc_exit_code`` so that success can be checked after the job
+has left the queue. ``SlurmBackend`` drives ``sbatch``/``squeue``/``scancel``
+through command templates; ``LocalBackend`` runs the same scripts as local
+subprocesses and is meant for testing and single-node runs.
+"""
+
+################################################################
+import os
+import subprocess
+
+################################################################
+# Local import
+from sparc.src.utils.logger import SparcLog
+
+# Job states
+PENDING = "PENDING"
+RUNNING = "RUNNING"
+DONE = "DONE"
+FAILED = "FAILED"
+
+JOB_SCRIPT = "sparc_job.sh"
+JOB_OUTPUT = "sparc_job.out"
+EXIT_FILE = "sparc_exit_code"
+
+
+# ===================================================================================================#
+class JobBackend:
+    """
+    Common part of the job backends.
+
+    Parameters
+    ----------
+    header : str, optional
+        Lines written after the shebang of every job script (e.g. ``#SBATCH``
+        directives); ``{job_name}`` and ``{job_dir}`` are replaced.
+    """
+
+    def __init__(self, header=""):
+        self.header = header or ""
+        self.jobs = {}
+
+    def write_script(self, job_dir, command, job_name):
+        """Write the job script of ``command`` to ``job_dir``."""
+        script = os.path.join(str(job_dir), JOB_SCRIPT)
+        header = self.header.format(job_name=job_name, job_dir=os.path.abspath(job_dir))
+        with open(script, "w") as f:
+            f.write("#!/bin/bash\n")
+            if header:
+                f.write(header.rstrip("\n") + "\n")
+            f.write(f"{command}\n")
+            f.write(f"echo $? > {EXIT_FILE}\n")
+        return script
+
+    def exit_code(self, job_id):
+        """Exit code recorded by a finished job, None if it never got there."""
+        exit_file = os.path.join(self.jobs[job_id], EXIT_FILE)
+        if not os.path.exists(exit_file):
+            return None
+        with open(exit_file) as f:
+            return int(f.read().strip() or 1)
+
+    def collect(self, job_id):
+        """
+        Directory of a successfully finished job.
+
+        Raises:
+            RuntimeError: if the job failed
+        """
+        job_dir = self.jobs[job_id]
+        if self.exit_code(job_id) != 0:
+            raise RuntimeError(
+                f"Job {job_id} failed, see {os.path.join(job_dir, JOB_OUTPUT)}"
+            )
+        return job_dir
+
+
+class LocalBackend(JobBackend):
+    """Run the job scripts as local subprocesses."""
+
+    def __init__(self, header=""):
+        super().__init__(header)
+        self._procs = {}
+
+    def submit(self, job_dir, command, job_name="sparc"):
+        script = self.write_script(job_dir, command, job_name)
+        with open(os.path.join(str(job_dir), JOB_OUTPUT), "w") as out:
+            proc = subprocess.Popen(
+                ["bash", JOB_SCRIPT],
+                cwd=str(job_dir),
+                stdout=out,
+                stderr=subprocess.STDOUT,
+            )
+        job_id = str(proc.pid)
+        self.jobs[job_id] = str(job_dir)
+        self._procs[job_id] = proc
+        SparcLog(f"Started local job {job_id}: {script}")
+        return job_id
+
+    def poll(self, job_id):
+        if self._procs[job_id].poll() is None:
+            return RUNNING
+        return DONE if self.exit_code(job_id) == 0 else FAILED
+
+    def cancel(self, job_id):
+        proc = self._procs[job_id]
+        if proc.poll() is None:
+            proc.terminate()
+            proc.wait()
+
+
+class SlurmBackend(JobBackend):
+    """
+    Submit the job scripts to a Slurm-like batch system.
+
+    Parameters
+    ----------
+    header : str, optional
+        ``#SBATCH`` lines of every job script.
+    submit_command : str, optional
+        Submission command; ``{script}`` is the job script, the job id is the
+        first ``;``-separated field of its output.
+    status_command : str, optional
+        Query printing the state of ``{job_id}``; empty once the job left the queue.
+    cancel_command : str, optional
+        Command cancelling ``{job_id}``.
+    """
+
+    # Scheduler states still waiting for resources
+    QUEUED_STATES = ("PENDING", "CONFIGURING", "REQUEUED", "RESIZING", "SUSPENDED")
+
+    def __init__(
+        self,
+        header="",
+        submit_command="sbatch --parsable {script}",
+        status_command="squeue -h -j {job_id} -o %T",
+        cancel_command="scancel {job_id}",
+    ):
+        super().__init__(header)
+        self.submit_command = submit_command
+        self.status_command = status_command
+        self.cancel_command = cancel_command
+
+    @staticmethod
+    def _run(command, cwd=None):
+        result = subprocess.run(
+            command, shell=True, cwd=cwd, capture_output=True, text=True, check=True
+        )
+        return result.stdout.strip()
+
+    def submit(self, job_dir, command, job_name="sparc"):
+        self.write_script(job_dir, command, job_name)
+        output = self._run(
+            self.submit_command.format(script=JOB_SCRIPT, job_name=job_name),
+            cwd=str(job_dir),
+        )
+        job_id = output.splitlines()[-1].split(";")[0].strip()
+        self.jobs[job_id] = str(job_dir)
+        SparcLog(f"Submitted job {job_id} from {job_dir}")
+        return job_id
+
+    def poll(self, job_id):
+        try:
+            state = self._run(self.status_command.format(job_id=job_id))
+        except subprocess.CalledProcessError:
+            state = ""  # unknown to the scheduler: finished and purged
+        state = state.split()[0] if state else ""
+        if state in self.QUEUED_STATES:
+            return PENDING
+        if state:
+            return RUNNING
+        return DONE if self.exit_code(job_id) == 0 else FAILED
+
+    def cancel(self, job_id):
+        try:
+            self._run(self.cancel_command.format(job_id=job_id))
+        except subprocess.CalledProcessError as e:
+            SparcLog(f"Could not cancel job {job_id}: {e}", level="WARNING")
+
+
+# ===================================================================================================#
+def get_backend(settings):
+    """
+    Build the job backend of the ``labelling`` configuration.
+
+    Args:
+        settings (dict): ``labelling`` section with ``backend`` ("local" or
+            "slurm") and the optional ``scheduler`` templates
+
+    Returns:
+        JobBackend: Configured backend
+    """
+    name = str(settings.get("backend")).lower()
+    scheduler = dict(settings.get("scheduler") or {})
+    if name == "local":
+        return LocalBackend(header=scheduler.get("header", ""))
+    if name == "slurm":
+        return SlurmBackend(**scheduler)
+    raise ValueError(f"Unknown job backend: {settings.get('backend')}")
+
+
+# ===================================================================================================#
+#                                     END OF FILE
+# ===================================================================================================#
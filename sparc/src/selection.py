@@ -0,0 +1,182 @@
+# selection.py
+"""
+Candidate selection stages applied after the model deviation window.
+
+Consecutive MD frames are nearly identical, so labelling every frame in
+``[f_min_dev, f_max_dev]`` wastes DFT single points on redundant structures.
+The stages in this module reduce the candidate list before POSCAR files are
+written.
+"""
+
+################################################################
+import json
+import os
+
+import numpy as np
+
+################################################################
+# Local import
+from sparc.src.utils.descriptors import N_BINS, R_MAX, pair_distance_histogram
+
+
+# ===================================================================================================#
+# Diversity Selection
+# ===================================================================================================#
+def farthest_point_sampling(descriptors, budget, start=0):
+    """
+    Greedy farthest-point sampling in descriptor space.
+
+    Starting from ``start``, repeatedly picks the point whose distance to the
+    already selected set is largest.
+
+    Args:
+        descriptors (np.ndarray): Descriptor matrix with shape (n_points, n_features)
+        budget (int): Number of points to select
+        start (int): Index of the first selected point
+
+    Returns:
+        list: Selected row indices in the order they were picked
+    """
+    descriptors = np.asarray(descriptors, dtype=float)
+    n_points = len(descriptors)
+    if budget >= n_points:
+        return list(range(n_points))
+
+    selected = [int(start)]
+    min_dist = np.linalg.norm(descriptors - descriptors[start], axis=1)
+    while len(selected) < budget:
+        pick = int(np.argmax(min_dist))
+        selected.append(pick)
+        min_dist = np.minimum(
+            min_dist, np.linalg.norm(descriptors - descriptors[pick], axis=1)
+        )
+    return selected
+
+
+def select_diverse(frames, frame_devi, budget, r_max=R_MAX, n_bins=N_BINS):
+    """
+    Reduce the candidates to a structurally diverse subset.
+
+    Descriptors are computed one frame at a time, so only the descriptor
+    matrix is kept in memory. Sampling starts from the candidate with the
+    largest force deviation.
+
+    Args:
+        frames (iterable): (frame_index, atoms) pairs of the candidates
+        frame_devi (dict): max_devi_f of every candidate frame index
+        budget (int): Number of candidates to keep
+        r_max (float): Largest distance included in the descriptor (Å)
+        n_bins (int): Number of histogram bins per element pair
+
+    Returns:
+        list: Frame indices of the kept candidates in ascending order
+    """
+    indices, descriptors = [], []
+    species = None
+    for frame_index, atoms in frames:
+        if species is None:
+            species = list(dict.fromkeys(atoms.get_chemical_symbols()))
+        indices.append(frame_index)
+        descriptors.append(pair_distance_histogram(atoms, species, r_max, n_bins))
+
+    if len(indices) <= budget:
+        return indices
+
+    start = int(np.argmax([frame_devi[i] for i in indices]))
+    picked = farthest_point_sampling(np.array(descriptors), budget, start=start)
+    return sorted(indices[k] for k in picked)
+
+
+# ===================================================================================================#
+# DFT Budget
+# ===================================================================================================#
+def rank_candidates(frame_devi, budget, strategy="top", n_bins=5):
+    """
+    Split the candidates into the ones labelled now and the remainder.
+
+    Args:
+        frame_devi (dict): max_devi_f of every candidate frame index
+        budget (int): Number of candidates labelled in this iteration
+        strategy (str): "top" keeps the largest deviations; "stratified" splits
+            the deviation range into ``n_bins`` equal bins and takes the largest
+            deviation of each bin in turn, so every deviation level is sampled
+        n_bins (int): Number of deviation bins for the stratified strategy
+
+    Returns:
+        tuple: (selected, remainder) frame indices; selected in ascending order,
+        remainder ordered by decreasing deviation
+    """
+    ranked = sorted(frame_devi, key=lambda i: frame_devi[i], reverse=True)
+    if len(ranked) <= budget:
+        return sorted(ranked), []
+
+    if strategy == "top":
+        selected = ranked[:budget]
+    elif strategy == "stratified":
+        devi = np.array([frame_devi[i] for i in ranked])
+        edges = np.linspace(devi.min(), devi.max(), n_bins + 1)
+        bins = np.clip(np.digitize(devi, edges[1:-1]), 0, n_bins - 1)
+        queues = [[i for i, b in zip(ranked, bins) if b == k] for k in range(n_bins)]
+        selected = []
+        while len(selected) < budget:
+            for queue in reversed(queues):
+                if queue and len(selected) < budget:
+                    selected.append(queue.pop(0))
+    else:
+        raise ValueError(f"Unknown candidate priority strategy: {strategy}")
+
+    chosen = set(selected)
+    return sorted(selected), [i for i in ranked if i not in chosen]
+
+
+class CandidateBacklog:
+    """
+    Persistent queue of candidates that did not fit in the DFT budget.
+
+    Entries are stored in a JSON file as ``{"trajfile", "frame", "max_devi_f"}``
+    and are pulled back by decreasing deviation when a later iteration has
+    budget left.
+
+    Parameters
+    ----------
+    filename : str, optional
+        Path of the backlog file (default: ``candidate_backlog.json``).
+    """
+
+    def __init__(self, filename="candidate_backlog.json"):
+        self.filename = str(filename)
+        self.entries = []
+        if os.path.exists(self.filename):
+            with open(self.filename) as f:
+                self.entries = json.load(f)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def push(self, trajfile, frame_devi, frames):
+        """Queue ``frames`` of ``trajfile`` with their deviation."""
+        self.entries.extend(
+            {
+                "trajfile": os.path.abspath(str(trajfile)),
+                "frame": int(i),
+                "max_devi_f": float(frame_devi[i]),
+            }
+            for i in frames
+        )
+
+    def pull(self, n):
+        """Remove and return the ``n`` queued entries with the largest deviation."""
+        self.entries = [e for e in self.entries if os.path.exists(e["trajfile"])]
+        self.entries.sort(key=lambda e: e["max_devi_f"], reverse=True)
+        pulled, self.entries = self.entries[:n], self.entries[n:]
+        return pulled
+
+    def save(self):
+        """Write the queue to ``filename``."""
+        with open(self.filename, "w") as f:
+            json.dump(self.entries, f, indent=4)
+
+
+# ===================================================================================================#
+#                                     END OF FILE
+# ===================================================================================================#
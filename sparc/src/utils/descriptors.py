@@ -0,0 +1,73 @@
+# descriptors.py
+"""
+Cheap structural descriptors used to compare configurations.
+
+The descriptor of a frame is the concatenation of the interatomic distance
+histograms of every element pair, normalised by the number of atoms. Every
+distance is smeared over the bins with a Gaussian of one bin width, so the
+descriptor changes continuously with the geometry and Euclidean distances
+between descriptors can be compared against a tolerance. It is invariant to
+translation, rotation and permutation of like atoms, has a fixed length for a
+given list of species, and is computed with vectorized NumPy.
+"""
+
+################################################################
+import numpy as np
+
+################################################################
+# Default descriptor settings
+R_MAX = 6.0  # Å
+N_BINS = 32
+
+
+# ---------------------------------------------------------------------------------------------------#
+def species_pairs(species):
+    """Return the ordered element pairs (a, b) with a <= b in ``species`` order."""
+    return [(a, b) for i, a in enumerate(species) for b in species[i:]]
+
+
+def pair_distance_histogram(atoms, species, r_max=R_MAX, n_bins=N_BINS):
+    """
+    Distance histogram descriptor of a single frame.
+
+    Args:
+        atoms (ase.Atoms): Atomic structure
+        species (list): Chemical symbols defining the pair blocks and their order
+        r_max (float): Largest distance included in the histograms (Å)
+        n_bins (int): Number of bins per element pair
+
+    Returns:
+        np.ndarray: Descriptor with shape (n_pairs * n_bins,)
+    """
+    n_species = len(species)
+    pair_block = np.full((n_species, n_species), -1, dtype=int)
+    for block, (a, b) in enumerate(species_pairs(species)):
+        i, j = species.index(a), species.index(b)
+        pair_block[i, j] = pair_block[j, i] = block
+    n_pairs = n_species * (n_species + 1) // 2
+
+    natoms = len(atoms)
+    if natoms < 2:
+        return np.zeros(n_pairs * n_bins)
+
+    symbol_index = {s: k for k, s in enumerate(species)}
+    kinds = np.array([symbol_index[s] for s in atoms.get_chemical_symbols()])
+    distances = atoms.get_all_distances(mic=bool(atoms.pbc.any()))
+
+    iu, ju = np.triu_indices(natoms, k=1)
+    d = distances[iu, ju]
+    keep = d < r_max
+    blocks = pair_block[kinds[iu[keep]], kinds[ju[keep]]]
+
+    width = r_max / n_bins
+    centers = (np.arange(n_bins) + 0.5) * width
+    weights = np.exp(-0.5 * ((d[keep, None] - centers) / width) ** 2)
+
+    histogram = np.zeros((n_pairs, n_bins))
+    np.add.at(histogram, blocks, weights)
+    return histogram.ravel() / natoms
+
+
+# ===================================================================================================#
+#                                     END OF FILE
+# ===================================================================================================#
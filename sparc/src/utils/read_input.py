@@ -50,6 +50,9 @@ def load_config(input_file: str = "input.yaml") -> dict:
         config["dft_calculator"]["incar_file"] = config["dft_calculator"].get(
             "incar_file", "INCAR"
         )
+        config["dft_calculator"]["cache_dir"] = config["dft_calculator"].get(
+            "cache_dir", None
+        )
         # AIMD Settings
         config["md_simulation"] = config.get("md_simulation", {})
         config["md_simulation"]["timestep_fs"] = config["md_simulation"].get(
@@ -87,6 +90,9 @@ def load_config(input_file: str = "input.yaml") -> dict:
         config["md_simulation"]["restart"] = config["md_simulation"].get(
             "restart", False
         )
+        config["md_simulation"]["interactive"] = config["md_simulation"].get(
+            "interactive", False
+        )
         config["md_simulation"]["use_dft_plumed"] = config["md_simulation"].get(
             "use_dft_plumed", False
         )
@@ -114,6 +120,9 @@ def load_config(input_file: str = "input.yaml") -> dict:
         config["deepmd_setup"]["data_dir"] = config["deepmd_setup"].get(
             "data_dir", "DeePMD_training/00.data"
         )
+        config["deepmd_setup"]["prune_tol"] = config["deepmd_setup"].get(
+            "prune_tol", None
+        )
         config["deepmd_setup"]["input_file"] = config["deepmd_setup"].get(
             "input_file", "input.json"
         )
@@ -126,6 +135,12 @@ def load_config(input_file: str = "input.yaml") -> dict:
         config["deepmd_setup"]["training"] = config["deepmd_setup"].get(
             "training", False
         )
+        config["deepmd_setup"]["parallel_training"] = config["deepmd_setup"].get(
+            "parallel_training", False
+        )
+        config["deepmd_setup"]["cores_per_model"] = config["deepmd_setup"].get(
+            "cores_per_model", None
+        )
         config["deepmd_setup"]["MdSimulation"] = config["deepmd_setup"].get(
             "MdSimulation", False
         )
@@ -148,6 +163,32 @@ def load_config(input_file: str = "input.yaml") -> dict:
             "deepmd_setup"
         ]["umbrella_sampling"].get("config_file", "umbrella_sampling.yaml")
 
+    # Concurrent DFT labelling of the active learning candidates
+    config["labelling"] = config.get("labelling", {})
+    config["labelling"]["workers"] = config["labelling"].get("workers", 1)
+    config["labelling"]["cores_per_job"] = config["labelling"].get("cores_per_job", 1)
+    config["labelling"]["exe_command"] = config["labelling"].get("exe_command", None)
+    config["labelling"]["env"] = config["labelling"].get("env", {})
+    config["labelling"]["pin_cores"] = config["labelling"].get("pin_cores", False)
+    config["labelling"]["backend"] = config["labelling"].get("backend", None)
+    config["labelling"]["scheduler"] = config["labelling"].get("scheduler", {})
+    config["labelling"]["max_jobs"] = config["labelling"].get("max_jobs", None)
+    config["labelling"]["poll_interval"] = config["labelling"].get("poll_interval", 30)
+    config["labelling"]["restart_seed"] = config["labelling"].get("restart_seed", False)
+    config["labelling"]["seed_max_rmsd"] = config["labelling"].get("seed_max_rmsd", 1.0)
+    config["labelling"]["cp2k_session"] = config["labelling"].get("cp2k_session", False)
+    config["labelling"]["timeout"] = config["labelling"].get("timeout", None)
+    config["labelling"]["retry"] = config["labelling"].get("retry", [])
+    config["labelling"]["quarantine_file"] = config["labelling"].get(
+        "quarantine_file", "quarantine.json"
+    )
+    dft_name = config.get("dft_calculator", {}).get("name", "VASP")
+    if config["labelling"]["backend"] and dft_name.lower() != "vasp":
+        raise ValueError(
+            f"labelling.backend supports VASP only, not {dft_name}; "
+            "CP2K candidates run through cp2k_shell (use labelling.workers)"
+        )
+
     # Add defaults for active learning and model_dev section
     config["active_learning"] = config.get("active_learning", False)
     config["learning_restart"] = config.get("learning_restart", False)
@@ -157,6 +198,46 @@ def load_config(input_file: str = "input.yaml") -> dict:
     if config["active_learning"]:
         config["model_dev"]["f_min_dev"] = config["model_dev"].get("f_min_dev", 0.05)
         config["model_dev"]["f_max_dev"] = config["model_dev"].get("f_max_dev", 0.20)
+        config["model_dev"]["engine"] = config["model_dev"].get("engine", "subprocess")
+        config["model_dev"]["batch_size"] = config["model_dev"].get("batch_size", 1000)
+        config["model_dev"]["deviation_cache"] = config["model_dev"].get(
+            "deviation_cache", None
+        )
+        config["model_dev"]["on_the_fly"] = config["model_dev"].get("on_the_fly", False)
+        config["model_dev"]["otf_interval"] = config["model_dev"].get("otf_interval", 1)
+        config["model_dev"]["streaming"] = config["model_dev"].get("streaming", False)
+        config["model_dev"]["fps_budget"] = config["model_dev"].get("fps_budget", None)
+        config["model_dev"]["descriptor"] = config["model_dev"].get(
+            "descriptor", {"r_max": 6.0, "n_bins": 32}
+        )
+        config["model_dev"]["fingerprint_tol"] = config["model_dev"].get(
+            "fingerprint_tol", None
+        )
+        config["model_dev"]["fingerprint_dir"] = config["model_dev"].get(
+            "fingerprint_dir", "fingerprint_index"
+        )
+        config["model_dev"]["max_candidates"] = config["model_dev"].get(
+            "max_candidates", None
+        )
+        config["model_dev"]["priority"] = config["model_dev"].get("priority", "top")
+        config["model_dev"]["priority_bins"] = config["model_dev"].get(
+            "priority_bins", 5
+        )
+        config["model_dev"]["backlog_file"] = config["model_dev"].get(
+            "backlog_file", "candidate_backlog.json"
+        )
+        config["model_dev"]["adaptive"] = config["model_dev"].get("adaptive", False)
+        config["model_dev"]["adaptive_target"] = config["model_dev"].get(
+            "adaptive_target", 50
+        )
+        config["model_dev"]["adaptive_quantiles"] = config["model_dev"].get(
+            "adaptive_quantiles", [0.0, 1.0]
+        )
+        config["model_dev"]["f_min_floor"] = config["model_dev"].get(
+            "f_min_floor", 0.02
+        )
+        config["model_dev"]["carving"] = config["model_dev"].get("carving", None)
+        config["model_dev"]["prescreen"] = config["model_dev"].get("prescreen", None)
 
     # Load distance metrics
     config["distance_metrics"] = config.get(
@@ -176,4 +257,3 @@ def load_config(input_file: str = "input.yaml") -> dict:
 if __name__ == "__main__":
     config = load_config()
     SparcLog(config)  # For debugging: print loaded configuration
-
@@ -10,12 +10,14 @@ import numpy as np
 
 ################################################################
 # Third patty import
-from ase.io import read, write
-from ase.io.trajectory import TrajectoryWriter
+from ase.calculators.singlepoint import SinglePointCalculator
+from ase.io import iread, read, write
+from ase.io.trajectory import Trajectory, TrajectoryWriter
 
 ################################################################
 # Local Import
 from sparc.src.utils.logger import SparcLog
+from sparc.src.work_queue import QUEUE_FILE
 
 # ===================================================================================================
 """
@@ -122,6 +124,16 @@ def save_xyz(atoms, trajfile, write_mode, dir_name):
     # properties = ['energy', 'forces', 'coordinates', 'velocities', 'cell', 'pbc']
     properties = ["energy", "forces", "coordinates", "cell", "pbc"]
 
+    # Keep the computed results: centering moves the atoms, and the calculator
+    # would otherwise be asked (and a DFT code rerun) for the new positions
+    results = {}
+    if atoms.calc is not None and not atoms.calc.check_state(atoms):
+        results = {
+            prop: atoms.calc.results[prop]
+            for prop in ("energy", "forces")
+            if prop in atoms.calc.results
+        }
+
     # Write to trajectory file
     # wrapped_atoms = wrap_positions(atoms)
     atoms.center()
@@ -134,12 +146,53 @@ def save_xyz(atoms, trajfile, write_mode, dir_name):
     trr = TrajectoryWriter(
         filename=traj_file, mode=write_mode, atoms=atoms, properties=properties
     )
-    trr.write(atoms)
+    trr.write(atoms, **results)
 
     # Save additional XYZ format
     write(xyz_file, atoms, append=True)
 
 
+def save_frames(frames, trajfile, dir_name):
+    """
+    Append a batch of labelled structures to the trajectory and XYZ files.
+
+    Same output as calling ``save_xyz`` for every frame, but each file is
+    opened once for the whole batch.
+
+    Args:
+        frames: list
+            ase.Atoms with (single point) calculators holding the results
+        trajfile: str
+            Name of the trajectory file inside ``dir_name``
+        dir_name: str
+            Directory of the trajectory and XYZ files
+    """
+    properties = ["energy", "forces", "coordinates", "cell", "pbc"]
+    batch = []
+    for atoms in frames:
+        results = {
+            prop: atoms.calc.results[prop]
+            for prop in ("energy", "forces")
+            if prop in atoms.calc.results
+        }
+        atoms = atoms.copy()
+        atoms.center()
+        atoms.wrap()
+        atoms.calc = SinglePointCalculator(atoms, **results)
+        batch.append(atoms)
+
+    trr = TrajectoryWriter(
+        filename=f"{dir_name}/{trajfile}",
+        mode="a",
+        atoms=batch[0],
+        properties=properties,
+    )
+    for atoms in batch:
+        trr.write(atoms)
+    trr.close()
+    write(f"{dir_name}/AseTraj.xyz", batch, append=True)
+
+
 # ---------------------------------------------------------------------------------------------------#
 # Add context managers for file handling
 class MDLogger:
@@ -269,6 +322,56 @@ def combine_trajectories(trajfilename, current_iter):
     return str(combined_traj)
 
 
+# ---------------------------------------------------------------------------------------------------#
+def iread_frames(trajfile, indices):
+    """
+    Lazily read selected frames from a trajectory in a single forward pass.
+
+    For ASE ``.traj`` files only the requested frames are decoded; other formats
+    are parsed frame by frame and the unrequested frames are dropped at once.
+
+    Args:
+        trajfile (str): Path to the trajectory file
+        indices (list): Frame indices to read
+
+    Indices beyond the end of the trajectory are skipped with a warning.
+
+    Yields:
+        tuple: (frame_index, atoms) in ascending frame order
+    """
+    wanted = sorted({int(i) for i in indices})
+    if not wanted:
+        return
+
+    if str(trajfile).endswith(".traj"):
+        with Trajectory(str(trajfile)) as traj:
+            nframes = len(traj)
+            for frame_index in wanted:
+                if frame_index >= nframes:
+                    break
+                yield frame_index, traj[frame_index]
+    else:
+        pending = iter(wanted)
+        target = next(pending)
+        nframes = 0
+        for frame_index, atoms in enumerate(iread(str(trajfile), index=":")):
+            nframes = frame_index + 1
+            if frame_index != target:
+                continue
+            yield frame_index, atoms
+            target = next(pending, None)
+            if target is None:
+                return
+
+    missing = sum(1 for i in wanted if i >= nframes)
+    if missing:
+        SparcLog(
+            f"{missing} requested frame(s) beyond the {nframes} frames of {trajfile!s} "
+            "were skipped",
+            level="WARNING",
+        )
+
+
 # ===================================================================================================#
 # Save current state of Active Learning iteration in a JSON file
 # ===================================================================================================#
@@ -316,20 +419,26 @@ def load_progress(progress_file="progress.json"):
 
 def restart_progress(start_iteration):
     """
-        Read labelled candidates in case of
+        Read labelled candidates in case of restart.
+
+    When the labelling work queue of the iteration (``00.dft/labelling_queue.db``)
+    exists, all candidates are returned: the queue knows which ones are finished,
+    so they are skipped by ``label_candidates``. Without a queue (progress files of
+    older runs), labelling resumes from the stored ``idx``.
 
     Args:
         start_iterration (dict): dictionary containig the current state which includes:
             - 'iteration': last AL iteration.
-            - 'idx': index of last processed candidates.
+            - 'idx': index of the first candidate not yet labelled.
             - 'candidate': total number of candidates.
 
     Returns:
-        tuple: (iddx, candidates, candidate_found_is, labelled_files)
-            - iddx (int): Index of last processed candidate.
+        tuple: (iter, iddx, candidates, candidate_found_is, labelled_files)
+            - iter (int): Iteration to resume
+            - iddx (int): Index of the first returned candidate
             - candidates (int): Total number of candidates
             - candidate_found_is (bool): True/False
-            - labelled_files (list): List of POSCAR files for remaining candidates
+            - labelled_files (list): List of POSCAR files of the candidates to label
     """
     #
     # Retrieve iteration
@@ -339,26 +448,22 @@ def restart_progress(start_iteration):
             "Error: 'iteration' key is missing or None in the progress file."
         )
 
-    # print(f"Resuming Active Learning from Iteration: {iter}")
-
     # Retrieve candidate
-    iddx = start_iteration.get("idx")
     nid = start_iteration.get("candidate")
 
     # Check if candidate is found
     candidate_found_is = True if start_iteration.get("candidate") else False
-    # print(f"Candidate Found: {candidate_found_is}")
-    # print(f"Last Candidate: {iddx}, Total Candidates: {nid}")
 
-    # candidates = len([f for f in Path(iter_folder, '02.dpmd', 'dft_candidates').iterdir() if f.is_dir()])
+    # The work queue skips finished candidates, otherwise trust the stored index
+    queue_file = Path(f"iter_{iter:06d}") / "00.dft" / QUEUE_FILE
+    iddx = 1 if queue_file.exists() else start_iteration.get("idx", 1)
+
     iter_folder = Path(f"iter_{iter - 1:06d}")
     candidate_dir = iter_folder / "02.dpmd" / "dft_candidates"
     candidates = sum(1 for f in candidate_dir.iterdir() if f.is_dir())
 
     labelled_files = []  # List to store candidate input (VASP: POSCAR)
     for serial in range(iddx, nid + 1):
-        # serial_dir = (candidate_dir / f"{serial:04d}")
-        # poscar_filename = serial_dir / "POSCAR"
         poscar_filename = candidate_dir / f"{serial:04d}" / "POSCAR"
         labelled_files.append(str(poscar_filename))
 
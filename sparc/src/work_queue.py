@@ -0,0 +1,257 @@
+# work_queue.py
+"""
+Persistent work queue of the DFT labelling of an iteration.
+
+Every candidate is a row of a SQLite database in the DFT directory of the
+iteration (``labelling_queue.db``) with its state, ``pending``, ``running``,
+``done`` or ``failed``, the number of attempts, start and end times, the
+labelled structure (``result``, a file written when the candidate is done)
+or the failure reason, and whether the result was written to the dataset.
+Work is handed out by ``claim``, an atomic transaction, so the driver and
+any number of worker processes can draw from the same queue. When a run is
+restarted, candidates left ``running`` by the crashed run go back to
+``pending``; ``done`` candidates are read from their result file instead of
+being computed again, and ``failed`` ones stay failed (quarantined).
+
+A candidate is identified by its index and a hash of its structure; a row
+whose structure changed is computed again.
+"""
+
+################################################################
+import hashlib
+import os
+import socket
+import sqlite3
+import time
+
+import numpy as np
+
+################################################################
+# Local import
+from sparc.src.utils.logger import SparcLog
+
+QUEUE_FILE = "labelling_queue.db"
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS candidates (
+    idx      INTEGER PRIMARY KEY,
+    digest   TEXT NOT NULL,
+    source   TEXT,
+    state    TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker   TEXT,
+    started  REAL,
+    finished REAL,
+    result   TEXT,
+    error    TEXT,
+    exported INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+
+# ===================================================================================================#
+def structure_digest(atoms):
+    """Hash of the atomic numbers, positions, cell and pbc of a structure."""
+    h = hashlib.sha256()
+    h.update(np.ascontiguousarray(atoms.numbers, dtype=np.int64).tobytes())
+    for array in (atoms.positions, atoms.cell.array):
+        h.update((np.round(np.asarray(array, dtype=np.float64), 6) + 0.0).tobytes())
+    h.update(np.asarray(atoms.pbc, dtype=bool).tobytes())
+    return h.hexdigest()
+
+
+class WorkQueue:
+    """
+    SQLite-backed queue of labelling candidates.
+
+    Parameters
+    ----------
+    filename : str
+        Database file, created if it does not exist.
+    timeout : float, optional
+        Seconds to wait for a lock held by another process (default: 60).
+    """
+
+    def __init__(self, filename, timeout=60.0):
+        self.filename = str(filename)
+        self.timeout = timeout
+        self._conn = None
+        self._pid = None
+        with self._connection() as conn:
+            conn.execute(_SCHEMA)
+
+    def _connection(self):
+        # A connection must not cross a fork, every process opens its own
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.filename, timeout=self.timeout)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._pid = os.getpid()
+        return self._conn
+
+    def __getstate__(self):
+        return {"filename": self.filename, "timeout": self.timeout}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state, _conn=None, _pid=None)
+
+    # ---------------------------------------------------------------------------------------#
+    def add(self, idx, atoms, source=None):
+        """
+        Register candidate ``idx``; a known candidate keeps its state unless
+        its structure changed.
+        """
+        digest = structure_digest(atoms)
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT digest FROM candidates WHERE idx = ?", (idx,)
+            ).fetchone()
+            if row is not None and row[0] == digest:
+                return
+            conn.execute(
+                "INSERT OR REPLACE INTO candidates (idx, digest, source, state) "
+                "VALUES (?, ?, ?, ?)",
+                (idx, digest, source, PENDING),
+            )
+
+    def recover(self):
+        """
+        Return candidates left ``running`` by a crashed run to ``pending``.
+
+        Returns:
+            int: Number of recovered candidates
+        """
+        with self._connection() as conn:
+            n = conn.execute(
+                "UPDATE candidates SET state = ?, worker = NULL WHERE state = ?",
+                (PENDING, RUNNING),
+            ).rowcount
+        if n:
+            SparcLog(f"Recovered {n} unfinished candidates from {self.filename}")
+        return n
+
+    def claim(self, indices=None, worker=None):
+        """
+        Atomically take the pending candidate with the lowest index.
+
+        Args:
+            indices (iterable): Only claim among these candidates (default: all)
+            worker (str): Name recorded for the claim (default: host:pid)
+
+        Returns:
+            int or None: Index of the claimed candidate, None if none is pending
+        """
+        worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+        query = "SELECT idx FROM candidates WHERE state = ?"
+        params = [PENDING]
+        if indices is not None:
+            indices = [int(i) for i in indices]
+            query += f" AND idx IN ({','.join('?' * len(indices))})"
+            params += indices
+        query += " ORDER BY idx LIMIT 1"
+
+        conn = self._connection()
+        conn.isolation_level = None
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(query, params).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE candidates SET state = ?, worker = ?, started = ?, "
+                    "attempts = attempts + 1 WHERE idx = ?",
+                    (RUNNING, worker, time.time(), row[0]),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.isolation_level = ""
+        return None if row is None else row[0]
+
+    def finish(self, idx, result):
+        """Mark ``idx`` done with the path of its labelled structure."""
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE candidates SET state = ?, finished = ?, result = ?, "
+                "error = NULL WHERE idx = ?",
+                (DONE, time.time(), str(result), idx),
+            )
+
+    def fail(self, idx, error):
+        """Mark ``idx`` failed with the reason."""
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE candidates SET state = ?, finished = ?, error = ? WHERE idx = ?",
+                (FAILED, time.time(), str(error), idx),
+            )
+
+    def mark_exported(self, indices):
+        """Record that the results of ``indices`` were written to the dataset."""
+        with self._connection() as conn:
+            conn.executemany(
+                "UPDATE candidates SET exported = 1 WHERE idx = ?",
+                [(int(i),) for i in indices],
+            )
+
+    # ---------------------------------------------------------------------------------------#
+    def entries(self, indices=None):
+        """
+        Rows of the queue by candidate index.
+
+        Returns:
+            dict: ``{idx: {"state", "attempts", "started", "finished", "result", "error", ...}}``
+        """
+        conn = self._connection()
+        conn.row_factory = sqlite3.Row
+        try:
+            rows = conn.execute("SELECT * FROM candidates ORDER BY idx").fetchall()
+        finally:
+            conn.row_factory = None
+        entries = {row["idx"]: dict(row) for row in rows}
+        if indices is not None:
+            entries = {i: entries[i] for i in indices if i in entries}
+        return entries
+
+    def pending(self, indices=None):
+        """Indices of the pending candidates."""
+        return [
+            i for i, entry in self.entries(indices).items() if entry["state"] == PENDING
+        ]
+
+    def done(self, indices=None):
+        """Result file of every finished candidate."""
+        return {
+            i: entry["result"]
+            for i, entry in self.entries(indices).items()
+            if entry["state"] == DONE
+        }
+
+    def failed(self, indices=None):
+        """Failure reason of every failed candidate."""
+        return {
+            i: entry["error"]
+            for i, entry in self.entries(indices).items()
+            if entry["state"] == FAILED
+        }
+
+    def counts(self):
+        """Number of candidates in every state."""
+        rows = self._connection().execute(
+            "SELECT state, COUNT(*) FROM candidates GROUP BY state"
+        )
+        return dict(rows.fetchall())
+
+    def close(self):
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+
+
+# ===================================================================================================#
+#                                     END OF FILE
+# ===================================================================================================#
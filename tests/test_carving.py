@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+from ase.calculators.singlepoint import SinglePointCalculator
+from ase.io import read, write
+from sparc.src import carving
+from sparc.src.carving import ClusterCarver, carve_sphere, carve_subcell
+from sparc.src.data_processing import get_data
+
+TRAJ_FILE = Path(__file__).resolve().parent / "data" / "mlp" / "AseMD.traj"
+
+
+class _HotSpotPot:
+    """Committee member whose forces disagree only on atom ``hot``."""
+
+    def __init__(self, scale, hot):
+        self.scale = scale
+        self.hot = hot
+
+    def get_type_map(self):
+        return ["H", "B", "N"]
+
+    def eval(self, coords, cells, atom_types):
+        nframes = coords.shape[0]
+        forces = np.zeros((nframes, len(atom_types), 3))
+        forces[:, self.hot] = self.scale
+        return np.zeros((nframes, 1)), forces, np.zeros((nframes, 9))
+
+
+@pytest.fixture
+def supercell():
+    return read(TRAJ_FILE, index=0).repeat((4, 4, 4))
+
+
+def test_carve_sphere(supercell):
+    cluster, members = carve_sphere(supercell, 0, radius=4.0, vacuum=5.0)
+
+    assert 1 < len(cluster) < len(supercell)
+    assert not cluster.pbc.any()
+    distances = supercell.get_distances(0, members, mic=True)
+    assert np.all(distances <= 4.0)
+    assert np.allclose(cluster.get_distances(0, range(len(cluster))), distances)
+
+
+def test_carve_subcell(supercell):
+    subcell, members = carve_subcell(supercell, 0, length=8.0, min_dist=0.7)
+
+    assert subcell.pbc.all() and np.allclose(subcell.cell.lengths(), 8.0)
+    assert len(subcell) == len(members) < len(supercell)
+    distances = subcell.get_all_distances(mic=True)
+    np.fill_diagonal(distances, np.inf)
+    assert distances.min() >= 0.7
+
+
+def test_cluster_carver(supercell, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(
+        carving,
+        "load_committee",
+        lambda names: [_HotSpotPot(float(i), hot=100) for i, _ in enumerate(names)],
+    )
+    carver = ClusterCarver(["a.pb", "b.pb"], radius=4.0, min_natoms=100)
+
+    pieces = carver(supercell, min_lim=0.1)
+    assert len(pieces) == 1
+    assert len(pieces[0]) < len(supercell)
+
+    # small structures are labelled whole
+    small = read(TRAJ_FILE, index=0)
+    assert carver(small, min_lim=0.1) == [small]
+
+
+def test_get_data_mixed_compositions(tmp_path: Path, supercell):
+    frames = read(TRAJ_FILE, index=":20")
+    cluster, _ = carve_sphere(supercell, 0, radius=13.0)
+    for shift in range(5):
+        atoms = cluster.copy()
+        atoms.rattle(0.01, seed=shift)
+        atoms.calc = SinglePointCalculator(
+            atoms, energy=-1.0, forces=np.zeros((len(atoms), 3))
+        )
+        frames.append(atoms)
+    mixed = tmp_path / "mixed.traj"
+    write(mixed, frames)
+
+    get_data(ase_traj=mixed, dir_name=tmp_path / "Dataset")
+
+    systems = sorted((tmp_path / "Dataset" / "training_data").glob("*/type.raw"))
+    assert len(systems) == 2
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import json
+import os
+import stat
+from pathlib import Path
+
+import pytest
+from sparc.src.committee_training import (
+    DONE,
+    FAILED,
+    Pipeline,
+    core_slices,
+    run_pipelines,
+)
+
+# Stand-in for the DeePMD CLI: records its environment and start/end times
+FAKE_DP = """#!/bin/sh
+echo "$1 $(date +%s.%N) $OMP_NUM_THREADS $(grep Cpus_allowed_list /proc/self/status | cut -f2)" >> calls.txt
+sleep 0.5
+[ -f fail_$1 ] && exit 3
+touch "$1.done"
+echo "$1 $(date +%s.%N)" >> ends.txt
+"""
+
+
+def test_core_slices(capsys: pytest.CaptureFixture):
+    assert core_slices(2, cores=range(8)) == [[0, 1, 2, 3], [4, 5, 6, 7]]
+    assert "WARNING" not in capsys.readouterr().out
+    assert core_slices(3, 2, cores=[0, 1, 2, 3]) == [[0, 1], [2, 3], [0, 1]]
+    assert "models will share cores" in capsys.readouterr().out
+    assert core_slices(4, cores=[0]) == [[0], [0], [0], [0]]
+
+
+@pytest.mark.skipif(not hasattr(os, "sched_setaffinity"), reason="Linux only")
+def test_run_pipelines(tmp_path: Path):
+    dp = tmp_path / "dp"
+    dp.write_text(FAKE_DP)
+    dp.chmod(dp.stat().st_mode | stat.S_IEXEC)
+
+    pipelines = []
+    for i in (1, 2, 3):
+        model_dir = tmp_path / f"training_{i}"
+        model_dir.mkdir()
+        commands = [[str(dp), "train"], [str(dp), "freeze"], [str(dp), "compress"]]
+        pipelines.append(Pipeline(f"training_{i}", model_dir, commands, cores=[0]))
+    (tmp_path / "training_2" / "fail_freeze").touch()
+
+    status_file = tmp_path / "training_status.json"
+    states = run_pipelines(pipelines, status_file=status_file, poll_interval=0.05)
+    assert states == {"training_1": DONE, "training_2": FAILED, "training_3": DONE}
+
+    status = json.loads(status_file.read_text())
+    assert status["training_2"]["command"].endswith("freeze")
+    assert status["training_2"]["returncode"] == 3
+    assert (tmp_path / "training_3" / "compress.done").exists()
+    assert not (tmp_path / "training_2" / "compress.done").exists()
+
+    # The pipelines ran at the same time, each limited to its cores
+    calls = [
+        line.split()
+        for i in (1, 2, 3)
+        for line in (tmp_path / f"training_{i}" / "calls.txt").read_text().splitlines()
+    ]
+    assert {(c[2], c[3]) for c in calls} == {("1", "0")}
+    starts = [float(c[1]) for c in calls if c[0] == "train"]
+    ends = [
+        float(line.split()[1])
+        for i in (1, 3)
+        for line in (tmp_path / f"training_{i}" / "ends.txt").read_text().splitlines()
+        if line.startswith("train")
+    ]
+    assert max(starts) < min(ends)
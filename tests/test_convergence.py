@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import json
+import time
+from pathlib import Path
+
+import pytest
+from ase.calculators.lj import LennardJones
+from ase.io import read, write
+from sparc.src import dft_labelling
+from sparc.src.convergence import (
+    WallClockTimeoutError,
+    cp2k_converged,
+    retry_ladder,
+    wall_clock_limit,
+)
+from sparc.src.dft_labelling import label_candidates
+
+TRAJ_FILE = Path(__file__).resolve().parent / "data" / "mlp" / "AseMD.traj"
+
+
+class _StubbornLJ(LennardJones):
+    """Converges only with sigma >= 1.5, never for structures below 8 atoms."""
+
+    def calculate(self, atoms=None, *args, **kwargs):
+        if self.parameters.sigma < 1.5 or len(atoms) < 8:
+            raise RuntimeError("SCF did not converge")
+        super().calculate(atoms, *args, **kwargs)
+
+
+def test_cp2k_converged(tmp_path: Path):
+    out = tmp_path / "job.out"
+    out.write_text(
+        " SCF WAVEFUNCTION OPTIMIZATION\n *** SCF run NOT converged ***\n"
+        " SCF WAVEFUNCTION OPTIMIZATION\n *** SCF run converged in 12 steps ***\n"
+    )
+    assert cp2k_converged(out)
+    out.write_text(
+        out.read_text() + " SCF WAVEFUNCTION OPTIMIZATION\n"
+        " *** SCF run NOT converged ***\n"
+    )
+    assert cp2k_converged(out) is False
+    assert cp2k_converged(tmp_path / "missing.out") is None
+
+
+def test_retry_ladder():
+    ladder = retry_ladder({"retry": [{"algo": "All"}, {"nelm": 200}]})
+    assert ladder == [{}, {"algo": "All"}, {"algo": "All", "nelm": 200}]
+
+
+def test_retry_and_quarantine(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(dft_labelling, "dft_calculator", lambda *args: _StubbornLJ())
+    monkeypatch.chdir(tmp_path)
+
+    frames = read(TRAJ_FILE, index=":2")
+    frames[1] = frames[1][:-1]
+    labelled_files = []
+    for serial, atoms in enumerate(frames, start=1):
+        write(f"POSCAR_{serial}", atoms, format="vasp")
+        labelled_files.append(f"POSCAR_{serial}")
+
+    config = {
+        "dft_calculator": {"name": "VASP"},
+        "labelling": {"retry": [{"sigma": 1.2}, {"sigma": 2.0}]},
+    }
+    n_labelled = label_candidates(
+        config,
+        labelled_files,
+        dir_name=".",
+        log_filename="aimd.log",
+        trajfile="AseMD.traj",
+    )
+
+    assert n_labelled == 1
+    quarantine = json.loads(Path("quarantine.json").read_text())
+    assert [entry["index"] for entry in quarantine] == [2]
+    assert quarantine[0]["file"] == str(tmp_path / "POSCAR_2")
+    assert "3 attempts" in quarantine[0]["reason"]
+
+
+class _HangingLJ(LennardJones):
+    def calculate(self, *args, **kwargs):
+        time.sleep(30)
+
+
+def test_session_timeout(monkeypatch):
+    monkeypatch.setattr(dft_labelling, "cp2k_session", lambda *args: _HangingLJ())
+    monkeypatch.setattr(dft_labelling, "close_cp2k_session", lambda: None)
+    commands = []
+
+    def calculator(config, *args):
+        commands.append(config["dft_calculator"]["exe_command"])
+        return LennardJones()
+
+    monkeypatch.setattr(dft_labelling, "dft_calculator", calculator)
+    config = {
+        "dft_calculator": {"name": "CP2K", "exe_command": "cp2k_shell"},
+        "labelling": {"cp2k_session": True},
+    }
+    settings = {"timeout": 1, "retry": [{"sigma": 1.2}]}
+
+    # the hanging session step is interrupted, the retry runs under timeout
+    start = time.perf_counter()
+    labelled = dft_labelling._compute(
+        config, settings, read(TRAJ_FILE), None, session="session"
+    )
+    assert time.perf_counter() - start < 10
+    assert labelled.get_potential_energy() is not None
+    assert commands == ["timeout --kill-after=60 1 cp2k_shell"]
+
+    with pytest.raises(WallClockTimeoutError), wall_clock_limit(0.2):
+        time.sleep(5)
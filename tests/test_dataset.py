@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pytest
+from ase.io import read, write
+from sparc.src.data_processing import (
+    DatasetBuilder,
+    assign_split,
+    build_dataset,
+    prune_near_duplicates,
+    split_indices,
+    write_deepmd_npy,
+)
+from sparc.src.work_queue import structure_digest
+
+TRAJ_FILE = Path(__file__).resolve().parent / "data" / "mlp" / "AseMD.traj"
+
+
+def _write_iteration(i, frames):
+    dft_dir = Path(f"iter_{i:06d}") / "00.dft"
+    dft_dir.mkdir(parents=True, exist_ok=True)
+    write(dft_dir / "AseMD.traj", frames)
+
+
+def _sets(dataset, split):
+    return sorted(p.relative_to(dataset) for p in (dataset / split).glob("*/set.*"))
+
+
+def test_build_dataset_incremental(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.chdir(tmp_path)
+    frames = read(TRAJ_FILE, index=":")
+    dataset = tmp_path / "Dataset"
+
+    _write_iteration(0, frames[:40])
+    builder = build_dataset("AseMD.traj", 0, dataset, skip_min=10)
+    n_training = builder.n_frames("training_data")
+    assert n_training + builder.n_frames("validation_data") == 30
+
+    system = next((dataset / "training_data").iterdir())
+    symbols = frames[0].get_chemical_symbols()
+    type_map = (system / "type_map.raw").read_text().split()
+    types = np.loadtxt(system / "type.raw", dtype=int)
+    assert [type_map[t] for t in types] == symbols
+    coord = np.load(system / "set.000" / "coord.npy")
+    assert coord.shape == (n_training, 3 * len(symbols))
+
+    # The next iteration only adds its own frames as new shards
+    _write_iteration(1, frames[40:50])
+    builder = build_dataset("AseMD.traj", 1, dataset)
+    assert builder.n_frames("training_data") + builder.n_frames("validation_data") == 40
+    assert len(_sets(dataset, "training_data")) == 2
+    assert np.array_equal(np.load(system / "set.000" / "coord.npy"), coord)
+    assert len(np.load(system / "set.001" / "energy.npy")) == (
+        builder.n_frames("training_data") - n_training
+    )
+
+    manifest = json.loads((dataset / "manifest.json").read_text())
+    assert manifest["sources"] == {
+        str(Path("iter_000000/00.dft/AseMD.traj")): {"frames": 40},
+        str(Path("iter_000001/00.dft/AseMD.traj")): {"frames": 10},
+    }
+
+    # Nothing new: nothing is converted
+    assert DatasetBuilder(dataset).update("iter_000001/00.dft/AseMD.traj") == 0
+
+
+def test_dataset_removes_unrecorded_sets(tmp_path: Path):
+    frames = read(TRAJ_FILE, index=":10")
+    write(tmp_path / "a.traj", frames)
+    builder = DatasetBuilder(tmp_path / "Dataset")
+    builder.update(tmp_path / "a.traj")
+
+    # A set written by an update that was interrupted before the manifest
+    system = next((tmp_path / "Dataset" / "training_data").iterdir())
+    (system / "set.001").mkdir()
+    DatasetBuilder(tmp_path / "Dataset")
+    assert not (system / "set.001").exists()
+    assert (system / "set.000").exists()
+
+
+def test_split_is_stable(tmp_path: Path):
+    frames = read(TRAJ_FILE, index=":")
+    digests = [structure_digest(atoms) for atoms in frames]
+    training, validation = split_indices(digests)
+    assert sorted(training + validation) == list(range(len(frames)))
+    assert 0 < len(validation) < len(frames) / 2
+    assert all(assign_split(digests[i]) == "validation_data" for i in validation)
+
+    # A frame keeps its set whatever else is in the dataset
+    write(tmp_path / "all.traj", frames)
+    write(tmp_path / "part.traj", frames[::-3])
+    recorded = []
+    for name in ("all", "part"):
+        builder = DatasetBuilder(tmp_path / name)
+        builder.update(tmp_path / f"{name}.traj")
+        (system,) = builder.manifest["systems"]
+        recorded.append(builder.digests(system))
+    for split in ("training_data", "validation_data"):
+        assert set(recorded[1][split]) <= set(recorded[0][split])
+
+    # Frames that are already in the dataset are not added again
+    assert builder.update(tmp_path / "all.traj") == len(
+        set(digests) - set(digests[::-3])
+    )
+
+    # Tiny datasets still get a validation frame
+    assert split_indices(digests[:2])[1]
+
+
+def test_write_deepmd_npy_matches_dpdata(tmp_path: Path):
+    dpdata = pytest.importorskip("dpdata")
+    n_frames = write_deepmd_npy(TRAJ_FILE, tmp_path / "system", set_size=7)
+    assert n_frames == 80
+    assert len(list((tmp_path / "system").glob("set.*"))) == 12
+
+    system = dpdata.LabeledSystem(str(tmp_path / "system"), fmt="deepmd/npy")
+    reference = dpdata.LabeledSystem(str(TRAJ_FILE), fmt="ase/traj")
+    assert system.get_nframes() == reference.get_nframes()
+    for key in ("coords", "cells", "energies", "forces"):
+        assert np.allclose(system.data[key], reference.data[key])
+
+    # Coordinates only, e.g. for dp model-devi
+    write_deepmd_npy(TRAJ_FILE, tmp_path / "system", labels=False)
+    assert sorted(p.name for p in (tmp_path / "system" / "set.000").iterdir()) == [
+        "box.npy",
+        "coord.npy",
+    ]
+
+
+def test_prune_near_duplicates():
+    descriptors = np.array([[0.0], [0.05], [1.0], [1.05], [0.02]])
+    assert list(prune_near_duplicates(descriptors, 0.1)) == [0, 2]
+    assert list(prune_near_duplicates(descriptors, 0.1, np.array([[1.0]]))) == [0]
+
+
+def test_dataset_pruning(tmp_path: Path):
+    frames = read(TRAJ_FILE, index=":")
+    n_unique = len({structure_digest(atoms) for atoms in frames})
+    write(tmp_path / "a.traj", frames[:40])
+    write(tmp_path / "b.traj", frames[40:])
+
+    # Pruning enabled on a dataset built without it
+    DatasetBuilder(tmp_path / "Dataset").update(tmp_path / "a.traj")
+    builder = DatasetBuilder(tmp_path / "Dataset", prune_tol=0.3)
+    added = builder.update(tmp_path / "b.traj")
+    assert builder.pruned > 0
+    n_frames = builder.n_frames("training_data") + builder.n_frames("validation_data")
+    assert n_frames + builder.pruned == n_unique
+    assert added == n_frames - len({structure_digest(a) for a in frames[:40]})
+
+    (name,) = builder.manifest["systems"]
+    kept = np.load(tmp_path / "Dataset" / "descriptors" / f"{name}.npy")
+    assert len(kept) == n_frames
+    assert len(builder.digests(name)["pruned"]) == builder.pruned
+
+
+def test_dataset_digest_files(tmp_path: Path):
+    frames = read(TRAJ_FILE, index=":20")
+    write(tmp_path / "a.traj", frames[:10])
+    write(tmp_path / "b.traj", frames[10:])
+    builder = DatasetBuilder(tmp_path / "Dataset")
+    builder.update(tmp_path / "a.traj")
+    (name,) = builder.manifest["systems"]
+    digest_file = tmp_path / "Dataset" / "digests" / f"{name}.training_data.u64"
+    recorded = np.fromfile(digest_file, dtype="<u8")
+    assert len(recorded) == builder.n_frames("training_data")
+    assert "frames" not in json.loads(
+        (tmp_path / "Dataset" / "manifest.json").read_text()
+    )
+
+    # Hashes appended by an update that did not reach the manifest are cut off
+    with open(digest_file, "ab") as f:
+        np.arange(3, dtype="<u8").tofile(f)
+    builder = DatasetBuilder(tmp_path / "Dataset")
+    assert np.array_equal(builder.digests(name)["training_data"], recorded)
+    assert np.array_equal(np.fromfile(digest_file, dtype="<u8"), recorded)
+
+    # Missing hashes are computed again from the sets
+    digest_file.unlink()
+    builder = DatasetBuilder(tmp_path / "Dataset")
+    assert np.array_equal(builder.digests(name)["training_data"], recorded)
+    assert builder.update(tmp_path / "b.traj") == len(
+        {structure_digest(atoms) for atoms in frames}
+        - {structure_digest(atoms) for atoms in frames[:10]}
+    )
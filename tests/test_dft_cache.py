@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+from ase.calculators.lj import LennardJones
+from ase.io import read
+from sparc.src.dft_cache import CachedCalculator, DFTCache
+
+TRAJ_FILE = Path(__file__).resolve().parent / "data" / "mlp" / "AseMD.traj"
+
+
+class _CountingLJ(LennardJones):
+    calls = 0
+
+    def calculate(self, *args, **kwargs):
+        _CountingLJ.calls += 1
+        super().calculate(*args, **kwargs)
+
+
+def _config(cutoff):
+    return {"dft_calculator": {"name": "CP2K"}, "cp2k": {"cutoff": cutoff}}
+
+
+def test_dft_cache(tmp_path: Path):
+    frames = read(TRAJ_FILE, index=":3")
+    cache = DFTCache(tmp_path / "cache", _config(400))
+    assert cache.get(frames[0]) is None
+
+    reference = []
+    for rerun in range(2):
+        for frame in frames:
+            atoms = frame.copy()
+            atoms.calc = CachedCalculator(_CountingLJ(), cache)
+            reference.append((atoms.get_potential_energy(), atoms.get_forces()))
+    assert _CountingLJ.calls == 3 and cache.hits == 3
+    for (e1, f1), (e2, f2) in zip(reference[:3], reference[3:]):
+        assert e1 == e2 and np.allclose(f1, f2)
+
+    # tiny displacements below the key precision hit, other setups do not
+    shifted = frames[0].copy()
+    shifted.positions += 1e-9
+    assert cache.key(shifted) == cache.key(frames[0])
+    other = DFTCache(tmp_path / "cache", _config(500))
+    assert other.get(frames[0]) is None
+
+
+def test_dft_cache_retry_overrides(tmp_path: Path):
+    atoms = read(TRAJ_FILE, index=0)
+    cache = DFTCache(tmp_path / "cache", _config(400))
+    rung = {"scf_max": 200, "eps_scf": 1e-5}
+
+    # A result of a retry rung does not answer a lookup with the base setup
+    labelled = atoms.copy()
+    labelled.calc = CachedCalculator(_CountingLJ(), cache, overrides=rung)
+    energy = labelled.get_potential_energy()
+    assert cache.get(atoms) is None
+    assert cache.get(atoms, dict(reversed(rung.items())))["energy"] == energy
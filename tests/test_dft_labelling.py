@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+from ase.calculators.lj import LennardJones
+from ase.io import read, write
+from sparc.src import calculator, dft_labelling
+from sparc.src.calculator import close_cp2k_session, cp2k_session
+from sparc.src.dft_labelling import label_candidates, slot_fields
+
+
+def _emt_calculator(config, print_screen=False, directory=None):
+    if directory is not None:
+        Path(directory, "job.log").write_text(config["dft_calculator"]["exe_command"])
+    return LennardJones()
+
+
+def test_slot_fields():
+    assert slot_fields(2, 16) == {"slot": 2, "cores": 16, "cpu_list": "32-47"}
+
+
+def test_label_candidates_concurrently(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(dft_labelling, "dft_calculator", _emt_calculator)
+
+    repo_root = Path(__file__).resolve().parents[1]
+    frames = read(repo_root / "tests" / "data" / "mlp" / "AseMD.traj", index=":6")
+    labelled_files = []
+    for serial, atoms in enumerate(frames, start=1):
+        poscar = tmp_path / "dft_candidates" / f"{serial:04d}" / "POSCAR"
+        poscar.parent.mkdir(parents=True)
+        write(poscar, atoms, format="vasp")
+        labelled_files.append(str(poscar))
+
+    config = {
+        "dft_calculator": {"exe_command": "vasp_std"},
+        "labelling": {
+            "workers": 3,
+            "cores_per_job": 2,
+            "exe_command": "mpirun -np {cores} vasp_std",
+        },
+    }
+    done = []
+    n_labelled = label_candidates(
+        config,
+        labelled_files,
+        dir_name=tmp_path,
+        log_filename="aimd.log",
+        trajfile="AseMD.traj",
+        progress=done.append,
+    )
+
+    assert n_labelled == 6 and done == [6]
+    assert (tmp_path / "jobs" / "0004" / "job.log").read_text() == (
+        "mpirun -np 2 vasp_std"
+    )
+    labelled = read(tmp_path / "AseMD.traj", index=":")
+    for atoms, frame in zip(labelled, frames):
+        frame.calc = LennardJones()
+        assert np.isclose(atoms.get_potential_energy(), frame.get_potential_energy())
+
+
+class _Session:
+    closed = 0
+
+    def close(self):
+        _Session.closed += 1
+
+
+def test_cp2k_session(monkeypatch):
+    monkeypatch.setattr(calculator, "dft_calculator", lambda *args: _Session())
+    frames = read(
+        Path(__file__).resolve().parent / "data" / "mlp" / "AseMD.traj", index=":2"
+    )
+    config = {"dft_calculator": {"name": "CP2K"}}
+
+    first = cp2k_session(config, frames[0], "jobs/session")
+    assert cp2k_session(config, frames[1], "jobs/session") is first
+
+    # a new composition starts a new session
+    assert cp2k_session(config, frames[0][:-1], "jobs/session") is not first
+    assert _Session.closed == 1
+    close_cp2k_session()
+    assert _Session.closed == 2
+
+
+class _FailingLJ(LennardJones):
+    def calculate(self, atoms=None, *args, **kwargs):
+        if len(atoms) < 8:
+            raise RuntimeError("SCF did not converge")
+        super().calculate(atoms, *args, **kwargs)
+
+
+def test_label_candidates_batch(tmp_path: Path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(dft_labelling, "dft_calculator", lambda *args: _FailingLJ())
+
+    frames = read(
+        Path(__file__).resolve().parent / "data" / "mlp" / "AseMD.traj", index=":3"
+    )
+    frames[1] = frames[1][:-1]  # fails
+    labelled_files = []
+    for serial, atoms in enumerate(frames, start=1):
+        poscar = tmp_path / f"POSCAR_{serial}"
+        write(poscar, atoms, format="vasp")
+        labelled_files.append(str(poscar))
+
+    config = {"dft_calculator": {"name": "VASP"}, "labelling": {"workers": 1}}
+    n_labelled = label_candidates(
+        config,
+        labelled_files,
+        dir_name=tmp_path,
+        log_filename="aimd.log",
+        trajfile="AseMD.traj",
+    )
+
+    assert n_labelled == 2
+    assert len(read(tmp_path / "AseMD.traj", index=":")) == 2
+    assert len(read(tmp_path / "AseTraj.xyz", index=":")) == 2
+    log = (tmp_path / "aimd.log").read_text().splitlines()
+    assert [int(line.split()[0]) for line in log[1:]] == [1, 3]
+    assert (tmp_path / "quarantine.json").exists()
@@ -3,6 +3,7 @@ from __future__ import annotations
 import json
 import os
 import shutil
+import sys
 from pathlib import Path
 import warnings
 from ase.config import ASEEnvDeprecationWarning
@@ -225,3 +226,30 @@ def test_vasp_calculator_wrapper(
         f"  current   = {max_force:.12f} eV/Ang.\n"
         f"  diff F = {dF:.6e} eV/Ang. (tol = {force_tol:.3e})"
     )
+
+
+def test_vasp_interactive_setup(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """
+    Interactive VASP replaces the ionic keywords of an AIMD INCAR.
+    VASP is only started on the first step, so no executable is run.
+    """
+    from ase.calculators.vasp.interactive import VaspInteractive
+
+    monkeypatch.chdir(tmp_path)
+    Path("INCAR").write_text("ENCUT = 400\nIBRION = 0\nPOTIM = 1.0\nNSW = 100\n")
+    config = {
+        "dft_calculator": {
+            "name": "VASP",
+            "prec": "Normal",
+            "kgamma": True,
+            "incar_file": "INCAR",
+            "exe_command": sys.executable,
+        },
+        "md_simulation": {"steps": 5000},
+    }
+
+    calc = dft_calculator(config, interactive=True)
+    assert isinstance(calc, VaspInteractive)
+    assert calc.int_params["ibrion"] == -1 and calc.int_params["nsw"] == 5010
+    assert calc.int_params["iwavpr"] == 11 and calc.bool_params["interactive"]
+    assert (tmp_path / "vasp").is_dir()
@@ -10,6 +10,7 @@ import numpy as np
 import pytest
 from ase.io import read
 from sparc.src.utils.read_incar import read_incar
+from sparc.src.utils.read_input import load_config
 from sparc.src.utils.utils import load_checkpoint
 
 def test_read_incar(tmp_path: Path):
@@ -29,3 +30,15 @@ def test_load_checkpoint(tmp_path: Path):
     updated_atoms, mdstep = load_checkpoint(atoms, checkpoint_path)
 
     assert isinstance(float(mdstep), float), f"Invalid step, check your file is correct."
+
+
+def test_backend_requires_vasp(tmp_path: Path):
+    input_file = tmp_path / "input.yaml"
+    input_file.write_text(
+        "general: {}\n"
+        "dft_calculator: {name: CP2K}\n"
+        "md_simulation: {thermostat: Nose, tdamp: 100}\n"
+        "labelling: {backend: slurm}\n"
+    )
+    with pytest.raises(ValueError, match="VASP only"):
+        load_config(str(input_file))
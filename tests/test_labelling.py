@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+from ase.io import read, write
+from sparc.src.fingerprint_index import FingerprintIndex
+from sparc.src.labelling import labelling
+from sparc.src.model_deviation import write_model_devi
+from sparc.src.selection import (
+    CandidateBacklog,
+    farthest_point_sampling,
+    rank_candidates,
+)
+from sparc.src.utils.utils import iread_frames
+
+
+@pytest.fixture
+def dpmd_run(tmp_path: Path):
+    """ML/MD trajectory with a synthetic model deviation table."""
+    repo_root = Path(__file__).resolve().parents[1]
+    traj_file = repo_root / "tests" / "data" / "mlp" / "AseMD.traj"
+    nframes = len(read(traj_file, index=":"))
+
+    devi = np.zeros((nframes, 8))
+    devi[:, 0] = np.arange(nframes)
+    devi[:, 4] = np.linspace(0.0, 0.4, nframes)
+    outfile = tmp_path / "model_dev_0.out"
+    write_model_devi(devi, outfile)
+    return traj_file, outfile, devi
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_labelling_window(tmp_path: Path, dpmd_run, streaming):
+    traj_file, outfile, devi = dpmd_run
+    output_dir = tmp_path / f"candidates_{streaming}"
+
+    found, files = labelling(
+        traj_file, outfile, 0.1, 0.2, output_dir=output_dir, streaming=streaming
+    )
+
+    expected = np.flatnonzero((devi[:, 4] >= 0.1) & (devi[:, 4] <= 0.2))
+    assert found
+    assert len(files) == len(expected)
+
+    frames = read(traj_file, index=":")
+    for poscar, frame_index in zip(files, expected):
+        atoms = read(poscar, format="vasp")
+        assert np.allclose(
+            atoms.get_positions(), frames[frame_index].get_positions(), atol=1e-5
+        )
+
+
+def test_labelling_no_candidates(tmp_path: Path, dpmd_run):
+    traj_file, outfile, _ = dpmd_run
+    found, files = labelling(traj_file, outfile, 1.0, 2.0, streaming=True)
+    assert not found and files == []
+
+
+def test_farthest_point_sampling():
+    points = np.array([[0.0], [0.1], [0.2], [5.0], [10.0]])
+    assert farthest_point_sampling(points, 3, start=0) == [0, 4, 3]
+    assert farthest_point_sampling(points, 10) == list(range(5))
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_labelling_fps_budget(tmp_path: Path, dpmd_run, streaming):
+    traj_file, outfile, _ = dpmd_run
+
+    found, files = labelling(
+        traj_file,
+        outfile,
+        0.0,
+        0.4,
+        output_dir=tmp_path / "candidates",
+        streaming=streaming,
+        fps_budget=5,
+        descriptor={"r_max": 5.0, "n_bins": 16},
+    )
+
+    assert found and len(files) == 5
+    # sampling starts from the largest deviation (last frame)
+    last = read(traj_file, index=-1)
+    atoms = read(files[-1], format="vasp")
+    assert np.allclose(atoms.get_positions(), last.get_positions(), atol=1e-5)
+
+
+def test_fingerprint_index_skips_labelled(tmp_path: Path, dpmd_run):
+    traj_file, outfile, _ = dpmd_run
+    frames = read(traj_file, index=":")
+
+    index = FingerprintIndex(index_dir=tmp_path / "index")
+    for atoms in frames[:10]:
+        index.add(atoms)
+    assert index.contains(frames[3], tol=1e-8)
+    index.save()
+
+    # the index is reloaded from disk and the first 10 frames are skipped
+    index = FingerprintIndex(index_dir=tmp_path / "index")
+    assert len(index) == 10
+    found, files = labelling(
+        traj_file,
+        outfile,
+        0.0,
+        0.4,
+        output_dir=tmp_path / "candidates",
+        streaming=True,
+        fingerprint_index=index,
+        fingerprint_tol=1e-8,
+    )
+    assert found and len(files) == len(frames) - 10
+    # candidates are only indexed once they are labelled
+    assert len(index) == 10
+
+
+@pytest.mark.parametrize("strategy", ["top", "stratified"])
+def test_rank_candidates(strategy):
+    frame_devi = {i: 0.01 * i for i in range(20)}
+    selected, remainder = rank_candidates(frame_devi, 4, strategy=strategy, n_bins=4)
+
+    assert len(selected) == 4 and selected == sorted(selected)
+    assert sorted(selected + remainder) == list(range(20))
+    assert remainder == sorted(remainder, key=frame_devi.get, reverse=True)
+    if strategy == "top":
+        assert selected == [16, 17, 18, 19]
+    else:
+        assert selected == [4, 9, 14, 19]
+
+
+def test_labelling_budget_backlog(tmp_path: Path, dpmd_run):
+    traj_file, outfile, devi = dpmd_run
+    backlog = CandidateBacklog(tmp_path / "backlog.json")
+
+    found, files = labelling(
+        traj_file,
+        outfile,
+        0.2,
+        0.4,
+        output_dir=tmp_path / "iter_1",
+        streaming=True,
+        max_candidates=5,
+        backlog=backlog,
+    )
+    n_window = int(np.sum(devi[:, 4] >= 0.2))
+    assert found and len(files) == 5
+    assert len(CandidateBacklog(tmp_path / "backlog.json")) == n_window - 5
+
+    # a later iteration with a single fresh candidate is topped up from the queue
+    backlog = CandidateBacklog(tmp_path / "backlog.json")
+    found, files = labelling(
+        traj_file,
+        outfile,
+        0.0,
+        0.0,
+        output_dir=tmp_path / "iter_2",
+        streaming=True,
+        max_candidates=5,
+        backlog=backlog,
+    )
+    assert found and len(files) == 5
+    assert len(backlog) == n_window - 9
+    atoms = read(files[1], format="vasp")
+    frame = read(traj_file, index=int(np.sum(devi[:, 4] < 0.4)) - 5)
+    assert np.allclose(atoms.get_positions(), frame.get_positions(), atol=1e-5)
+
+
+def test_labelling_backlog_without_fresh_candidates(tmp_path: Path, dpmd_run):
+    traj_file, outfile, devi = dpmd_run
+    frames = read(traj_file, index=":")
+    backlog = CandidateBacklog(tmp_path / "backlog.json")
+    backlog.push(traj_file, dict(enumerate(devi[:, 4])), range(len(frames)))
+
+    # the top entries are already labelled; the budget is filled with the next ones
+    index = FingerprintIndex(index_dir=tmp_path / "index")
+    for atoms in frames[-3:]:
+        index.add(atoms)
+    found, files = labelling(
+        traj_file,
+        outfile,
+        1.0,
+        2.0,
+        output_dir=tmp_path / "candidates",
+        streaming=True,
+        fingerprint_index=index,
+        fingerprint_tol=1e-8,
+        max_candidates=4,
+        backlog=backlog,
+    )
+    assert found and len(files) == 4
+    for poscar in files:
+        positions = read(poscar, format="vasp").get_positions()
+        assert not any(
+            np.allclose(positions, atoms.get_positions(), atol=1e-5)
+            for atoms in frames[-3:]
+        )
+    assert len(backlog) < len(frames) - 4
+
+
+def test_fingerprint_index_only_labelled(tmp_path: Path, dpmd_run):
+    traj_file, _, _ = dpmd_run
+    frames = read(traj_file, index=":5")
+    dft_dir = tmp_path / "iter_000000" / "00.dft"
+    dft_dir.mkdir(parents=True)
+    write(dft_dir / "AseMD.traj", frames[:3])
+    # a candidate whose DFT run failed is not indexed
+    poscar_dir = tmp_path / "iter_000000" / "02.dpmd" / "dft_candidates" / "0001"
+    poscar_dir.mkdir(parents=True)
+    write(poscar_dir / "POSCAR", frames[4], format="vasp")
+
+    index = FingerprintIndex(index_dir=tmp_path / "index")
+    assert index.update_from_tree(tmp_path) == 3
+    assert not index.contains(frames[4], tol=1e-8)
+
+    # the rows added since the last query are stacked before the next one
+    index.add(frames[4])
+    assert len(index) == 4 and index.contains(frames[4], tol=1e-8)
+    index.save()
+    assert len(FingerprintIndex(index_dir=tmp_path / "index")) == 4
+
+
+@pytest.mark.parametrize("suffix", [".traj", ".xyz"])
+def test_iread_frames_out_of_range(tmp_path: Path, capsys, suffix):
+    repo_root = Path(__file__).resolve().parents[1]
+    frames = read(repo_root / "tests" / "data" / "mlp" / "AseMD.traj", index=":5")
+    trajfile = tmp_path / f"frames{suffix}"
+    write(trajfile, [atoms.copy() for atoms in frames])
+
+    read_indices = [i for i, _ in iread_frames(trajfile, [7, 1, 3, 5])]
+    assert read_indices == [1, 3]
+    assert "2 requested frame(s) beyond the 5 frames" in capsys.readouterr().out
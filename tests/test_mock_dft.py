@@ -0,0 +1,19 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "benchmarks"))
+from labelling_throughput import run_mode
+
+
+@pytest.mark.parametrize("code, mode", [("vasp", "serial"), ("cp2k", "session")])
+def test_labelling_with_mock_dft(tmp_path: Path, code, mode):
+    traj_file = Path(__file__).resolve().parent / "data" / "mlp" / "AseMD.traj"
+    result = run_mode(code, mode, 2, 0.0, traj_file, tmp_path)
+
+    assert result["labelled"] == 2
+    assert result["dft_busy_s"] > 0
+    assert 0 < result["efficiency"] <= 1
@@ -0,0 +1,278 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+from ase.io import read, write
+from sparc.src import model_deviation
+from sparc.src.active_learning import (
+    QueryOnTheFly,
+    driving_model,
+    setup_committee_monitor,
+)
+from sparc.src.model_deviation import (
+    CommitteeDeviation,
+    DeviationCache,
+    adaptive_thresholds,
+    committee_deviation,
+    read_model_devi,
+    write_model_devi,
+)
+from sparc.src.selection import CandidateBacklog
+
+
+class _FakeDeepPot:
+    """
+    Minimal stand-in for ``deepmd.infer.DeepPot``: a harmonic model whose
+    stiffness differs between committee members.
+    """
+
+    def __init__(self, k):
+        self.k = k
+
+    def get_type_map(self):
+        return ["O", "H", "N", "B", "C"]
+
+    def eval(self, coords, cells, atom_types):
+        nframes = coords.shape[0]
+        xyz = coords.reshape(nframes, -1, 3)
+        forces = -self.k * xyz
+        energy = 0.5 * self.k * (xyz**2).sum(axis=(1, 2))
+        virial = np.einsum("fai,faj->fij", xyz, forces).reshape(nframes, 9)
+        return energy[:, None], forces, virial
+
+
+def test_committee_deviation_matches_reference():
+    rng = np.random.default_rng(0)
+    nmodels, nframes, natoms = 3, 4, 5
+    forces = rng.normal(size=(nmodels, nframes, natoms, 3))
+    energies = rng.normal(size=(nmodels, nframes))
+    virials = rng.normal(size=(nmodels, nframes, 9))
+
+    devi, atomic = committee_deviation(
+        energies, forces, virials, natoms, np.arange(nframes)
+    )
+
+    assert devi.shape == (nframes, 8)
+    for frame in range(nframes):
+        ref_atomic = [
+            np.sqrt(
+                np.mean(
+                    np.sum(
+                        (forces[:, frame, a] - forces[:, frame, a].mean(0)) ** 2,
+                        axis=-1,
+                    )
+                )
+            )
+            for a in range(natoms)
+        ]
+        assert np.allclose(atomic[frame], ref_atomic)
+        assert np.isclose(devi[frame, 4], max(ref_atomic))
+        assert np.isclose(devi[frame, 7], np.std(energies[:, frame] / natoms))
+
+
+def test_write_and_read_model_devi(tmp_path: Path):
+    devi = np.column_stack([np.arange(3), np.random.rand(3, 7)])
+    outfile = tmp_path / "model_dev_0.out"
+
+    npy_file = write_model_devi(devi, outfile, header="test")
+
+    assert Path(npy_file).exists()
+    text = np.loadtxt(outfile, comments="#")
+    assert np.allclose(text, devi, atol=1e-6)
+    assert np.allclose(read_model_devi(outfile), devi)
+
+
+def test_adaptive_thresholds():
+    max_devi_f = np.linspace(0.0, 1.0, 101)
+
+    # many candidates: the lower bound rises until about `target` frames remain
+    lower, upper = adaptive_thresholds(max_devi_f, 10, max_lim=0.5)
+    assert upper == 0.5
+    assert np.sum((max_devi_f >= lower) & (max_devi_f <= upper)) == 10
+
+    # upper quantile below the hard limit
+    _, upper = adaptive_thresholds(max_devi_f, 10, 0.5, quantiles=(0.0, 0.3))
+    assert np.isclose(upper, 0.3)
+
+    # a converged committee never goes below the floor
+    lower, upper = adaptive_thresholds(max_devi_f * 0.01, 10, 0.5, f_min_floor=0.02)
+    assert lower == 0.02 and not np.any(max_devi_f * 0.01 >= lower)
+
+
+def test_inprocess_engine(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    repo_root = Path(__file__).resolve().parents[1]
+    traj_file = repo_root / "tests" / "data" / "mlp" / "AseMD.traj"
+    nframes = len(read(traj_file, index=":"))
+
+    monkeypatch.setattr(
+        model_deviation,
+        "load_committee",
+        lambda names: [_FakeDeepPot(1.0 + i) for i, _ in enumerate(names)],
+    )
+
+    outfile = tmp_path / "model_dev_0.out"
+    devi = CommitteeDeviation(
+        trajfile=traj_file,
+        model_names=["a.pb", "b.pb"],
+        outfile=outfile,
+        batch_size=3,
+    )
+
+    assert devi.shape == (nframes, 8)
+    assert np.array_equal(devi[:, 0], np.arange(nframes))
+    assert np.all(devi[:, 4] >= devi[:, 6]) and np.all(devi[:, 6] >= devi[:, 5])
+    assert np.allclose(np.loadtxt(outfile, comments="#"), devi, rtol=1e-5)
+
+
+def test_committee_monitor_collects_frames(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    repo_root = Path(__file__).resolve().parents[1]
+    frames = read(repo_root / "tests" / "data" / "mlp" / "AseMD.traj", index=":6")
+
+    monkeypatch.setattr(
+        model_deviation,
+        "load_committee",
+        lambda names: [_FakeDeepPot(1.0 + 0.01 * i) for i, _ in enumerate(names)],
+    )
+
+    monitor = model_deviation.CommitteeMonitor(
+        model_names=["a.pb", "b.pb"],
+        min_lim=0.0,
+        max_lim=np.inf,
+        output_dir=tmp_path,
+        interval=2,
+    )
+    monitor.begin_run()
+    for step, atoms in enumerate(frames):
+        monitor(atoms, step)
+    devi_file = monitor.end_run(tmp_path)
+
+    assert np.load(devi_file).shape == (3, 8)
+    assert monitor.n_in_window == 3
+    collected = read(monitor.frames_file, index=":")
+    assert len(collected) == 3
+    assert np.allclose(collected[1].get_positions(), frames[2].get_positions())
+    assert monitor.deviation().shape == (3, 8)
+    assert not list(tmp_path.rglob("POSCAR*"))
+
+
+def test_query_on_the_fly_applies_budget(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    repo_root = Path(__file__).resolve().parents[1]
+    frames = read(repo_root / "tests" / "data" / "mlp" / "AseMD.traj", index=":12")
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(
+        model_deviation,
+        "load_committee",
+        lambda names: [_FakeDeepPot(1.0 + 0.01 * i) for i, _ in enumerate(names)],
+    )
+
+    monitor = model_deviation.CommitteeMonitor(
+        model_names=["a.pb", "b.pb"],
+        min_lim=0.0,
+        max_lim=np.inf,
+        output_dir=tmp_path,
+    )
+    monitor.begin_run()
+    for step, atoms in enumerate(frames):
+        monitor(atoms, step)
+    monitor.end_run(tmp_path)
+
+    found, files, _ = QueryOnTheFly(
+        monitor,
+        trajfile=tmp_path / "AseMD.traj",
+        dpmd_data_path=tmp_path,
+        model_dev={"max_candidates": 4},
+    )
+    assert found and len(files) == 4
+    assert len(CandidateBacklog("candidate_backlog.json")) == len(frames) - 4
+    assert np.allclose(
+        read_model_devi(tmp_path / "model_dev_0.out")[:, 0], np.arange(len(frames))
+    )
+
+
+def test_deviation_cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    repo_root = Path(__file__).resolve().parents[1]
+    frames = read(repo_root / "tests" / "data" / "mlp" / "AseMD.traj", index=":")
+    models = []
+    for i in range(2):
+        models.append(tmp_path / f"frozen_model_{i}.pb")
+        models[-1].write_bytes(bytes([i]))
+
+    evaluated = []
+
+    class _CountingPot(_FakeDeepPot):
+        def eval(self, coords, cells, atom_types):
+            evaluated.append(coords.shape[0])
+            return super().eval(coords, cells, atom_types)
+
+    monkeypatch.setattr(
+        model_deviation,
+        "load_committee",
+        lambda names: [_CountingPot(1.0 + i) for i, _ in enumerate(names)],
+    )
+
+    def run(nframes):
+        traj_file = tmp_path / "dpmd.traj"
+        write(traj_file, frames[:nframes])
+        evaluated.clear()
+        cache = DeviationCache(tmp_path / "cache", models)
+        devi = CommitteeDeviation(
+            traj_file, models, tmp_path / "model_dev.out", batch_size=7, cache=cache
+        )
+        return devi, sum(evaluated) // len(models)
+
+    reference, n_eval = run(30)
+    assert n_eval == 30
+
+    # the grown trajectory only evaluates the appended frames
+    devi, n_eval = run(60)
+    assert n_eval == 30
+    assert np.allclose(devi[:30], reference)
+
+    # every batch was saved as a shard, merged when the cache is loaded
+    assert len(list((tmp_path / "cache").glob("*.npz"))) > 1
+    assert len(DeviationCache(tmp_path / "cache", models)) == 60
+    assert len(list((tmp_path / "cache").glob("*.npz"))) == 1
+
+    # a restart reuses everything
+    _, n_eval = run(60)
+    assert n_eval == 0
+
+
+def test_monitor_reuses_driving_model(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    train_dir = tmp_path / "iter_000001" / "01.train"
+    for i in range(1, 4):
+        model_dir = train_dir / f"training_{i}"
+        model_dir.mkdir(parents=True)
+        (model_dir / f"frozen_model_{i}.pb").write_bytes(bytes([i]))
+    config = {
+        "active_learning": True,
+        "model_dev": {"on_the_fly": True, "f_min_dev": 0.05, "f_max_dev": 0.5},
+        "deepmd_setup": {"num_models": 3},
+    }
+    monkeypatch.setattr(
+        model_deviation,
+        "load_committee",
+        lambda names: [_FakeDeepPot(1.0 + i) for i, _ in enumerate(names)],
+    )
+
+    # the AL loop drives the MD with the previous iteration's model by default
+    monitor = setup_committee_monitor(config, train_dir, tmp_path / "02.dpmd")
+    dp_path, dp_model = driving_model(
+        monitor, tmp_path, "iter_000000/frozen_model_1.pb"
+    )
+    assert Path(dp_path, dp_model) == train_dir / "training_1" / "frozen_model_1.pb"
+
+    calc = object()
+    monitor.set_reference(calc, os.path.join(dp_path, dp_model))
+    assert monitor.reference_calc is calc
+
+    # without a monitor the default model is kept
+    assert driving_model(None, tmp_path, "model.pb") == (tmp_path, "model.pb")
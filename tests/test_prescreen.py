@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+from ase.calculators.singlepoint import SinglePointCalculator
+from ase.io import read, write
+from sparc.src.labelling import labelling
+from sparc.src.model_deviation import write_model_devi
+from sparc.src.prescreen import PreScreen
+
+TRAJ_FILE = Path(__file__).resolve().parent / "data" / "mlp" / "AseMD.traj"
+
+
+def _clash(atoms):
+    atoms = atoms.copy()
+    atoms.positions[1] = atoms.positions[0] + [0.3, 0.0, 0.0]
+    return atoms
+
+
+def _split(atoms):
+    atoms = atoms.copy()
+    atoms.positions[1] += [3.0, 3.0, 3.0]
+    return atoms
+
+
+def test_prescreen_checks():
+    reference = read(TRAJ_FILE, index=0)
+    prescreen = PreScreen(energy_window=0.5)
+    prescreen.set_reference(reference)
+    assert prescreen.max_fragments == 1
+
+    assert prescreen.check(read(TRAJ_FILE, index=2)) is None
+    assert "distance 0.30" in prescreen.check(_clash(reference))
+    assert prescreen.check(_split(reference)).startswith("2 fragments")
+
+    hot = reference.copy()
+    energy = reference.get_potential_energy() + 1.0 * len(reference)
+    hot.calc = SinglePointCalculator(hot, energy=energy)
+    assert "MLP energy" in prescreen.check(hot)
+
+    # Explicit pair distances override the covalent radii
+    strict = PreScreen(min_distances={"B-N": 1.5})
+    assert strict.check(reference).startswith("B")
+
+
+def test_labelling_prescreen(tmp_path: Path):
+    frames = read(TRAJ_FILE, index=":3")
+    frames = [frames[0], _clash(frames[1]), frames[1], _split(frames[2]), frames[2]]
+    traj_file = tmp_path / "AseMD.traj"
+    write(traj_file, frames)
+
+    devi = np.zeros((len(frames), 8))
+    devi[:, 0] = np.arange(len(frames))
+    devi[:, 4] = 0.1
+    outfile = tmp_path / "model_dev_0.out"
+    write_model_devi(devi, outfile)
+
+    prescreen = PreScreen()
+    prescreen.set_reference(frames[0])
+    found, files = labelling(
+        traj_file,
+        outfile,
+        0.05,
+        0.2,
+        output_dir=tmp_path / "candidates",
+        prescreen=prescreen,
+    )
+
+    assert found and len(files) == 3
+    for poscar, frame_index in zip(files, [0, 2, 4]):
+        atoms = read(poscar, format="vasp")
+        assert np.allclose(
+            atoms.get_positions(), frames[frame_index].get_positions(), atol=1e-5
+        )
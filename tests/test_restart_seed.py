@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from ase.calculators.calculator import Parameters
+from ase.calculators.vasp import Vasp
+from ase.io import read, write
+from sparc.src.restart_seed import RestartSeeds
+
+TRAJ_FILE = Path(__file__).resolve().parent / "data" / "mlp" / "AseMD.traj"
+
+
+class _CP2KInput:
+    """Input side of the CP2K calculator (which starts cp2k_shell on creation)."""
+
+    def __init__(self, label, inp):
+        self.label = label
+        self.parameters = Parameters(inp=inp)
+
+    def set(self, **kwargs):
+        self.parameters.update(kwargs)
+
+
+def _finished_job(job_dir: Path, atoms, files):
+    job_dir.mkdir(parents=True)
+    write(job_dir / "candidate.vasp", atoms, format="vasp")
+    for name, content in files.items():
+        (job_dir / name).write_text(content)
+
+
+def test_vasp_restart_seed(tmp_path: Path):
+    frames = read(TRAJ_FILE, index=":3")
+    jobs = tmp_path / "iter_000001" / "00.dft" / "jobs"
+    outcar = "...\n General timing and accounting informations for this job:\n"
+    _finished_job(jobs / "0001", frames[0], {"OUTCAR": outcar, "WAVECAR": "wave"})
+    _finished_job(jobs / "0002", frames[1], {"OUTCAR": "unfinished", "WAVECAR": "x"})
+    unconverged = " aborting loop EDIFF was not reached (unconverged)\n" + outcar
+    _finished_job(jobs / "0003", frames[2], {"OUTCAR": unconverged, "WAVECAR": "x"})
+    seeds = RestartSeeds("VASP", pattern=str(tmp_path / "iter_*/00.dft/jobs/*"))
+
+    atoms = frames[2].copy()
+    job_dir = tmp_path / "iter_000002" / "00.dft" / "jobs" / "0001"
+    calc = Vasp(directory=str(job_dir))
+    assert seeds.seed(atoms, calc, str(job_dir)) == str(jobs / "0001" / "WAVECAR")
+    assert len(seeds) == 1
+    assert (job_dir / "WAVECAR").read_text() == "wave"
+    assert (job_dir / "candidate.vasp").exists()
+    assert calc.int_params["istart"] == 1 and calc.int_params["icharg"] == 0
+
+    # too far from every finished job
+    seeds.max_rmsd = 1e-6
+    assert seeds.nearest(atoms)[0] is None
+
+
+def test_cp2k_restart_seed(tmp_path: Path):
+    atoms = read(TRAJ_FILE, index=0)
+    jobs = tmp_path / "iter_000001" / "00.dft" / "jobs"
+    _finished_job(jobs / "0001", atoms, {"job-RESTART.wfn": "wfn"})
+    unconverged = " SCF WAVEFUNCTION OPTIMIZATION\n *** SCF run NOT converged ***\n"
+    _finished_job(
+        jobs / "0002", atoms, {"job-RESTART.wfn": "bad", "job.out": unconverged}
+    )
+    seeds = RestartSeeds("CP2K", pattern=str(tmp_path / "iter_*/00.dft/jobs/*"))
+
+    job_dir = tmp_path / "iter_000002" / "00.dft" / "jobs" / "0001"
+    calc = _CP2KInput(str(job_dir / "job"), "&FORCE_EVAL\n&END FORCE_EVAL\n")
+    assert seeds.seed(atoms, calc, str(job_dir)) is not None
+    assert (job_dir / "job-RESTART.wfn").read_text() == "wfn"
+    assert len(seeds) == 1
+    assert "SCF_GUESS RESTART" in calc.parameters.inp
+    assert "WFN_RESTART_FILE_NAME" in calc.parameters.inp
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import time
+from pathlib import Path
+
+import pytest
+from sparc.src.scheduler import (
+    DONE,
+    FAILED,
+    LocalBackend,
+    SlurmBackend,
+    get_backend,
+)
+
+
+def _wait(backend, job_id, timeout=10.0):
+    start = time.time()
+    while time.time() - start < timeout:
+        state = backend.poll(job_id)
+        if state in (DONE, FAILED):
+            return state
+        time.sleep(0.05)
+    raise TimeoutError(job_id)
+
+
+def test_local_backend(tmp_path: Path):
+    backend = get_backend({"backend": "local"})
+    assert isinstance(backend, LocalBackend)
+
+    ok, bad, slow = (tmp_path / name for name in ("ok", "bad", "slow"))
+    for job_dir in (ok, bad, slow):
+        job_dir.mkdir()
+
+    job_ok = backend.submit(ok, "echo labelled > OUTCAR")
+    job_bad = backend.submit(bad, "exit 3")
+    job_slow = backend.submit(slow, "sleep 30")
+
+    assert _wait(backend, job_ok) == DONE
+    assert Path(backend.collect(job_ok), "OUTCAR").read_text() == "labelled\n"
+    assert _wait(backend, job_bad) == FAILED
+    with pytest.raises(RuntimeError):
+        backend.collect(job_bad)
+
+    backend.cancel(job_slow)
+    assert backend.poll(job_slow) == FAILED
+
+
+def test_slurm_backend_templates(tmp_path: Path):
+    # stand-ins: "sbatch" runs the script at once, "squeue" reports nothing queued
+    backend = SlurmBackend(
+        header="#SBATCH --job-name={job_name}",
+        submit_command="bash {script} > /dev/null; echo '4242;cluster'",
+        status_command="true",
+        cancel_command="true",
+    )
+    job_id = backend.submit(tmp_path, "echo done > OUTCAR", job_name="sparc_0001")
+
+    assert job_id == "4242"
+    assert "#SBATCH --job-name=sparc_0001" in (tmp_path / "sparc_job.sh").read_text()
+    assert backend.poll(job_id) == DONE
+    assert Path(backend.collect(job_id), "OUTCAR").exists()
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import multiprocessing as mp
+import sqlite3
+from pathlib import Path
+
+from ase.calculators.lj import LennardJones
+from ase.io import read, write
+from sparc.src import dft_labelling
+from sparc.src.dft_labelling import label_candidates
+from sparc.src.utils.utils import restart_progress
+from sparc.src.work_queue import QUEUE_FILE, WorkQueue
+
+TRAJ_FILE = Path(__file__).resolve().parent / "data" / "mlp" / "AseMD.traj"
+
+
+def _drain(filename):
+    queue = WorkQueue(filename)
+    claimed = []
+    while (idx := queue.claim()) is not None:
+        claimed.append(idx)
+        queue.finish(idx, f"result_{idx}")
+    return claimed
+
+
+def test_work_queue_states(tmp_path: Path):
+    frames = read(TRAJ_FILE, index=":3")
+    queue = WorkQueue(tmp_path / QUEUE_FILE)
+    for idx, atoms in enumerate(frames, start=1):
+        queue.add(idx, atoms, source=f"POSCAR_{idx}")
+
+    assert queue.claim() == 1
+    queue.finish(1, "result_1")
+    assert queue.claim() == 2
+    queue.fail(2, "SCF did not converge")
+    assert queue.claim() == 3  # left running by a crash
+
+    queue = WorkQueue(tmp_path / QUEUE_FILE)
+    assert queue.recover() == 1
+    assert queue.counts() == {"done": 1, "failed": 1, "pending": 1}
+    assert queue.done() == {1: "result_1"}
+    assert queue.failed() == {2: "SCF did not converge"}
+
+    # Registering again keeps the state, a changed structure is computed again
+    queue.add(1, frames[0])
+    queue.add(2, frames[0])
+    assert queue.pending() == [2, 3]
+    assert queue.entries([3])[3]["attempts"] == 1
+
+
+def test_work_queue_claims_once(tmp_path: Path):
+    filename = str(tmp_path / QUEUE_FILE)
+    queue = WorkQueue(filename)
+    atoms = read(TRAJ_FILE, index=0)
+    for idx in range(40):
+        atoms.positions[0, 0] += 0.01
+        queue.add(idx, atoms)
+
+    with mp.Pool(4) as pool:
+        claimed = pool.map(_drain, [filename] * 4)
+    assert sorted(idx for part in claimed for idx in part) == list(range(40))
+
+
+class _CountingLJ(LennardJones):
+    calls = 0
+
+    def calculate(self, *args, **kwargs):
+        _CountingLJ.calls += 1
+        super().calculate(*args, **kwargs)
+
+
+def test_label_candidates_restart(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(dft_labelling, "dft_calculator", lambda *args: _CountingLJ())
+
+    labelled_files = []
+    for serial, atoms in enumerate(read(TRAJ_FILE, index=":4"), start=1):
+        poscar = tmp_path / f"POSCAR_{serial}"
+        write(poscar, atoms, format="vasp")
+        labelled_files.append(str(poscar))
+    config = {"dft_calculator": {"name": "VASP"}, "labelling": {"workers": 1}}
+
+    def run():
+        return label_candidates(
+            config,
+            labelled_files,
+            dir_name=tmp_path,
+            log_filename="aimd.log",
+            trajfile="AseMD.traj",
+        )
+
+    assert run() == 4
+    calls = _CountingLJ.calls
+
+    # A crash left candidate 3 running: only that one is computed again
+    with sqlite3.connect(tmp_path / QUEUE_FILE) as conn:
+        conn.execute("UPDATE candidates SET state = 'running' WHERE idx = 3")
+    assert run() == 4
+    assert 0 < _CountingLJ.calls - calls <= 2  # energy and forces
+
+    # Every candidate is written to the dataset once
+    assert len(read(tmp_path / "AseMD.traj", index=":")) == 4
+
+
+def test_restart_progress(tmp_path: Path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    candidate_dir = Path("iter_000001") / "02.dpmd" / "dft_candidates"
+    for serial in range(1, 5):
+        (candidate_dir / f"{serial:04d}").mkdir(parents=True)
+    progress = {"iteration": 2, "candidate": 4, "idx": 3}
+
+    # Without a work queue labelling resumes from the stored index
+    _, start, candidates, found, files = restart_progress(progress)
+    assert (start, candidates, found) == (3, 4, True)
+    assert files == [str(candidate_dir / f"{i:04d}" / "POSCAR") for i in (3, 4)]
+
+    # With a work queue every candidate is returned, finished ones are skipped later
+    dft_dir = Path("iter_000002") / "00.dft"
+    dft_dir.mkdir(parents=True)
+    WorkQueue(dft_dir / QUEUE_FILE)
+    _, start, _, _, files = restart_progress(progress)
+    assert start == 1 and len(files) == 4